@@ -0,0 +1,175 @@
+import csv
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import Perfil
+from reagents import cadastros
+
+VERDADEIROS = {"1", "s", "sim", "true", "x"}
+
+
+def _gerar_hashes(senhas, processos):
+    """make_password de cada senha, repartido entre `processos` processos (PBKDF2 e so CPU)."""
+    if processos <= 1 or len(senhas) <= 1:
+        return [make_password(senha) for senha in senhas]
+    with ProcessPoolExecutor(max_workers=processos, initializer=django.setup) as executor:
+        return list(executor.map(make_password, senhas, chunksize=max(1, len(senhas) // (processos * 4))))
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria usuarios e perfis em lote a partir de um CSV com as colunas username, tipo "
+        "(admin/coord) e coordenacao (nome ou id); senha, email e staff sao opcionais. "
+        "As senhas sao geradas/hasheadas em paralelo e as linhas gravadas com bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="CSV de entrada (UTF-8, com cabecalho).")
+        parser.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="Processos para o hash.")
+        parser.add_argument("--lote", type=int, default=500, help="Linhas por bulk_create.")
+        parser.add_argument(
+            "--saida",
+            help="CSV (criado com permissao 600) onde gravar username,senha; obrigatorio se houver senha gerada.",
+        )
+
+    def _ler(self, caminho):
+        try:
+            with open(caminho, newline="", encoding="utf-8-sig") as arquivo:
+                linhas = list(csv.DictReader(arquivo))
+        except OSError as erro:
+            raise CommandError(f"Nao foi possivel ler {caminho}: {erro}")
+        if linhas and not {"username", "tipo", "coordenacao"} <= set(linhas[0]):
+            raise CommandError("O CSV precisa das colunas username, tipo e coordenacao.")
+        return linhas
+
+    def _validar(self, linhas):
+        coordenacoes = {}
+        for coordenacao in cadastros.coordenacoes.listar():
+            coordenacoes[str(coordenacao.pk)] = coordenacao
+            coordenacoes[coordenacao.nome.strip().lower()] = coordenacao
+
+        campo_username = User._meta.get_field("username")
+        nomes = [(linha.get("username") or "").strip() for linha in linhas]
+        existentes = set(User.objects.filter(username__in=nomes).values_list("username", flat=True))
+
+        validos, erros, vistos = [], [], set()
+        for numero, (username, linha) in enumerate(zip(nomes, linhas), start=2):
+            tipo = (linha.get("tipo") or "").strip().lower()
+            staff = (linha.get("staff") or "").strip().lower() in VERDADEIROS
+            nome_coordenacao = (linha.get("coordenacao") or "").strip()
+            senha = linha.get("senha") or ""
+
+            if not username:
+                erros.append(f"linha {numero}: username vazio")
+                continue
+            # bulk_create nao chama full_clean: caracteres e max_length conferidos aqui.
+            try:
+                campo_username.run_validators(username)
+            except ValidationError as erro:
+                erros.append(f"linha {numero}: username {username!r} invalido ({' '.join(erro.messages)})")
+                continue
+            if username in existentes or username in vistos:
+                erros.append(f"linha {numero}: usuario {username} ja existe")
+                continue
+            if tipo not in ("admin", "coord"):
+                erros.append(f"linha {numero}: tipo invalido {tipo!r}")
+                continue
+            # Mesma regra de garantir_perfil_admin: staff e sempre admin sem coordenacao.
+            if staff:
+                tipo = "admin"
+            coordenacao = None
+            if tipo == "coord":
+                coordenacao = coordenacoes.get(nome_coordenacao.lower())
+                if coordenacao is None:
+                    erros.append(f"linha {numero}: coordenacao {nome_coordenacao!r} nao encontrada")
+                    continue
+            if senha:
+                try:
+                    password_validation.validate_password(senha, User(username=username))
+                except ValidationError as erro:
+                    erros.append(f"linha {numero}: senha de {username} recusada ({' '.join(erro.messages)})")
+                    continue
+
+            vistos.add(username)
+            validos.append(
+                {
+                    "username": username,
+                    "email": (linha.get("email") or "").strip(),
+                    "staff": staff,
+                    "tipo": tipo,
+                    "coordenacao": coordenacao,
+                    "senha": senha,
+                    "gerada": not senha,
+                }
+            )
+        return validos, erros
+
+    def handle(self, *args, **options):
+        validos, erros = self._validar(self._ler(options["arquivo"]))
+        if erros:
+            raise CommandError("CSV com erros, nada foi gravado:\n" + "\n".join(erros))
+        if not validos:
+            self.stdout.write("Nenhum usuario no CSV.")
+            return
+
+        # As senhas geradas nunca vao para o stdout (logs, historico do terminal).
+        if any(item["gerada"] for item in validos) and not options["saida"]:
+            raise CommandError("Ha linhas sem senha: informe --saida para gravar as senhas geradas.")
+
+        for item in validos:
+            if item["gerada"]:
+                item["senha"] = secrets.token_urlsafe(12)
+        hashes = _gerar_hashes([item["senha"] for item in validos], options["processos"])
+
+        geradas = [(item["username"], item["senha"]) for item in validos if item["gerada"]]
+        if not geradas:
+            self._criar(validos, hashes, options["lote"])
+        else:
+            # Aberto antes do bulk_create: um caminho invalido nao deixa usuarios sem a senha anotada.
+            try:
+                descritor = os.open(options["saida"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            except OSError as erro:
+                raise CommandError(f"Nao foi possivel criar {options['saida']}: {erro}")
+            with open(descritor, "w", newline="", encoding="utf-8") as arquivo:
+                self._criar(validos, hashes, options["lote"])
+                escritor = csv.writer(arquivo)
+                escritor.writerow(["username", "senha"])
+                escritor.writerows(geradas)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(validos)} usuarios criados ({len(geradas)} com senha gerada).")
+        )
+
+    def _criar(self, validos, hashes, lote):
+        # bulk_create nao dispara post_save: o Perfil (inclusive o admin dos
+        # usuarios staff) e criado aqui, na mesma transacao.
+        with transaction.atomic():
+            usuarios = User.objects.bulk_create(
+                [
+                    User(username=item["username"], email=item["email"], is_staff=item["staff"], password=senha)
+                    for item, senha in zip(validos, hashes)
+                ],
+                batch_size=lote,
+            )
+            if any(usuario.pk is None for usuario in usuarios):
+                ids = dict(
+                    User.objects.filter(username__in=[u.username for u in usuarios]).values_list("username", "pk")
+                )
+                for usuario in usuarios:
+                    usuario.pk = ids[usuario.username]
+            Perfil.objects.bulk_create(
+                [
+                    Perfil(user_id=usuario.pk, tipo=item["tipo"], coordenacao=item["coordenacao"])
+                    for usuario, item in zip(usuarios, validos)
+                ],
+                batch_size=lote,
+            )
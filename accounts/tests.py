@@ -1,4 +1,9 @@
+import os
+import tempfile
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
 from django.db import IntegrityError
 from django.test import TestCase
 from django.urls import reverse
@@ -44,3 +49,77 @@ class LogoutTests(TestCase):
         self.assertEqual(response_post.status_code, 302)
         self.assertEqual(response_post.url, reverse("login"))
         self.assertNotIn("_auth_user_id", self.client.session)
+
+
+class ProvisionarUsuariosTests(TestCase):
+    def setUp(self):
+        self.coordenacao = Coordenacao.objects.create(nome="Coord A")
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+
+    def _csv(self, conteudo):
+        caminho = os.path.join(self.pasta, "usuarios.csv")
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def test_cria_usuarios_e_perfis_em_lote(self):
+        caminho = self._csv(
+            "username,tipo,coordenacao,senha,staff\n"
+            "ana,coord,coord a,SenhaForte!2024,\n"
+            "bruno,coord,%d,,\n"
+            "carla,admin,,SenhaForte!2024,\n"
+            "diego,coord,Coord A,,sim\n" % self.coordenacao.pk
+        )
+        saida = os.path.join(self.pasta, "senhas.csv")
+        out = StringIO()
+        call_command("provisionar_usuarios", caminho, processos=2, saida=saida, stdout=out)
+        self.assertIn("4 usuarios criados (2 com senha gerada).", out.getvalue())
+
+        perfis = {p.user.username: (p.tipo, p.coordenacao_id) for p in Perfil.objects.select_related("user")}
+        self.assertEqual(
+            perfis,
+            {
+                "ana": ("coord", self.coordenacao.pk),
+                "bruno": ("coord", self.coordenacao.pk),
+                "carla": ("admin", None),
+                "diego": ("admin", None),
+            },
+        )
+        self.assertTrue(User.objects.get(username="diego").is_staff)
+        self.assertTrue(User.objects.get(username="ana").check_password("SenhaForte!2024"))
+        with open(saida, encoding="utf-8") as arquivo:
+            geradas = dict(linha.strip().split(",") for linha in arquivo.readlines()[1:])
+        self.assertEqual(set(geradas), {"bruno", "diego"})
+        self.assertTrue(User.objects.get(username="bruno").check_password(geradas["bruno"]))
+        self.assertEqual(os.stat(saida).st_mode & 0o777, 0o600)
+        self.assertNotIn(geradas["bruno"], out.getvalue())
+
+    def test_senha_gerada_exige_arquivo_de_saida(self):
+        caminho = self._csv("username,tipo,coordenacao\nbruno,admin,\n")
+        with self.assertRaises(CommandError) as contexto:
+            call_command("provisionar_usuarios", caminho, processos=1, stdout=StringIO())
+        self.assertIn("--saida", str(contexto.exception))
+        self.assertFalse(User.objects.exists())
+
+    def test_csv_com_erro_nao_grava_nada(self):
+        User.objects.create_user(username="ana", password="123456789")
+        caminho = self._csv(
+            "username,tipo,coordenacao\n"
+            "ana,coord,Coord A\n"
+            "bruno,coord,Coord Z\n"
+            "carla,gerente,\n"
+            "diego,coord,Coord A\n"
+            "eva maria,admin,\n"
+            "%s,admin,\n" % ("f" * 151)
+        )
+        with self.assertRaises(CommandError) as contexto:
+            call_command("provisionar_usuarios", caminho, processos=1, stdout=StringIO())
+        mensagem = str(contexto.exception)
+        self.assertIn("linha 2: usuario ana ja existe", mensagem)
+        self.assertIn("linha 3: coordenacao 'Coord Z' nao encontrada", mensagem)
+        self.assertIn("linha 4: tipo invalido 'gerente'", mensagem)
+        self.assertIn("linha 6: username 'eva maria' invalido", mensagem)
+        self.assertIn("linha 7: username '%s' invalido" % ("f" * 151), mensagem)
+        self.assertFalse(User.objects.filter(username="diego").exists())
@@ -7,6 +7,7 @@ from accounts.permissions import get_perfil
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
 from accounts.models import Perfil
+from reagents import cadastros
 from reagents.models import Coordenacao
 
 
@@ -16,8 +17,6 @@ def register_view(request):
     perfil = get_perfil(request.user)
     if perfil.tipo != "admin":
         raise PermissionDenied("Sem permissão.")
-    coordenacoes = Coordenacao.objects.all()
-
     if request.method == "POST":
         user_form = UserCreationForm(request.POST)
         tipo = request.POST.get("tipo")
@@ -64,7 +63,7 @@ def register_view(request):
 
     return render(request, "register.html", {
         "user_form": user_form,
-        "coordenacoes": coordenacoes
+        "coordenacoes": cadastros.coordenacoes.listar()
     })
     
 def login_view(request):
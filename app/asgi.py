@@ -13,4 +13,6 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+from app.estaticos import EstaticosASGI  # noqa: E402
+
+application = EstaticosASGI(get_asgi_application())
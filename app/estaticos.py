@@ -0,0 +1,172 @@
+"""
+Arquivos estaticos com hash no nome, pre-comprimidos e servidos com cache longo.
+
+`collectstatic` (ArmazenamentoEstatico) grava os nomes com hash do conteudo
+e, ao lado de cada arquivo de texto, as versoes .gz e .br (brotli e
+opcional). Os wrappers WSGI/ASGI atendem STATIC_URL direto de STATIC_ROOT
+antes do Django, escolhendo a variante pelo Accept-Encoding; arquivos com
+hash recebem Cache-Control imutavel de um ano.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from functools import cached_property
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli e opcional
+    brotli = None
+
+EXTENSOES_COMPRIMIVEIS = (".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml")
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "public, max-age=0, must-revalidate"
+TAMANHO_BLOCO = 64 * 1024
+
+
+def _comprimir(caminho):
+    with open(caminho, "rb") as arquivo:
+        conteudo = arquivo.read()
+    variantes = [(".gz", gzip.compress(conteudo, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variantes.append((".br", brotli.compress(conteudo)))
+    for sufixo, comprimido in variantes:
+        if len(comprimido) < len(conteudo):
+            with open(caminho + sufixo, "wb") as destino:
+                destino.write(comprimido)
+
+
+class ArmazenamentoEstatico(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for nome in set(self.hashed_files.values()):
+            if nome.endswith(EXTENSOES_COMPRIMIVEIS):
+                _comprimir(self.path(nome))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Sem collectstatic (desenvolvimento, testes) usa o nome original.
+            return name
+
+
+class ArquivosEstaticos:
+    """Resolve um caminho de STATIC_URL para o arquivo e os cabecalhos da resposta."""
+
+    def __init__(self, raiz, prefixo):
+        self.raiz = os.path.realpath(raiz) if raiz else None
+        self.prefixo = "/" + prefixo.strip("/") + "/"
+
+    @cached_property
+    def imutaveis(self):
+        try:
+            with open(os.path.join(self.raiz, "staticfiles.json"), encoding="utf-8") as arquivo:
+                return set(json.load(arquivo).get("paths", {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def resolver(self, caminho, accept_encoding="", if_none_match=""):
+        """(status, caminho_do_arquivo, cabecalhos) ou None se nao for um estatico existente."""
+        if not self.raiz or not caminho.startswith(self.prefixo):
+            return None
+        nome = caminho[len(self.prefixo):]
+        arquivo = os.path.realpath(os.path.join(self.raiz, nome))
+        if not arquivo.startswith(self.raiz + os.sep) or not os.path.isfile(arquivo):
+            return None
+
+        tipo, _ = mimetypes.guess_type(arquivo)
+        cabecalhos = [
+            ("Content-Type", tipo or "application/octet-stream"),
+            ("Cache-Control", CACHE_IMUTAVEL if nome in self.imutaveis else CACHE_REVALIDAR),
+            ("Vary", "Accept-Encoding"),
+        ]
+        aceitas = {parte.split(";")[0].strip() for parte in accept_encoding.split(",")}
+        for codificacao, sufixo in (("br", ".br"), ("gzip", ".gz")):
+            if codificacao in aceitas and os.path.isfile(arquivo + sufixo):
+                arquivo += sufixo
+                cabecalhos.append(("Content-Encoding", codificacao))
+                break
+
+        estado = os.stat(arquivo)
+        etag = '"%s"' % hashlib.md5(f"{arquivo}:{estado.st_mtime_ns}:{estado.st_size}".encode()).hexdigest()
+        cabecalhos.append(("ETag", etag))
+        if etag in if_none_match:
+            return 304, None, [c for c in cabecalhos if c[0] in ("Cache-Control", "Vary", "ETag")]
+        cabecalhos.append(("Content-Length", str(estado.st_size)))
+        return 200, arquivo, cabecalhos
+
+    @classmethod
+    def de_settings(cls):
+        return cls(settings.STATIC_ROOT, settings.STATIC_URL)
+
+
+class EstaticosWSGI:
+    def __init__(self, application, arquivos=None):
+        self.application = application
+        self.arquivos = arquivos or ArquivosEstaticos.de_settings()
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            resposta = self.arquivos.resolver(
+                environ.get("PATH_INFO", ""),
+                environ.get("HTTP_ACCEPT_ENCODING", ""),
+                environ.get("HTTP_IF_NONE_MATCH", ""),
+            )
+            if resposta:
+                status, arquivo, cabecalhos = resposta
+                start_response("304 Not Modified" if status == 304 else "200 OK", cabecalhos)
+                if arquivo is None or environ["REQUEST_METHOD"] == "HEAD":
+                    return []
+                conteudo = open(arquivo, "rb")
+                wrapper = environ.get("wsgi.file_wrapper")
+                if wrapper:
+                    return wrapper(conteudo, TAMANHO_BLOCO)
+                return _ler_blocos(conteudo)
+        return self.application(environ, start_response)
+
+
+def _ler_blocos(conteudo):
+    with conteudo:
+        while bloco := conteudo.read(TAMANHO_BLOCO):
+            yield bloco
+
+
+class EstaticosASGI:
+    def __init__(self, application, arquivos=None):
+        self.application = application
+        self.arquivos = arquivos or ArquivosEstaticos.de_settings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            cabecalhos = {nome.decode("latin-1").lower(): valor.decode("latin-1") for nome, valor in scope["headers"]}
+            resposta = self.arquivos.resolver(
+                scope["path"], cabecalhos.get("accept-encoding", ""), cabecalhos.get("if-none-match", "")
+            )
+            if resposta:
+                status, arquivo, cabecalhos = resposta
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": status,
+                        "headers": [(n.lower().encode("latin-1"), v.encode("latin-1")) for n, v in cabecalhos],
+                    }
+                )
+                if arquivo is None or scope["method"] == "HEAD":
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                with open(arquivo, "rb") as conteudo:
+                    while True:
+                        bloco = await asyncio.to_thread(conteudo.read, TAMANHO_BLOCO)
+                        proximo = len(bloco) == TAMANHO_BLOCO
+                        await send({"type": "http.response.body", "body": bloco, "more_body": proximo})
+                        if not proximo:
+                            return
+        await self.application(scope, receive, send)
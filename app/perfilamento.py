@@ -0,0 +1,63 @@
+"""
+Perfilamento opcional de requisicoes com cProfile.
+
+Usuarios staff podem adicionar ?_perfil=1 a qualquer URL; alem disso uma
+fracao PERFILAMENTO_AMOSTRAGEM das requisicoes e perfilada. O resultado vai
+para reagents.CapturaPerfil e pode ser consultado no admin. Requisicoes nao
+perfiladas so pagam uma busca na query string e uma comparacao.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import time
+
+from django.conf import settings
+
+
+class PerfilamentoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.parametro = getattr(settings, "PERFILAMENTO_PARAMETRO", "_perfil")
+        self.amostragem = getattr(settings, "PERFILAMENTO_AMOSTRAGEM", 0.0)
+        self.maximo = getattr(settings, "PERFILAMENTO_MAXIMO", 200)
+
+    def __call__(self, request):
+        if self.parametro in request.META.get("QUERY_STRING", ""):
+            if not request.user.is_staff:
+                return self.get_response(request)
+        elif not (self.amostragem and random.random() < self.amostragem):
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            perfil.disable()
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        self._salvar(request, perfil, duracao_ms)
+        return response
+
+    def _salvar(self, request, perfil, duracao_ms):
+        from reagents.models import CapturaPerfil
+
+        saida = io.StringIO()
+        stats = pstats.Stats(perfil, stream=saida)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+
+        match = getattr(request, "resolver_match", None)
+        CapturaPerfil.objects.create(
+            view_nome=(match.view_name if match else "") or request.path,
+            caminho=request.get_full_path()[:500],
+            usuario=request.user.get_username() if request.user.is_authenticated else "",
+            duracao_ms=duracao_ms,
+            top_funcoes=saida.getvalue(),
+            dados=marshal.dumps(stats.stats),
+        )
+
+        antigos = CapturaPerfil.objects.values_list("pk", flat=True)[self.maximo:]
+        CapturaPerfil.objects.filter(pk__in=list(antigos)).delete()
@@ -0,0 +1,91 @@
+"""
+Roteamento de leituras para a replica.
+
+Views decoradas com @leitura_replica fazem suas consultas no alias
+REPLICA_DATABASE (quando ele existe em DATABASES). Todo o resto, incluindo
+escritas, leituras dentro de transaction.atomic() e leituras logo apos uma
+escrita do proprio usuario (cookie de janela "read-your-writes"), fica no
+banco principal.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE_ESCRITA = "escrita_recente"
+
+_usar_replica = ContextVar("usar_replica", default=False)
+_escreveu = ContextVar("escreveu", default=None)
+
+
+def _alias_replica():
+    alias = getattr(settings, "REPLICA_DATABASE", "replica")
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def usar_replica():
+    token = _usar_replica.set(True)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+def leitura_replica(view):
+    """Envia as leituras de uma view somente-leitura para a replica."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or COOKIE_ESCRITA in request.COOKIES:
+            return view(request, *args, **kwargs)
+        with usar_replica():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _usar_replica.get() or model._meta.app_label == "sessions":
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _alias_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Sessoes sao gravadas em toda requisicao autenticada e nao contam
+        # como escrita do usuario para a janela de leitura propria.
+        if model._meta.app_label != "sessions":
+            escreveu = _escreveu.get()
+            if escreveu is not None:
+                escreveu[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaMiddleware:
+    """Marca com um cookie curto os usuarios que acabaram de escrever no banco."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _escreveu.set([False])
+        try:
+            response = self.get_response(request)
+            if _escreveu.get()[0]:
+                response.set_cookie(
+                    COOKIE_ESCRITA,
+                    "1",
+                    max_age=getattr(settings, "REPLICA_JANELA_ESCRITA", 10),
+                    httponly=True,
+                    samesite="Lax",
+                )
+        finally:
+            _escreveu.reset(token)
+        return response
@@ -49,8 +49,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.perfilamento.PerfilamentoMiddleware',
+    'app.replica.ReplicaMiddleware',
 ]
 
+# Perfilamento com cProfile: staff adiciona ?_perfil=1 na URL; AMOSTRAGEM e a
+# fracao (0.0 a 1.0) de requisicoes perfiladas automaticamente.
+PERFILAMENTO_PARAMETRO = '_perfil'
+PERFILAMENTO_AMOSTRAGEM = 0.0
+PERFILAMENTO_MAXIMO = 200
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -75,13 +83,112 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# WAL deixa leitores e um escritor trabalharem ao mesmo tempo, o timeout faz
+# a conexao esperar o lock em vez de falhar com "database is locked" e o
+# BEGIN IMMEDIATE pega o lock de escrita no inicio de cada transaction.atomic()
+# (usada pelas views de escrita), evitando o deadlock de upgrade leitura->escrita.
+SQLITE_OPTIONS = {
+    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
 }
 
+# Perfil PostgreSQL: definindo POSTGRES_DB o banco principal passa a ser o
+# PostgreSQL (usado tambem pelo `manage.py estresse_saida`).
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', ''),
+        'PORT': os.environ.get('POSTGRES_PORT', ''),
+    }
+
+# Replica somente-leitura usada pelas views com @leitura_replica. Localmente
+# pode ser um segundo arquivo SQLite (atualizado com `manage.py sincronizar_replica`).
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'OPTIONS': SQLITE_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['app.replica.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# Segundos em que um usuario que acabou de escrever continua lendo do principal.
+REPLICA_JANELA_ESCRITA = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# As versoes (reagents.versao) ficam aqui, incrementadas com cache.incr: o
+# backend precisa ser compartilhado por todos os processos (workers do
+# gunicorn, `manage.py worker`) e ter incr atomico. Com REDIS_URL, o Redis;
+# sem ele, LocMemCache, que so serve para um processo (runserver). Cache em
+# arquivo ou em banco e recusado pelo check reagents.E001.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Quantidade de buscas (termo, escopo, periodo, versao) mantidas no LRU.
+BUSCA_CACHE_TAMANHO = 256
+
+# Painel: janela de "proximo do vencimento" (dias) e TTL do cache (segundos).
+PAINEL_DIAS_VENCIMENTO = 90
+PAINEL_CACHE_TTL = 60
+
+# Matriz reagente x coordenacao da tela de saida; invalidada pela versao dos
+# dados, o TTL so limita quanto tempo versoes antigas ocupam o cache.
+DISPONIBILIDADE_CACHE_TTL = 3600
+
+# Coordenacoes e controladores ficam em memoria em cada processo; a versao no
+# cache compartilhado invalida todos os processos e o TTL limita a idade maxima.
+CADASTROS_CACHE_TTL = 300
+
+# Segundos sem sinal de vida (progresso) apos os quais o worker retoma uma
+# tarefa de relatorio que ficou "executando" (worker derrubado no meio).
+RELATORIO_TIMEOUT = 600
+
+# Similaridade minima (Jaccard de trigramas) para apontar duplicata de reagente.
+SIMILARIDADE_LIMITE = 0.6
+
+# E-mail (alertas_validade). Sem configuracao o Django usa SMTP em localhost.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'almoxarifado@localhost')
+
+# Alertas de validade: faixas (dias) do resumo e destinatarios que recebem
+# o resumo de todas as coordenacoes, alem dos usuarios de cada coordenacao.
+ALERTAS_VALIDADE_FAIXAS = (30, 90)
+ALERTAS_VALIDADE_DESTINATARIOS = [
+    email for email in os.environ.get('ALERTAS_VALIDADE_DESTINATARIOS', '').split(',') if email
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -118,6 +225,33 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATICFILES_DIRS = [BASE_DIR / 'app' / 'static']
+
+# collectstatic grava nomes com hash e variantes .gz/.br; app.estaticos os
+# serve com cache imutavel (ver app/wsgi.py e app/asgi.py).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'app.estaticos.ArmazenamentoEstatico',
+    },
+}
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+# Uploads calculam o SHA-256 enquanto chegam (notas fiscais por conteudo).
+FILE_UPLOAD_HANDLERS = [
+    'reagents.armazenamento.MemoriaComHashUploadHandler',
+    'reagents.armazenamento.TemporarioComHashUploadHandler',
+]
+
+# MEDIA_ROOT nao e servido publicamente: notas fiscais passam pela view
+# nota_fiscal, que confere a permissao e entrega o arquivo ao servidor web.
+# NOTA_FISCAL_ENVIO: '' (FileResponse com Range), 'x-accel-redirect' (nginx,
+# com location internal em NOTA_FISCAL_PREFIXO_INTERNO apontando para
+# MEDIA_ROOT) ou 'x-sendfile' (Apache mod_xsendfile).
+NOTA_FISCAL_ENVIO = os.environ.get('NOTA_FISCAL_ENVIO', '')
+NOTA_FISCAL_PREFIXO_INTERNO = '/protegido/'
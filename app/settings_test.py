@@ -0,0 +1,17 @@
+"""
+Configuracoes usadas por `manage.py test`.
+"""
+from .settings import *  # noqa: F401,F403
+
+# Banco de teste em arquivo (WAL + timeout do settings): o estresse_saida abre
+# conexoes em varias threads, e o SQLite em memoria compartilhada responde
+# "database table is locked" na hora, sem esperar o timeout.
+DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Cache do proprio processo, mesmo com REDIS_URL no ambiente: os testes chamam
+# cache.clear() e nao podem apagar o cache de uma instalacao de verdade.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
@@ -16,10 +16,8 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from django.conf import settings
-from django.conf.urls.static import static
 from accounts.views import register_view, login_view, logout_view
-from reagents.views import registro_reagente, home, saida_reagente, gerar_relatorio, historico_saida
+from reagents.views import registro_reagente, home, saida_reagente, gerar_relatorio, baixar_relatorio, nota_fiscal, historico_saida, reposicao_estoque, estatisticas_busca, painel, painel_json
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,9 +25,15 @@ urlpatterns = [
     path('home/', home, name='home'),
     path('saida/', saida_reagente, name='saida_reagente'),
     path('historico/', historico_saida, name='historico_saida'),
+    path('painel/', painel, name='painel'),
+    path('painel.json', painel_json, name='painel_json'),
+    path('busca/estatisticas/', estatisticas_busca, name='estatisticas_busca'),
     path('entrada/', registro_reagente, name='registro_reagente'),
+    path('reagente/<int:pk>/nota-fiscal/', nota_fiscal, name='nota_fiscal'),
+    path('reposicao/', reposicao_estoque, name='reposicao_estoque'),
     path('registro/', register_view, name='register'),
     path('relatorio/', gerar_relatorio, name='gerar_relatorio'),
+    path('relatorio/<int:pk>/download/', baixar_relatorio, name='baixar_relatorio'),
     path('login/', login_view, name='login'),
     path('logout/', logout_view, name='logout'),
-]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
@@ -13,4 +13,6 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_wsgi_application()
+from app.estaticos import EstaticosWSGI  # noqa: E402
+
+application = EstaticosWSGI(get_wsgi_application())
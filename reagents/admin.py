@@ -1,11 +1,26 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AdminFileWidget
+from django.core.exceptions import PermissionDenied
+from django.db import models, transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .estoque import zerar_estoque
+
 from .models import (
+    CapturaPerfil,
     Coordenacao,
     Controlador,
+    EntradaReagente,
+    Lote,
     Reagente,
     ReagenteCoordenacao,
     SaidaReagente,
+    TarefaRelatorio,
 )
+from .versao import incrementar_versao
 
 # ======================
 # COORDENAÇÃO
@@ -13,6 +28,7 @@ from .models import (
 class CoordenacaoAdmin(admin.ModelAdmin):
     list_display = ('nome',)
     search_fields = ('nome',)
+    show_full_result_count = False
 
 
 # ======================
@@ -21,6 +37,7 @@ class CoordenacaoAdmin(admin.ModelAdmin):
 class ControladorAdmin(admin.ModelAdmin):
     list_display = ('nome',)
     search_fields = ('nome',)
+    show_full_result_count = False
 
 
 # ======================
@@ -40,15 +57,68 @@ class SaidaReagenteInline(admin.TabularInline):
     readonly_fields = ('data_saida',)
 
 
+# ======================
+# INLINE: LOTES POR VALIDADE
+# ======================
+# So leitura: os lotes seguem a quantidade do ReagenteCoordenacaoInline
+# (ajustar_lotes no post_save); um formset editavel salvo depois dele
+# desfaria o ajuste.
+class LoteInline(admin.TabularInline):
+    model = Lote
+    extra = 0
+    ordering = ('coordenacao', 'validade')
+    fields = readonly_fields = ('coordenacao', 'validade', 'quantidade')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+# ======================
+# INLINE: HISTÓRICO DE ENTRADA
+# ======================
+class EntradaReagenteInline(admin.TabularInline):
+    model = EntradaReagente
+    extra = 0
+    readonly_fields = ('data_entrada',)
+
+
+# ======================
+# NOTA FISCAL: LINK PELA VIEW PROTEGIDA
+# ======================
+class _LinkNotaFiscal:
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.url = reverse('nota_fiscal', args=[arquivo.instance.pk])
+
+    def __str__(self):
+        return str(self.arquivo)
+
+
+class NotaFiscalWidget(AdminFileWidget):
+    """As notas nao sao servidas em MEDIA_URL; o link "Atualmente" aponta para a view nota_fiscal."""
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        if context['widget']['is_initial']:
+            context['widget']['value'] = _LinkNotaFiscal(value)
+        return context
+
+
 # ======================
 # REAGENTE
 # ======================
 class ReagenteAdmin(admin.ModelAdmin):
+    formfield_overrides = {
+        models.FileField: {'widget': NotaFiscalWidget},
+    }
     list_display = (
         'reagente_nome',
         'controlador',
         'armario',
         'validade',
+        'quantidade_total',
+        'ultima_saida',
         'ativo',
     )
 
@@ -66,11 +136,96 @@ class ReagenteAdmin(admin.ModelAdmin):
     )
 
     ordering = ('reagente_nome',)
+    show_full_result_count = False
 
     inlines = [
         ReagenteCoordenacaoInline,
+        LoteInline,
+        EntradaReagenteInline,
         SaidaReagenteInline,
     ]
+    readonly_fields = ('quantidade_total', 'ultima_saida')
+    actions = ('desativar', 'reativar', 'zerar')
+
+    # As acoes usam um UPDATE para toda a selecao; sem post_save, a versao
+    # dos dados e invalidada aqui.
+    def _atualizar_ativo(self, request, queryset, ativo):
+        with transaction.atomic():
+            alterados = queryset.filter(ativo=not ativo).update(ativo=ativo)
+            transaction.on_commit(incrementar_versao)
+        self.message_user(request, f"{alterados} reagente(s) {'reativado(s)' if ativo else 'desativado(s)'}.")
+
+    @admin.action(description='Desativar reagentes selecionados')
+    def desativar(self, request, queryset):
+        self._atualizar_ativo(request, queryset, False)
+
+    @admin.action(description='Reativar reagentes selecionados')
+    def reativar(self, request, queryset):
+        self._atualizar_ativo(request, queryset, True)
+
+    @admin.action(description='Zerar estoque dos reagentes selecionados')
+    def zerar(self, request, queryset):
+        pares = zerar_estoque(queryset, requisitante=f"Ajuste ({request.user.get_username()})")
+        if pares:
+            self.message_user(request, f"Estoque zerado em {pares} par(es) reagente/coordenacao.")
+        else:
+            self.message_user(request, "Nenhum estoque a zerar.", messages.WARNING)
+
+
+# ======================
+# PERFILAMENTO
+# ======================
+class CapturaPerfilAdmin(admin.ModelAdmin):
+    list_display = ('view_nome', 'criado_em', 'duracao_ms', 'usuario', 'caminho')
+    list_filter = ('view_nome',)
+    search_fields = ('view_nome', 'caminho', 'usuario')
+    date_hierarchy = 'criado_em'
+    show_full_result_count = False
+    fields = ('view_nome', 'caminho', 'usuario', 'criado_em', 'duracao_ms', 'funcoes', 'arquivo')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Top funções (cumulativo)')
+    def funcoes(self, obj):
+        return format_html('<pre style="font-size:12px;overflow-x:auto">{}</pre>', obj.top_funcoes)
+
+    @admin.display(description='Arquivo pstats')
+    def arquivo(self, obj):
+        url = reverse('admin:reagents_capturaperfil_download', args=[obj.pk])
+        return format_html('<a href="{}">Baixar .prof</a>', url)
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download),
+                name='reagents_capturaperfil_download',
+            ),
+        ] + super().get_urls()
+
+    def download(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        captura = get_object_or_404(CapturaPerfil, pk=pk)
+        response = HttpResponse(bytes(captura.dados), content_type='application/octet-stream')
+        nome = f"{captura.view_nome}-{captura.criado_em:%Y%m%d%H%M%S}.prof"
+        response['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return response
+
+
+# ======================
+# RELATÓRIOS
+# ======================
+class TarefaRelatorioAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'solicitante', 'status', 'progresso', 'criado_em', 'concluido_em')
+    list_filter = ('status',)
+    readonly_fields = ('chave', 'parametros', 'arquivo', 'criado_em', 'iniciado_em', 'concluido_em', 'erro')
+    show_full_result_count = False
 
 
 # ======================
@@ -79,3 +234,5 @@ class ReagenteAdmin(admin.ModelAdmin):
 admin.site.register(Coordenacao, CoordenacaoAdmin)
 admin.site.register(Controlador, ControladorAdmin)
 admin.site.register(Reagente, ReagenteAdmin)
+admin.site.register(CapturaPerfil, CapturaPerfilAdmin)
+admin.site.register(TarefaRelatorio, TarefaRelatorioAdmin)
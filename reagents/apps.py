@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ReagentsConfig(AppConfig):
     name = 'reagents'
+
+    def ready(self):
+        import reagents.checks
+        import reagents.signals
@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils.deconstruct import deconstructible
+
+
+class _HashUploadMixin:
+    """Calcula o SHA-256 do upload enquanto os blocos chegam e o guarda em `arquivo.sha256`."""
+
+    def new_file(self, *args, **kwargs):
+        # Antes do super(): o handler de memoria encerra com StopFutureHandlers.
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        restante = super().receive_data_chunk(raw_data, start)
+        # None quer dizer que este handler ficou com o bloco.
+        if restante is None:
+            self.sha256.update(raw_data)
+        return restante
+
+    def file_complete(self, file_size):
+        arquivo = super().file_complete(file_size)
+        if arquivo is not None:
+            arquivo.sha256 = self.sha256.hexdigest()
+        return arquivo
+
+
+class MemoriaComHashUploadHandler(_HashUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class TemporarioComHashUploadHandler(_HashUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def sha256_do_arquivo(conteudo):
+    sha256 = getattr(conteudo, "sha256", None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for bloco in conteudo.chunks():
+        digest.update(bloco)
+    if hasattr(conteudo, "seek"):
+        conteudo.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ArmazenamentoPorConteudo(FileSystemStorage):
+    """Grava cada arquivo em <pasta>/<aa>/<sha256><ext>.
+
+    O mesmo conteudo enviado varias vezes (a mesma nota para varios
+    reagentes) ocupa um unico arquivo: se o caminho ja existe, nada e gravado.
+    """
+
+    def save(self, name, content, max_length=None):
+        if content is None:
+            return super().save(name, content, max_length=max_length)
+        pasta, nome = os.path.split(name)
+        sha256 = sha256_do_arquivo(content)
+        destino = os.path.join(pasta, sha256[:2], sha256 + os.path.splitext(nome)[1].lower()).replace("\\", "/")
+        if self.exists(destino):
+            return destino
+        return self._save(destino, content)
+
+
+notas_fiscais = ArmazenamentoPorConteudo()
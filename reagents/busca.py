@@ -0,0 +1,145 @@
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+from .models import DocumentoBusca, ReagenteCoordenacao, SaidaReagente
+
+LOTE_INDEXACAO = 2000
+
+
+class CacheBusca:
+    """Cache LRU limitado de IDs resultantes de uma busca.
+
+    As chaves devem incluir a versao dos dados (reagents.versao), entao uma
+    escrita invalida tudo sem precisar varrer o cache: as entradas antigas
+    simplesmente deixam de ser consultadas e saem pelo LRU.
+    """
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._lock = Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+
+        valor = calcular()
+
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "itens": len(self._itens),
+                "tamanho": self.tamanho,
+            }
+
+
+cache_busca = CacheBusca(getattr(settings, "BUSCA_CACHE_TAMANHO", 256))
+
+
+def normalizar_texto(value):
+    value = (value or "").strip().lower()
+    normalized = unicodedata.normalize("NFD", value)
+    return "".join(ch for ch in normalized if unicodedata.category(ch) != "Mn")
+
+
+def _texto(*partes):
+    return "\n".join(normalizar_texto(parte) for parte in partes if parte)
+
+
+def _documento_estoque(rc):
+    reagente = rc.reagente
+    return DocumentoBusca(
+        tipo=DocumentoBusca.TIPO_ESTOQUE,
+        objeto_id=rc.pk,
+        texto=_texto(reagente.reagente_nome, reagente.fispq, reagente.controlador.nome, rc.coordenacao.nome),
+        coordenacao_id=rc.coordenacao_id,
+        validade=reagente.validade,
+    )
+
+
+def _documento_saida(saida):
+    reagente = saida.reagente
+    return DocumentoBusca(
+        tipo=DocumentoBusca.TIPO_SAIDA,
+        objeto_id=saida.pk,
+        texto=_texto(
+            reagente.reagente_nome,
+            reagente.fispq,
+            reagente.controlador.nome,
+            saida.coordenacao.nome,
+            saida.requisitante,
+        ),
+        coordenacao_id=saida.coordenacao_id,
+        validade=reagente.validade,
+        data_saida=saida.data_saida,
+    )
+
+
+def _gravar(documentos):
+    DocumentoBusca.objects.bulk_create(
+        documentos,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["tipo", "objeto_id"],
+        update_fields=["texto", "coordenacao_id", "validade", "data_saida"],
+    )
+
+
+def _indexar(queryset, fabrica):
+    documentos = []
+    total = 0
+    for obj in queryset.select_related("reagente__controlador", "coordenacao").iterator(
+        chunk_size=LOTE_INDEXACAO
+    ):
+        documentos.append(fabrica(obj))
+        if len(documentos) >= LOTE_INDEXACAO:
+            _gravar(documentos)
+            total += len(documentos)
+            documentos = []
+    _gravar(documentos)
+    return total + len(documentos)
+
+
+def indexar_estoque(**filtros):
+    """(Re)gera os documentos dos ReagenteCoordenacao que casam com `filtros`."""
+    return _indexar(ReagenteCoordenacao.objects.filter(**filtros), _documento_estoque)
+
+
+def indexar_saidas(**filtros):
+    """(Re)gera os documentos das SaidaReagente que casam com `filtros`."""
+    return _indexar(SaidaReagente.objects.filter(**filtros), _documento_saida)
+
+
+def remover_documento(tipo, objeto_id):
+    DocumentoBusca.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+
+
+def ids_correspondentes(tipo, termo, **filtros):
+    """Subquery com os objeto_id cujo texto contem `termo` (ja normalizado)."""
+    return DocumentoBusca.objects.filter(tipo=tipo, texto__contains=termo, **filtros).values("objeto_id")
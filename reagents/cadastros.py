@@ -0,0 +1,103 @@
+"""
+Coordenacoes e controladores em memoria do processo.
+
+As tabelas sao pequenas e quase nunca mudam, mas aparecem em toda tela e em
+todo formulario. Cada processo guarda a lista e so a recarrega quando a
+versao_cadastros do cache compartilhado muda (signals de save/delete) ou
+quando passa CADASTROS_CACHE_TTL. Um pk que nao esta na lista e conferido
+no banco antes de ser recusado.
+"""
+import time
+from threading import Lock
+
+from django import forms
+from django.conf import settings
+from django.forms.models import ModelChoiceIterator
+
+from .models import Controlador, Coordenacao
+from .versao import versao_cadastros
+
+
+class TabelaEmCache:
+    def __init__(self, model):
+        self.model = model
+        self._estado = (None, float("-inf"), (), {})
+        self._lock = Lock()
+
+    def _vencido(self, versao):
+        estado_versao, carregado_em, _, _ = self._estado
+        return estado_versao != versao or time.monotonic() - carregado_em >= settings.CADASTROS_CACHE_TTL
+
+    def _carregar(self):
+        versao = versao_cadastros()
+        if self._vencido(versao):
+            with self._lock:
+                if self._vencido(versao):
+                    objetos = tuple(self.model.objects.order_by("pk"))
+                    self._estado = (versao, time.monotonic(), objetos, {obj.pk: obj for obj in objetos})
+        _, _, objetos, por_pk = self._estado
+        return objetos, por_pk
+
+    def listar(self):
+        return self._carregar()[0]
+
+    def obter(self, pk):
+        obj = self._carregar()[1].get(pk)
+        if obj is None:
+            # Pode ter sido criado por outro processo antes de a versao nova
+            # chegar aqui: confere no banco e recarrega a lista na proxima leitura.
+            obj = self.model.objects.filter(pk=pk).first()
+            if obj is not None:
+                self._estado = (None, float("-inf"), (), {})
+        return obj
+
+    def filtrar(self, pk):
+        """Lista com o objeto `pk` (ou vazia), no lugar de objects.filter(id=pk)."""
+        obj = self.obter(pk)
+        return (obj,) if obj is not None else ()
+
+    def nomes(self):
+        return {obj.pk: obj.nome for obj in self.listar()}
+
+
+coordenacoes = TabelaEmCache(Coordenacao)
+controladores = TabelaEmCache(Controlador)
+
+
+class _IteradorEmCache(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.tabela.listar():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.tabela.listar()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.tabela.listar())
+
+
+class CampoEmCache(forms.ModelChoiceField):
+    """ModelChoiceField que monta as opcoes e valida a escolha pela TabelaEmCache, sem consultas."""
+
+    iterator = _IteradorEmCache
+
+    def __init__(self, tabela, **kwargs):
+        self.tabela = tabela
+        super().__init__(queryset=tabela.model.objects.all(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.tabela.model):
+            value = value.pk
+        try:
+            obj = self.tabela.obter(int(value))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise forms.ValidationError(
+                self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value}
+            )
+        return obj
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core import checks
+
+# incr destes backends e get + set (ou nem guarda nada): dois processos que
+# gravam juntos podem gerar um unico incremento, e as versoes de
+# reagents.versao deixariam de invalidar os caches.
+CACHES_SEM_INCR_ATOMICO = (
+    "django.core.cache.backends.filebased.FileBasedCache",
+    "django.core.cache.backends.db.DatabaseCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@checks.register(checks.Tags.caches)
+def checar_cache_das_versoes(app_configs, **kwargs):
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend in CACHES_SEM_INCR_ATOMICO:
+        return [
+            checks.Error(
+                f"{backend} nao incrementa de forma atomica as versoes de reagents.versao.",
+                hint="Use Redis (REDIS_URL) com varios processos, ou LocMemCache com um processo so.",
+                id="reagents.E001",
+            )
+        ]
+    if backend == "django.core.cache.backends.locmem.LocMemCache" and not settings.DEBUG:
+        return [
+            checks.Warning(
+                "LocMemCache nao e compartilhado: com varios processos as invalidacoes nao chegam aos outros.",
+                hint="Defina REDIS_URL.",
+                id="reagents.W001",
+            )
+        ]
+    return []
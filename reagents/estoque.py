@@ -0,0 +1,360 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Max, OuterRef, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .busca import indexar_estoque, indexar_saidas
+from .models import EntradaReagente, Lote, Reagente, ReagenteCoordenacao, SaidaReagente
+from .versao import incrementar_versao, versao_dados
+
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+
+def _somar_quantidades(model, campos, totais):
+    """Soma `totais` ({chave: quantidade}) nas linhas de `model` identificadas por `campos`.
+
+    As linhas que faltam entram antes com quantidade 0 e ignore_conflicts: se
+    outra transacao gravou o mesmo par depois da leitura, a linha dela e usada
+    em vez de estourar a unique. Depois todas sao travadas e incrementadas com
+    F() num unico UPDATE. Deve rodar dentro de uma transacao.
+    """
+
+    def travar(chaves):
+        return {
+            tuple(getattr(obj, campo) for campo in campos): obj.pk
+            for obj in model.objects.select_for_update()
+            .filter(**{f"{campo}__in": {chave[i] for chave in chaves} for i, campo in enumerate(campos)})
+            .only("pk", *campos)
+        }
+
+    existentes = travar(totais)
+    atualizados = sum(1 for chave in totais if chave in existentes)
+
+    novos = [model(**dict(zip(campos, chave)), quantidade=0) for chave in totais if chave not in existentes]
+    if novos:
+        model.objects.bulk_create(novos, ignore_conflicts=True)
+        existentes.update(travar([chave for chave in totais if chave not in existentes]))
+
+    model.objects.filter(pk__in=[existentes[chave] for chave in totais]).update(
+        quantidade=F("quantidade")
+        + Case(
+            *[When(pk=existentes[chave], then=Value(qtd)) for chave, qtd in totais.items()],
+            output_field=PositiveIntegerField(),
+        )
+    )
+    return atualizados, novos
+
+
+def _somar_totais(totais_por_reagente):
+    """Soma {reagente_id: quantidade} em Reagente.quantidade_total num unico UPDATE com F()."""
+    if totais_por_reagente:
+        Reagente.objects.filter(pk__in=totais_por_reagente).update(
+            quantidade_total=F("quantidade_total")
+            + Case(
+                *[When(pk=pk, then=Value(qtd)) for pk, qtd in totais_por_reagente.items()],
+                output_field=PositiveIntegerField(),
+            )
+        )
+
+
+def recalcular_totais(reagentes):
+    """Regrava quantidade_total e ultima_saida de `reagentes` (queryset) a partir das tabelas de origem.
+
+    Um unico UPDATE com subconsultas; usado por registrar_saida, pelos signals
+    de ReagenteCoordenacao (save/delete fora de registrar_*), por reconciliar
+    e pelo comando recalcular_totais.
+    """
+    return reagentes.update(
+        quantidade_total=Coalesce(
+            Subquery(
+                ReagenteCoordenacao.objects.filter(reagente=OuterRef("pk"))
+                .values("reagente")
+                .annotate(total=Sum("quantidade"))
+                .values("total")
+            ),
+            Value(0),
+        ),
+        ultima_saida=Subquery(
+            SaidaReagente.objects.filter(reagente=OuterRef("pk"))
+            .values("reagente")
+            .annotate(ultima=Max("data_saida"))
+            .values("ultima")
+        ),
+    )
+
+
+def registrar_entradas(linhas, observacao=""):
+    """Aplica uma reposicao em lote.
+
+    `linhas` e uma sequencia de (reagente_id, coordenacao_id, quantidade) ou
+    (reagente_id, coordenacao_id, quantidade, validade). Sem validade, o lote
+    recebe a validade cadastrada no reagente. Cada linha vira uma
+    EntradaReagente; estoque e lotes sao atualizados numa unica transacao.
+    """
+    linhas = [tuple(linha) + (None,) * (4 - len(linha)) for linha in linhas]
+    linhas = [(int(r), int(c), int(q), v) for r, c, q, v in linhas]
+    for _, _, quantidade, _ in linhas:
+        if quantidade <= 0:
+            raise ValueError("Quantidade deve ser maior que zero.")
+
+    if not linhas:
+        return {"linhas": 0, "atualizados": 0, "criados": 0}
+
+    sem_validade = {r for r, _, _, v in linhas if v is None}
+    if sem_validade:
+        validades = dict(Reagente.objects.filter(pk__in=sem_validade).values_list("pk", "validade"))
+        linhas = [(r, c, q, v or validades.get(r)) for r, c, q, v in linhas]
+
+    totais = defaultdict(int)
+    totais_lote = defaultdict(int)
+    for reagente_id, coordenacao_id, quantidade, validade in linhas:
+        totais[(reagente_id, coordenacao_id)] += quantidade
+        totais_lote[(reagente_id, coordenacao_id, validade)] += quantidade
+
+    with transaction.atomic():
+        atualizados, criados = _somar_quantidades(
+            ReagenteCoordenacao, ("reagente_id", "coordenacao_id"), totais
+        )
+        _somar_quantidades(Lote, ("reagente_id", "coordenacao_id", "validade"), totais_lote)
+        totais_reagente = defaultdict(int)
+        for (reagente_id, _), quantidade in totais.items():
+            totais_reagente[reagente_id] += quantidade
+        _somar_totais(totais_reagente)
+        # bulk_create nao dispara post_save: indexa os estoques novos aqui.
+        if criados:
+            indexar_estoque(
+                reagente_id__in={rc.reagente_id for rc in criados},
+                coordenacao_id__in={rc.coordenacao_id for rc in criados},
+            )
+
+        EntradaReagente.objects.bulk_create(
+            [
+                EntradaReagente(
+                    reagente_id=r,
+                    coordenacao_id=c,
+                    quantidade=q,
+                    validade=v,
+                    observacao=observacao or None,
+                )
+                for r, c, q, v in linhas
+            ]
+        )
+        transaction.on_commit(incrementar_versao)
+
+    return {"linhas": len(linhas), "atualizados": atualizados, "criados": len(criados)}
+
+
+def registrar_estoque_inicial(reagente, linhas_coordenacao, observacao="Registro do reagente"):
+    """Grava os estoques iniciais de um reagente novo com as entradas e os lotes correspondentes.
+
+    `linhas_coordenacao` sao ReagenteCoordenacao ainda nao salvos (formset com
+    commit=False); tudo vai em bulk_create, sem passar pelos signals de
+    estoque gravado direto.
+    """
+    linhas_coordenacao = [rc for rc in linhas_coordenacao if rc.quantidade]
+    for rc in linhas_coordenacao:
+        rc.reagente = reagente
+    ReagenteCoordenacao.objects.bulk_create(linhas_coordenacao)
+    EntradaReagente.objects.bulk_create(
+        [
+            EntradaReagente(
+                reagente=reagente,
+                coordenacao_id=rc.coordenacao_id,
+                quantidade=rc.quantidade,
+                validade=reagente.validade,
+                observacao=observacao,
+            )
+            for rc in linhas_coordenacao
+        ]
+    )
+    Lote.objects.bulk_create(
+        [
+            Lote(
+                reagente=reagente,
+                coordenacao_id=rc.coordenacao_id,
+                validade=reagente.validade,
+                quantidade=rc.quantidade,
+            )
+            for rc in linhas_coordenacao
+        ]
+    )
+    _somar_totais({reagente.pk: sum(rc.quantidade for rc in linhas_coordenacao)})
+    indexar_estoque(reagente_id=reagente.pk)
+    transaction.on_commit(incrementar_versao)
+
+
+def ajustar_lotes(reagente_id, coordenacao_id, quantidade):
+    """Faz a soma dos lotes do par bater com `quantidade` (estoque gravado fora de registrar_*).
+
+    Falta em lote vira lote com a validade cadastrada no reagente; sobra e
+    retirada dos lotes que vencem primeiro. Deve rodar dentro de uma transacao.
+    """
+    em_lotes = (
+        Lote.objects.filter(reagente_id=reagente_id, coordenacao_id=coordenacao_id).aggregate(
+            total=Sum("quantidade")
+        )["total"]
+        or 0
+    )
+    diferenca = quantidade - em_lotes
+    if diferenca > 0:
+        validade = Reagente.objects.values_list("validade", flat=True).get(pk=reagente_id)
+        _somar_quantidades(
+            Lote, ("reagente_id", "coordenacao_id", "validade"), {(reagente_id, coordenacao_id, validade): diferenca}
+        )
+    elif diferenca < 0:
+        _consumir_lotes(reagente_id, coordenacao_id, -diferenca)
+    return diferenca
+
+
+def _consumir_lotes(reagente, coordenacao, quantidade):
+    """Retira `quantidade` dos lotes que vencem primeiro (FEFO).
+
+    Retorna a lista de (validade, quantidade retirada). Todos os lotes
+    alterados sao gravados num unico bulk_update. `reagente` e `coordenacao`
+    podem ser instancias ou ids.
+    """
+    lotes = Lote.objects.select_for_update().filter(
+        reagente=reagente,
+        coordenacao=coordenacao,
+        quantidade__gt=0,
+    ).order_by("validade", "pk")
+
+    restante = quantidade
+    alterados = []
+    alocacao = []
+    for lote in lotes:
+        if restante <= 0:
+            break
+        retirada = min(lote.quantidade, restante)
+        lote.quantidade -= retirada
+        restante -= retirada
+        alterados.append(lote)
+        alocacao.append((lote.validade, retirada))
+
+    Lote.objects.bulk_update(alterados, ["quantidade"])
+    return alocacao
+
+
+def _saida_repetida(chave_idempotencia):
+    saida = SaidaReagente.objects.filter(chave_idempotencia=chave_idempotencia).first()
+    if saida is not None:
+        saida.repetida = True
+        saida.lotes = []
+    return saida
+
+
+def registrar_saida(reagente, coordenacao, requisitante, quantidade, observacao="", chave_idempotencia=None):
+    """Registra uma saida travando o estoque do par e consumindo os lotes por FEFO.
+
+    Levanta ReagenteCoordenacao.DoesNotExist se o reagente nao existe na
+    coordenacao e EstoqueInsuficiente se a quantidade nao estiver disponivel.
+    Com `chave_idempotencia`, um reenvio devolve a saida original (com
+    `repetida=True`) sem tocar no estoque.
+    """
+    if chave_idempotencia:
+        repetida = _saida_repetida(chave_idempotencia)
+        if repetida is not None:
+            return repetida
+
+    try:
+        with transaction.atomic():
+            rc = ReagenteCoordenacao.objects.select_for_update().get(
+                reagente=reagente,
+                coordenacao=coordenacao,
+            )
+
+            if rc.quantidade < quantidade:
+                raise EstoqueInsuficiente("Quantidade insuficiente em estoque!")
+
+            saida = SaidaReagente.objects.create(
+                reagente=reagente,
+                coordenacao=coordenacao,
+                requisitante=requisitante,
+                quantidade=quantidade,
+                observacao=observacao,
+                chave_idempotencia=chave_idempotencia,
+            )
+
+            ReagenteCoordenacao.objects.filter(pk=rc.pk).update(quantidade=F("quantidade") - quantidade)
+            # Recalcula em vez de subtrair com F(): um total defasado (update()
+            # direto no estoque) nao pode barrar a saida no CHECK de quantidade_total.
+            recalcular_totais(Reagente.objects.filter(pk=rc.reagente_id))
+            saida.lotes = _consumir_lotes(reagente, coordenacao, quantidade)
+            if sum(retirada for _, retirada in saida.lotes) < quantidade:
+                # Estoque e lotes divergem: desfaz tudo em vez de baixar sem lote.
+                raise EstoqueInsuficiente(
+                    "Os lotes deste reagente nao cobrem a quantidade em estoque; rode reconciliar --corrigir."
+                )
+            transaction.on_commit(incrementar_versao)
+    except IntegrityError:
+        # Envio simultaneo com a mesma chave: o outro ja gravou a saida.
+        repetida = _saida_repetida(chave_idempotencia) if chave_idempotencia else None
+        if repetida is None:
+            raise
+        return repetida
+
+    saida.repetida = False
+    return saida
+
+
+def zerar_estoque(reagentes, requisitante, observacao="Ajuste: estoque zerado"):
+    """Zera o estoque de `reagentes` (queryset) em todas as coordenacoes.
+
+    Cada par com saldo vira uma SaidaReagente de ajuste (bulk_create), para
+    que entradas - saidas continue batendo; estoques, lotes e totais sao
+    zerados com um UPDATE por tabela. Retorna o numero de pares zerados.
+    """
+    with transaction.atomic():
+        estoques = list(
+            ReagenteCoordenacao.objects.select_for_update()
+            .filter(reagente__in=reagentes, quantidade__gt=0)
+            .values_list("pk", "reagente_id", "coordenacao_id", "quantidade")
+        )
+        if not estoques:
+            return 0
+
+        saidas = SaidaReagente.objects.bulk_create(
+            [
+                SaidaReagente(
+                    reagente_id=reagente_id,
+                    coordenacao_id=coordenacao_id,
+                    requisitante=requisitante,
+                    quantidade=quantidade,
+                    observacao=observacao,
+                )
+                for _, reagente_id, coordenacao_id, quantidade in estoques
+            ]
+        )
+        reagente_ids = {reagente_id for _, reagente_id, _, _ in estoques}
+        ReagenteCoordenacao.objects.filter(pk__in=[pk for pk, _, _, _ in estoques]).update(quantidade=0)
+        Lote.objects.filter(reagente_id__in=reagente_ids, quantidade__gt=0).update(quantidade=0)
+        Reagente.objects.filter(pk__in=reagente_ids).update(quantidade_total=0, ultima_saida=saidas[0].data_saida)
+        # bulk_create nao dispara post_save.
+        indexar_saidas(pk__in=[saida.pk for saida in saidas])
+        transaction.on_commit(incrementar_versao)
+    return len(estoques)
+
+
+def _montar_matriz():
+    matriz = defaultdict(dict)
+    for reagente_id, coordenacao_id, quantidade in ReagenteCoordenacao.objects.filter(
+        quantidade__gt=0, reagente__ativo=True
+    ).values_list("reagente_id", "coordenacao_id", "quantidade"):
+        matriz[str(reagente_id)][str(coordenacao_id)] = quantidade
+    return dict(matriz)
+
+
+def matriz_disponibilidade():
+    """{reagente_id: {coordenacao_id: quantidade}} dos estoques positivos de reagentes ativos.
+
+    Montada numa consulta e guardada no cache pela versao dos dados, entao
+    qualquer entrada ou saida confirmada gera uma matriz nova. As chaves sao
+    strings para casar com os valores dos <select> e com o JSON.
+    """
+    chave = f"disponibilidade:{versao_dados()}"
+    return cache.get_or_set(chave, _montar_matriz, settings.DISPONIBILIDADE_CACHE_TTL)
@@ -1,12 +1,20 @@
 from datetime import date
 
 from django import forms
-from django.forms import BaseInlineFormSet, ModelForm, inlineformset_factory
+from django.forms import BaseFormSet, BaseInlineFormSet, ModelForm, formset_factory, inlineformset_factory
 
-from .models import Coordenacao, Reagente, ReagenteCoordenacao
+from .cadastros import CampoEmCache, controladores, coordenacoes
+from .models import Reagente, ReagenteCoordenacao
+from .similaridade import indice_similaridade
 
 
 class ReagenteForm(ModelForm):
+    controlador = CampoEmCache(controladores)
+    # So aparece (como checkbox) quando clean() acha nomes parecidos.
+    confirmar_duplicata = forms.BooleanField(
+        required=False, label="Confirmo que nao e duplicata", widget=forms.HiddenInput
+    )
+
     class Meta:
         model = Reagente
         fields = ["reagente_nome", "fispq", "controlador", "armario", "validade", "nota_fiscal"]
@@ -43,8 +51,26 @@ class ReagenteForm(ModelForm):
             raise forms.ValidationError("Data de validade muito distante.")
         return validade
 
+    def clean(self):
+        cleaned_data = super().clean()
+        self.duplicatas_provaveis = []
+        nome = cleaned_data.get("reagente_nome")
+        if nome:
+            self.duplicatas_provaveis = indice_similaridade().similares(
+                nome, cleaned_data.get("fispq") or "", excluir=self.instance.pk
+            )
+        if self.duplicatas_provaveis and not cleaned_data.get("confirmar_duplicata"):
+            self.fields["confirmar_duplicata"].widget = forms.CheckboxInput()
+            nomes = ", ".join(nome for _, _, nome in self.duplicatas_provaveis[:5])
+            self.add_error(
+                "confirmar_duplicata",
+                f"Possivel duplicata de reagente ja cadastrado: {nomes}. Marque a confirmacao para registrar.",
+            )
+        return cleaned_data
+
 
 class ReagenteCoordenacaoForm(ModelForm):
+    coordenacao = CampoEmCache(coordenacoes)
     quantidade = forms.IntegerField(min_value=1, required=True)
 
     class Meta:
@@ -91,15 +117,15 @@ ReagenteCoordenacaoFormSet = inlineformset_factory(
 
 class SaidaReagenteForm(forms.Form):
     reagente = forms.ModelChoiceField(queryset=Reagente.objects.none(), required=True)
-    coordenacao = forms.ModelChoiceField(queryset=Coordenacao.objects.none(), required=True)
+    coordenacao = CampoEmCache(coordenacoes)
     requisitante = forms.CharField(max_length=200, required=True)
     quantidade = forms.IntegerField(min_value=1, required=True)
     observacao = forms.CharField(required=False)
+    chave_idempotencia = forms.UUIDField(widget=forms.HiddenInput)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["reagente"].queryset = Reagente.objects.all()
-        self.fields["coordenacao"].queryset = Coordenacao.objects.all()
+        self.fields["reagente"].queryset = Reagente.objects.filter(ativo=True)
 
     def clean_requisitante(self):
         requisitante = (self.cleaned_data.get("requisitante") or "").strip()
@@ -109,3 +135,53 @@ class SaidaReagenteForm(forms.Form):
 
     def clean_observacao(self):
         return (self.cleaned_data.get("observacao") or "").strip()
+
+
+class ReposicaoLinhaForm(forms.Form):
+    reagente = forms.ModelChoiceField(queryset=Reagente.objects.none(), required=True)
+    coordenacao = CampoEmCache(coordenacoes)
+    quantidade = forms.IntegerField(min_value=1, required=True)
+    validade = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["reagente"].queryset = Reagente.objects.filter(ativo=True)
+
+
+class BaseReposicaoFormSet(BaseFormSet):
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+
+        if not any(form.cleaned_data for form in self.forms):
+            raise forms.ValidationError("Adicione ao menos uma linha de reposicao.")
+
+    def linhas(self):
+        return [
+            (
+                form.cleaned_data["reagente"].id,
+                form.cleaned_data["coordenacao"].id,
+                form.cleaned_data["quantidade"],
+                form.cleaned_data["validade"] or form.cleaned_data["reagente"].validade,
+            )
+            for form in self.forms
+            if form.cleaned_data
+        ]
+
+
+ReposicaoFormSet = formset_factory(ReposicaoLinhaForm, formset=BaseReposicaoFormSet, extra=1)
+
+
+class RelatorioForm(forms.Form):
+    coordenacao = CampoEmCache(coordenacoes, required=False, empty_label="Todas as coordenacoes")
+    data_de = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    data_ate = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        data_de = cleaned_data.get("data_de")
+        data_ate = cleaned_data.get("data_ate")
+        if data_de and data_ate and data_de > data_ate:
+            raise forms.ValidationError("A data inicial deve ser anterior a data final.")
+        return cleaned_data
@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reagents.similaridade import indice_similaridade
+
+
+class _Conjuntos:
+    """Union-find com compressao de caminho."""
+
+    def __init__(self):
+        self.pai = {}
+
+    def raiz(self, x):
+        self.pai.setdefault(x, x)
+        while self.pai[x] != x:
+            self.pai[x] = self.pai[self.pai[x]]
+            x = self.pai[x]
+        return x
+
+    def unir(self, a, b):
+        ra, rb = self.raiz(a), self.raiz(b)
+        if ra != rb:
+            self.pai[max(ra, rb)] = min(ra, rb)
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrupa reagentes com nomes parecidos (trigramas) ou mesma FISPQ usando o indice "
+        "invertido, sem comparar todos os pares do catalogo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=float, default=None, help="Padrao: SIMILARIDADE_LIMITE.")
+        parser.add_argument(
+            "--frequencia-maxima",
+            type=int,
+            default=None,
+            help="Ignora trigramas presentes em mais reagentes que isso (padrao: 1%% do catalogo, minimo 50).",
+        )
+
+    def handle(self, *args, **options):
+        limite = options["limite"] if options["limite"] is not None else settings.SIMILARIDADE_LIMITE
+        indice = indice_similaridade()
+        frequencia_maxima = options["frequencia_maxima"] or max(50, len(indice) // 100)
+
+        conjuntos = _Conjuntos()
+        for pk, nome in indice.nomes.items():
+            for _, outro, _ in indice.similares(
+                nome, limite=limite, excluir=pk, frequencia_maxima=frequencia_maxima
+            ):
+                conjuntos.unir(pk, outro)
+        # FISPQ igual agrupa direto, sem passar pelos trigramas.
+        for pks in indice.por_fispq.values():
+            for outro in pks[1:]:
+                conjuntos.unir(pks[0], outro)
+
+        grupos = defaultdict(list)
+        for pk in conjuntos.pai:
+            grupos[conjuntos.raiz(pk)].append(pk)
+        grupos = sorted((sorted(pks) for pks in grupos.values() if len(pks) > 1), key=len, reverse=True)
+
+        for pks in grupos:
+            self.stdout.write(f"{len(pks)} reagentes:")
+            for pk in pks:
+                self.stdout.write(f"  [{pk}] {indice.nomes[pk]}")
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(grupos)} grupo(s) de possiveis duplicatas em {len(indice)} reagentes.")
+        )
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reagents.models import Lote
+
+
+def _faixa(validade, hoje, faixas):
+    if validade < hoje:
+        return "vencidos"
+    dias = (validade - hoje).days
+    return next(f"ate {limite} dias" for limite in faixas if dias <= limite)
+
+
+def _corpo(nome, hoje, grupos, faixas):
+    linhas = [f"Alertas de validade - {nome} ({hoje:%d/%m/%Y})", ""]
+    for titulo in ["vencidos"] + [f"ate {limite} dias" for limite in faixas]:
+        itens = grupos.get(titulo, [])
+        rotulo = "Vencidos" if titulo == "vencidos" else f"Vencem em {titulo}"
+        linhas.append(f"{rotulo} ({len(itens)}):")
+        for item in itens:
+            linhas.append(
+                f"  - {item['reagente__reagente_nome']} | armario {item['reagente__armario']} | "
+                f"validade {item['validade']:%d/%m/%Y} | {item['quantidade']} un."
+            )
+        linhas.append("")
+    return "\n".join(linhas)
+
+
+class Command(BaseCommand):
+    help = (
+        "Envia um resumo por coordenacao dos lotes vencidos e a vencer "
+        "(faixas de ALERTAS_VALIDADE_FAIXAS) numa unica conexao de e-mail."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data", type=date.fromisoformat, help="Data de referencia (AAAA-MM-DD). Padrao: hoje.")
+        parser.add_argument("--simular", action="store_true", help="Mostra os resumos sem enviar e-mails.")
+
+    def handle(self, *args, **options):
+        hoje = options["data"] or timezone.localdate()
+        faixas = sorted(settings.ALERTAS_VALIDADE_FAIXAS)
+        if not faixas:
+            raise CommandError("ALERTAS_VALIDADE_FAIXAS esta vazio.")
+
+        # Uma consulta pela faixa de validade (indice lote_validade_coord_idx),
+        # ja ordenada por coordenacao para agrupar em memoria.
+        lotes = (
+            Lote.objects.filter(
+                quantidade__gt=0,
+                validade__lte=hoje + timedelta(days=faixas[-1]),
+                reagente__ativo=True,
+            )
+            .order_by("coordenacao__nome", "coordenacao_id", "validade", "reagente__reagente_nome")
+            .values(
+                "coordenacao_id",
+                "coordenacao__nome",
+                "reagente__reagente_nome",
+                "reagente__armario",
+                "validade",
+                "quantidade",
+            )
+        )
+
+        resumos = []
+        for (coordenacao_id, nome), itens in groupby(
+            lotes.iterator(chunk_size=2000), key=lambda l: (l["coordenacao_id"], l["coordenacao__nome"])
+        ):
+            grupos = defaultdict(list)
+            for item in itens:
+                grupos[_faixa(item["validade"], hoje, faixas)].append(item)
+            resumos.append((coordenacao_id, nome, grupos))
+
+        if not resumos:
+            self.stdout.write("Nenhum lote vencido ou a vencer.")
+            return
+
+        destinatarios = defaultdict(list)
+        for coordenacao_id, email in (
+            User.objects.filter(
+                is_active=True,
+                perfil__tipo="coord",
+                perfil__coordenacao_id__in=[coordenacao_id for coordenacao_id, _, _ in resumos],
+            )
+            .exclude(email="")
+            .values_list("perfil__coordenacao_id", "email")
+        ):
+            destinatarios[coordenacao_id].append(email)
+
+        mensagens = []
+        for coordenacao_id, nome, grupos in resumos:
+            corpo = _corpo(nome, hoje, grupos, faixas)
+            para = destinatarios[coordenacao_id] + list(settings.ALERTAS_VALIDADE_DESTINATARIOS)
+            if options["simular"]:
+                self.stdout.write(corpo)
+                self.stdout.write(f"Para: {', '.join(para) or '(ninguem)'}\n")
+                continue
+            if not para:
+                self.stdout.write(self.style.WARNING(f"{nome}: sem destinatarios, resumo nao enviado."))
+                continue
+            vencidos = len(grupos.get("vencidos", []))
+            mensagens.append(
+                EmailMessage(
+                    subject=f"[Almoxarifado] Validade - {nome}: {vencidos} vencido(s)",
+                    body=corpo,
+                    to=para,
+                )
+            )
+
+        if options["simular"]:
+            return
+
+        enviadas = get_connection().send_messages(mensagens) if mensagens else 0
+        self.stdout.write(self.style.SUCCESS(f"{enviadas or 0} resumo(s) enviado(s)."))
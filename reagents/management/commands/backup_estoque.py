@@ -0,0 +1,114 @@
+import gzip
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from reagents.models import (
+    Controlador,
+    Coordenacao,
+    EntradaReagente,
+    Lote,
+    Reagente,
+    ReagenteCoordenacao,
+    SaidaReagente,
+)
+
+# Ordem de dependencia das FKs; o restore segue a mesma ordem.
+MODELOS_BACKUP = (
+    Coordenacao,
+    Controlador,
+    Reagente,
+    ReagenteCoordenacao,
+    Lote,
+    EntradaReagente,
+    SaidaReagente,
+)
+
+LOTE_LEITURA = 2000
+
+
+def arquivo_modelo(pasta, model):
+    return os.path.join(pasta, f"{model._meta.label_lower}.jsonl.gz")
+
+
+@contextmanager
+def leitura_consistente():
+    """Transacao so de leitura: todos os modelos saem do mesmo instante do banco.
+
+    No SQLite o atomic() usaria BEGIN IMMEDIATE (transaction_mode do settings)
+    e seguraria o lock de escrita durante todo o backup; um BEGIN DEFERRED so
+    le, e no WAL o snapshot vale do primeiro SELECT ate o fim.
+    """
+    if connection.in_atomic_block:
+        yield
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN DEFERRED")
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("ROLLBACK")
+    else:
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            yield
+
+
+def memoria_pico_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = "Exporta o inventario em JSON Lines comprimido (um arquivo .jsonl.gz por modelo), em streaming."
+
+    def add_arguments(self, parser):
+        parser.add_argument("destino", nargs="?", help="Pasta de destino (padrao: backup-<data>).")
+
+    def handle(self, *args, **options):
+        pasta = options["destino"] or f"backup-{timezone.localtime():%Y%m%d-%H%M%S}"
+        os.makedirs(pasta, exist_ok=True)
+
+        manifesto = {"criado_em": timezone.now().isoformat(), "modelos": {}}
+        inicio_total = time.monotonic()
+        with leitura_consistente():
+            total = self._exportar(pasta, manifesto)
+
+        with open(os.path.join(pasta, "manifesto.json"), "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, indent=2)
+
+        duracao = time.monotonic() - inicio_total
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backup em {pasta}: {total} linhas em {duracao:.2f}s "
+                f"({total / duracao if duracao else 0:.0f} linhas/s), memoria de pico {memoria_pico_mb():.1f} MB"
+            )
+        )
+
+    def _exportar(self, pasta, manifesto):
+        total = 0
+        for model in MODELOS_BACKUP:
+            inicio = time.monotonic()
+            linhas = 0
+            with gzip.open(arquivo_modelo(pasta, model), "wt", encoding="utf-8", compresslevel=6) as arquivo:
+                for row in model.objects.order_by("pk").values().iterator(chunk_size=LOTE_LEITURA):
+                    arquivo.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+                    arquivo.write("\n")
+                    linhas += 1
+            duracao = time.monotonic() - inicio
+            total += linhas
+            manifesto["modelos"][model._meta.label_lower] = linhas
+            self.stdout.write(
+                f"{model._meta.label_lower:<32} {linhas:>9} linhas  {duracao:6.2f}s  "
+                f"{linhas / duracao if duracao else 0:>10.0f} linhas/s"
+            )
+        return total
@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Perfil padrao do Django/sqlite3: journal em arquivo, BEGIN DEFERRED e 5s de timeout.
+PERFIS = {
+    "padrao": {"init_command": "", "timeout": 5, "transaction_mode": None},
+    "otimizado": settings.SQLITE_OPTIONS,
+}
+
+
+def _conectar(caminho, perfil):
+    conn = sqlite3.connect(caminho, timeout=perfil.get("timeout", 5), isolation_level=None)
+    for comando in (perfil.get("init_command") or "").split(";"):
+        if comando.strip():
+            conn.execute(comando)
+    return conn
+
+
+def _preparar(caminho, perfil, estoques):
+    conn = _conectar(caminho, perfil)
+    conn.executescript(
+        """
+        CREATE TABLE estoque (id INTEGER PRIMARY KEY, quantidade INTEGER NOT NULL);
+        CREATE TABLE saida (
+            id INTEGER PRIMARY KEY,
+            estoque_id INTEGER NOT NULL REFERENCES estoque (id),
+            quantidade INTEGER NOT NULL,
+            data REAL NOT NULL
+        );
+        CREATE INDEX saida_estoque_idx ON saida (estoque_id);
+        """
+    )
+    conn.executemany(
+        "INSERT INTO estoque (id, quantidade) VALUES (?, ?)",
+        [(i, 10**9) for i in range(1, estoques + 1)],
+    )
+    conn.close()
+
+
+def _trabalhador(args):
+    caminho, perfil, duracao, proporcao_escrita, estoques, semente = args
+    rnd = random.Random(semente)
+    conn = _conectar(caminho, perfil)
+    begin = f"BEGIN {perfil['transaction_mode']}" if perfil.get("transaction_mode") else "BEGIN"
+    resultado = {"leituras": 0, "escritas": 0, "erros": 0, "espera_escrita": 0.0, "espera_leitura": 0.0}
+
+    fim = time.monotonic() + duracao
+    while time.monotonic() < fim:
+        estoque_id = rnd.randint(1, estoques)
+        inicio = time.monotonic()
+        try:
+            if rnd.random() < proporcao_escrita:
+                # Mesmo formato da transacao de saida: le, grava a saida e atualiza o estoque.
+                conn.execute(begin)
+                try:
+                    (quantidade,) = conn.execute(
+                        "SELECT quantidade FROM estoque WHERE id = ?", (estoque_id,)
+                    ).fetchone()
+                    conn.execute(
+                        "INSERT INTO saida (estoque_id, quantidade, data) VALUES (?, 1, ?)",
+                        (estoque_id, time.time()),
+                    )
+                    conn.execute(
+                        "UPDATE estoque SET quantidade = ? WHERE id = ?", (quantidade - 1, estoque_id)
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                resultado["escritas"] += 1
+                resultado["espera_escrita"] += time.monotonic() - inicio
+            else:
+                conn.execute(
+                    "SELECT e.id, e.quantidade, COUNT(s.id), COALESCE(SUM(s.quantidade), 0) "
+                    "FROM estoque e LEFT JOIN saida s ON s.estoque_id = e.id "
+                    "WHERE e.id = ? GROUP BY e.id",
+                    (estoque_id,),
+                ).fetchall()
+                resultado["leituras"] += 1
+                resultado["espera_leitura"] += time.monotonic() - inicio
+        except sqlite3.OperationalError:
+            resultado["erros"] += 1
+
+    conn.close()
+    return resultado
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga multiprocesso de leituras/escritas concorrentes em um SQLite "
+        "temporario, comparando o perfil padrao com o perfil de SQLITE_OPTIONS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processos", type=int, default=8)
+        parser.add_argument("--duracao", type=float, default=5.0, help="Segundos por perfil.")
+        parser.add_argument("--escrita", type=float, default=0.3, help="Fracao de operacoes de escrita.")
+        parser.add_argument("--estoques", type=int, default=20)
+        parser.add_argument("--perfil", choices=sorted(PERFIS), action="append")
+
+    def handle(self, *args, **options):
+        perfis = options["perfil"] or ["padrao", "otimizado"]
+        self.stdout.write(
+            f"{'perfil':<10} {'leituras/s':>11} {'escritas/s':>11} {'erros':>7} "
+            f"{'taxa erro':>10} {'lat. leit.':>11} {'lat. escr.':>11}"
+        )
+
+        for nome in perfis:
+            perfil = PERFIS[nome]
+            with tempfile.TemporaryDirectory() as pasta:
+                caminho = os.path.join(pasta, "carga.sqlite3")
+                _preparar(caminho, perfil, options["estoques"])
+
+                tarefas = [
+                    (caminho, perfil, options["duracao"], options["escrita"], options["estoques"], i)
+                    for i in range(options["processos"])
+                ]
+                with multiprocessing.Pool(options["processos"]) as pool:
+                    resultados = pool.map(_trabalhador, tarefas)
+
+            total = {chave: sum(r[chave] for r in resultados) for chave in resultados[0]}
+            operacoes = total["leituras"] + total["escritas"] + total["erros"]
+            self.stdout.write(
+                f"{nome:<10} "
+                f"{total['leituras'] / options['duracao']:>11.1f} "
+                f"{total['escritas'] / options['duracao']:>11.1f} "
+                f"{total['erros']:>7} "
+                f"{(total['erros'] / operacoes if operacoes else 0):>10.2%} "
+                f"{(total['espera_leitura'] / total['leituras'] * 1000 if total['leituras'] else 0):>9.2f}ms "
+                f"{(total['espera_escrita'] / total['escritas'] * 1000 if total['escritas'] else 0):>9.2f}ms"
+            )
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reagents.models import Reagente
+from reagents.versao import incrementar_versao
+
+
+class Command(BaseCommand):
+    help = "Desativa reagentes ativos sem estoque (quantidade_total = 0) com validade vencida."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data", type=date.fromisoformat, help="Data de referencia (AAAA-MM-DD).")
+        parser.add_argument("--simular", action="store_true", help="So conta, sem desativar.")
+
+    def handle(self, *args, **options):
+        hoje = options["data"] or timezone.localdate()
+        # Coberto pelo indice parcial reagente_ativo_idx.
+        esgotados = Reagente.objects.filter(ativo=True, validade__lt=hoje, quantidade_total=0)
+        if options["simular"]:
+            self.stdout.write(f"{esgotados.count()} reagente(s) seriam desativados.")
+            return
+        desativados = esgotados.update(ativo=False)
+        if desativados:
+            incrementar_versao()
+        self.stdout.write(self.style.SUCCESS(f"{desativados} reagente(s) desativados."))
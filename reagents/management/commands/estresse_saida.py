@@ -0,0 +1,235 @@
+import threading
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import Perfil
+from reagents.estoque import registrar_entradas
+from reagents.models import (
+    Controlador,
+    Coordenacao,
+    DocumentoBusca,
+    EntradaReagente,
+    Lote,
+    Reagente,
+    ReagenteCoordenacao,
+    SaidaReagente,
+)
+
+NOME_ESTRESSE = "ESTRESSE"
+
+
+class _Coletor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resultados = {"ok": 0, "insuficiente": 0, "lock": 0, "erro": 0, "repetida": 0}
+        self.espera_lock = 0.0
+        self.latencias = []
+
+    def registrar_reenvio(self, resultado):
+        with self.lock:
+            self.resultados["repetida" if resultado == "repetida" else "erro"] += 1
+
+    def registrar(self, resultado, latencia, espera_lock):
+        with self.lock:
+            self.resultados[resultado] += 1
+            self.latencias.append(latencia)
+            self.espera_lock += espera_lock
+
+
+def _classificar(response):
+    if response.status_code >= 500:
+        erro = str(response.exc_info[1]).lower() if response.exc_info else ""
+        return "lock" if "lock" in erro else "erro"
+    texto = " ".join(str(m) for m in get_messages(response.wsgi_request)).lower()
+    if response.status_code == 302 and response.url == reverse("home"):
+        return "repetida" if "ja tinha sido registrada" in texto else "ok"
+    if "insuficiente" in texto:
+        return "insuficiente"
+    if "locked" in texto or "lock" in texto or "deadlock" in texto:
+        return "lock"
+    return "erro"
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispara saidas concorrentes (threads) pela view saida_reagente contra o mesmo "
+        "ReagenteCoordenacao e confere estoque final = inicial - soma das saidas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--saidas", type=int, default=25, help="Saidas por thread.")
+        parser.add_argument("--quantidade", type=int, default=1, help="Unidades por saida.")
+        parser.add_argument(
+            "--estoque-inicial",
+            type=int,
+            default=None,
+            help="Padrao: metade do total pedido, para exercitar tambem o caminho de estoque insuficiente.",
+        )
+        parser.add_argument("--manter", action="store_true", help="Nao remove os dados de teste ao final.")
+
+    def _preparar(self, estoque_inicial):
+        # Tudo com nome unico desta execucao e removido no final (salvo --manter).
+        nome = f"{NOME_ESTRESSE} {time.time_ns()}"
+        coordenacao = Coordenacao.objects.create(nome=nome)
+        controlador = Controlador.objects.create(nome=nome)
+        reagente = Reagente.objects.create(
+            reagente_nome=nome,
+            fispq=NOME_ESTRESSE,
+            controlador=controlador,
+            armario=NOME_ESTRESSE,
+            validade=date(date.today().year + 1, 1, 1),
+        )
+        registrar_entradas([(reagente.pk, coordenacao.pk, estoque_inicial)], observacao=NOME_ESTRESSE)
+        # Sem is_staff e sem senha utilizavel: so entra pelo force_login das threads.
+        usuario = User(username=nome.lower().replace(" ", "-"), is_staff=False)
+        usuario.set_unusable_password()
+        usuario.save()
+        Perfil.objects.create(user=usuario, tipo="admin", coordenacao=None)
+        return reagente, coordenacao, usuario
+
+    def _limpar(self, reagente, coordenacao, usuario):
+        filtros = {"reagente": reagente, "coordenacao": coordenacao}
+        saidas = list(SaidaReagente.objects.filter(**filtros).values_list("pk", flat=True))
+        DocumentoBusca.objects.filter(tipo=DocumentoBusca.TIPO_SAIDA, objeto_id__in=saidas).delete()
+        SaidaReagente.objects.filter(pk__in=saidas).delete()
+        EntradaReagente.objects.filter(**filtros).delete()
+        controlador = reagente.controlador
+        reagente.delete()
+        controlador.delete()
+        coordenacao.delete()
+        usuario.delete()
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        por_thread = options["saidas"]
+        quantidade = options["quantidade"]
+        estoque_inicial = options["estoque_inicial"]
+        if estoque_inicial is None:
+            estoque_inicial = max(1, threads * por_thread * quantidade // 2)
+
+        reagente, coordenacao, usuario = self._preparar(estoque_inicial)
+        try:
+            consistente = self._executar(
+                reagente, coordenacao, usuario, threads, por_thread, quantidade, estoque_inicial
+            )
+        finally:
+            if not options["manter"]:
+                self._limpar(reagente, coordenacao, usuario)
+
+        if consistente:
+            self.stdout.write(self.style.SUCCESS("Invariante OK"))
+        else:
+            self.stdout.write(self.style.ERROR("Invariante VIOLADA"))
+            raise SystemExit(1)
+
+    def _executar(self, reagente, coordenacao, usuario, threads, por_thread, quantidade, estoque_inicial):
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*",) and not h.startswith(".")), "localhost")
+        coletor = _Coletor()
+        barreira = threading.Barrier(threads)
+        # Login antes das threads: uma falha aqui nao deixa as outras presas na barreira.
+        # Erro do banco vira resposta 500 classificada, sem derrubar a thread.
+        clientes = [Client(HTTP_HOST=host, raise_request_exception=False) for _ in range(threads)]
+        for client in clientes:
+            client.force_login(usuario)
+
+        def trabalhador(indice):
+            espera = [0.0]
+
+            def medir_lock(execute, sql, params, many, context):
+                # SQLite espera o lock no BEGIN IMMEDIATE; PostgreSQL no SELECT ... FOR UPDATE.
+                if sql.startswith("BEGIN") or "FOR UPDATE" in sql:
+                    inicio = time.monotonic()
+                    try:
+                        return execute(sql, params, many, context)
+                    finally:
+                        espera[0] += time.monotonic() - inicio
+                return execute(sql, params, many, context)
+
+            client = clientes[indice]
+            barreira.wait()
+            try:
+                with connection.execute_wrapper(medir_lock):
+                    ultima_ok = None
+                    for n in range(por_thread):
+                        espera[0] = 0.0
+                        inicio = time.monotonic()
+                        dados = {
+                            "reagente": reagente.pk,
+                            "coordenacao": coordenacao.pk,
+                            "quantidade": quantidade,
+                            "requisitante": f"{NOME_ESTRESSE} {indice}-{n}",
+                            "observacao": "",
+                            "chave_idempotencia": str(uuid.uuid4()),
+                        }
+                        resultado = _classificar(client.post(reverse("saida_reagente"), data=dados))
+                        coletor.registrar(resultado, time.monotonic() - inicio, espera[0])
+                        if resultado == "ok":
+                            ultima_ok = dados
+                    # Reenvio (duplo clique, retry do proxy) da ultima saida gravada: nao pode gravar de novo.
+                    if ultima_ok is not None:
+                        resultado = _classificar(client.post(reverse("saida_reagente"), data=ultima_ok))
+                        coletor.registrar_reenvio(resultado)
+            finally:
+                connection.close()
+
+        inicio = time.monotonic()
+        pool = [threading.Thread(target=trabalhador, args=(i,)) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        duracao = time.monotonic() - inicio
+
+        rc = ReagenteCoordenacao.objects.get(reagente=reagente, coordenacao=coordenacao)
+        saidas = SaidaReagente.objects.filter(reagente=reagente, coordenacao=coordenacao).aggregate(
+            linhas=Count("pk"), total=Sum("quantidade", default=0)
+        )
+        total_saidas = saidas["total"]
+        total_lotes = (
+            Lote.objects.filter(reagente=reagente, coordenacao=coordenacao).aggregate(total=Sum("quantidade"))[
+                "total"
+            ]
+            or 0
+        )
+        resultados = coletor.resultados
+        consistente = (
+            rc.quantidade == estoque_inicial - total_saidas
+            and total_lotes == rc.quantidade
+            and saidas["linhas"] == resultados["ok"]
+        )
+
+        requisicoes = threads * por_thread
+        latencias = sorted(coletor.latencias)
+        self.stdout.write(f"banco: {connection.vendor} ({connection.settings_dict['NAME']})")
+        self.stdout.write(f"threads: {threads}  requisicoes: {requisicoes}  duracao: {duracao:.2f}s")
+        self.stdout.write(f"vazao: {requisicoes / duracao:.1f} req/s  saidas ok: {resultados['ok'] / duracao:.1f}/s")
+        self.stdout.write(
+            f"latencia p50: {latencias[len(latencias) // 2] * 1000:.1f}ms  "
+            f"p95: {latencias[int(len(latencias) * 0.95) - 1] * 1000:.1f}ms"
+        )
+        self.stdout.write(
+            f"espera de lock: total {coletor.espera_lock:.2f}s  "
+            f"media {coletor.espera_lock / requisicoes * 1000:.1f}ms/req"
+        )
+        self.stdout.write(
+            f"ok: {resultados['ok']}  insuficiente: {resultados['insuficiente']}  "
+            f"lock: {resultados['lock']}  outros erros: {resultados['erro']}  "
+            f"taxa de erro: {(resultados['lock'] + resultados['erro']) / requisicoes:.2%}"
+        )
+        self.stdout.write(f"reenvios ignorados: {resultados['repetida']}  saidas gravadas: {saidas['linhas']}")
+        self.stdout.write(
+            f"estoque inicial {estoque_inicial} - saidas {total_saidas} = {estoque_inicial - total_saidas}; "
+            f"estoque final {rc.quantidade}; lotes {total_lotes}"
+        )
+        return consistente
@@ -0,0 +1,105 @@
+from array import array
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from reagents.models import PrevisaoConsumo, Reagente, ReagenteCoordenacao, SaidaReagente
+
+
+def pesos_janela(dias):
+    """Pesos lineares da media movel ponderada: o dia mais recente pesa `dias`, o mais antigo 1."""
+    pesos = array("d", range(1, dias + 1))
+    return pesos, sum(pesos)
+
+
+def consumo_diario(totais_por_dia, pesos, soma_pesos):
+    """Media movel ponderada do consumo diario a partir de {indice_do_dia: total}.
+
+    Dias sem saida valem zero, entao so os dias com consumo entram na soma.
+    """
+    return sum(pesos[indice] * total for indice, total in totais_por_dia.items()) / soma_pesos
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula o consumo medio diario (media movel ponderada das saidas) e os dias de "
+        "estoque restantes de cada reagente/coordenacao e grava em PrevisaoConsumo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--janela", type=int, default=90, help="Dias de historico considerados.")
+        parser.add_argument("--lote", type=int, default=500, help="Reagentes por bloco.")
+
+    def _bloco(self, faixa, inicio, hoje, pesos, soma_pesos, agora, janela):
+        totais = defaultdict(dict)
+        for linha in (
+            SaidaReagente.objects.filter(
+                reagente_id__gte=faixa[0], reagente_id__lte=faixa[1], data_saida__gte=inicio
+            )
+            .annotate(dia=TruncDate("data_saida"))
+            .values("reagente_id", "coordenacao_id", "dia")
+            .annotate(total=Sum("quantidade"))
+            .order_by()
+        ):
+            indice = len(pesos) - 1 - (hoje - linha["dia"]).days
+            if 0 <= indice < len(pesos):
+                totais[(linha["reagente_id"], linha["coordenacao_id"])][indice] = linha["total"]
+
+        previsoes = []
+        for pk, reagente_id, coordenacao_id, quantidade in ReagenteCoordenacao.objects.filter(
+            reagente_id__gte=faixa[0], reagente_id__lte=faixa[1]
+        ).values_list("pk", "reagente_id", "coordenacao_id", "quantidade"):
+            consumo = consumo_diario(totais.get((reagente_id, coordenacao_id), {}), pesos, soma_pesos)
+            previsoes.append(
+                PrevisaoConsumo(
+                    estoque_id=pk,
+                    consumo_diario=consumo,
+                    dias_restantes=quantidade / consumo if consumo else None,
+                    janela_dias=janela,
+                    calculado_em=agora,
+                )
+            )
+
+        PrevisaoConsumo.objects.bulk_create(
+            previsoes,
+            update_conflicts=True,
+            unique_fields=["estoque"],
+            update_fields=["consumo_diario", "dias_restantes", "janela_dias", "calculado_em"],
+        )
+        return len(previsoes), sum(1 for p in previsoes if p.consumo_diario)
+
+    def handle(self, *args, **options):
+        janela = options["janela"]
+        agora = timezone.now()
+        hoje = timezone.localdate(agora)
+        inicio = timezone.make_aware(datetime.combine(hoje - timedelta(days=janela - 1), time.min))
+        pesos, soma_pesos = pesos_janela(janela)
+
+        estoques = com_consumo = 0
+        ultimo = 0
+        while True:
+            ids = list(
+                Reagente.objects.filter(pk__gt=ultimo).order_by("pk").values_list("pk", flat=True)[
+                    : options["lote"]
+                ]
+            )
+            if not ids:
+                break
+            ultimo = ids[-1]
+            with transaction.atomic():
+                total, consumidos = self._bloco(
+                    (ids[0], ids[-1]), inicio, hoje, pesos, soma_pesos, agora, janela
+                )
+            estoques += total
+            com_consumo += consumidos
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{estoques} previsoes gravadas ({com_consumo} com consumo nos ultimos {janela} dias)."
+            )
+        )
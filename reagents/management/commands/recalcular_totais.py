@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reagents.estoque import recalcular_totais
+from reagents.models import Reagente
+from reagents.versao import incrementar_versao
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Reagente.quantidade_total e Reagente.ultima_saida a partir do estoque "
+        "por coordenacao e das saidas, em blocos de reagentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Reagentes por UPDATE.")
+
+    def handle(self, *args, **options):
+        total = 0
+        ultimo = 0
+        while True:
+            ids = list(
+                Reagente.objects.filter(pk__gt=ultimo).order_by("pk").values_list("pk", flat=True)[
+                    : options["lote"]
+                ]
+            )
+            if not ids:
+                break
+            ultimo = ids[-1]
+            with transaction.atomic():
+                total += recalcular_totais(Reagente.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]))
+        incrementar_versao()
+        self.stdout.write(self.style.SUCCESS(f"Totais recalculados para {total} reagentes."))
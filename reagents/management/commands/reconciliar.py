@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from reagents.estoque import ajustar_lotes, recalcular_totais
+from reagents.models import EntradaReagente, Lote, Reagente, ReagenteCoordenacao, SaidaReagente
+from reagents.versao import incrementar_versao
+
+
+def _na_faixa(model, faixa):
+    return model.objects.filter(reagente_id__gte=faixa[0], reagente_id__lte=faixa[1])
+
+
+def _somas(model, faixa):
+    return {
+        (linha["reagente_id"], linha["coordenacao_id"]): linha["total"]
+        for linha in _na_faixa(model, faixa)
+        .values("reagente_id", "coordenacao_id")
+        .annotate(total=Sum("quantidade"))
+        .order_by()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Confere ReagenteCoordenacao.quantidade contra entradas - saidas e contra a soma dos lotes, "
+        "em blocos de reagentes, e opcionalmente corrige o estoque."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Reagentes por bloco.")
+        parser.add_argument(
+            "--corrigir",
+            action="store_true",
+            help="Grava entradas - saidas como quantidade dos pares divergentes e acerta os lotes.",
+        )
+
+    def _bloco(self, faixa, corrigir):
+        estoques = _na_faixa(ReagenteCoordenacao, faixa).values(
+            "pk", "reagente_id", "coordenacao_id", "quantidade", "reagente__reagente_nome", "coordenacao__nome"
+        )
+        if corrigir:
+            estoques = estoques.select_for_update()
+        estoques = list(estoques)
+        entradas = _somas(EntradaReagente, faixa)
+        saidas = _somas(SaidaReagente, faixa)
+        lotes = _somas(Lote, faixa)
+
+        divergentes = []
+        for estoque in estoques:
+            chave = (estoque["reagente_id"], estoque["coordenacao_id"])
+            esperado = entradas.pop(chave, 0) - saidas.pop(chave, 0)
+            em_lotes = lotes.get(chave, 0)
+            nome = f"{estoque['reagente__reagente_nome']} / {estoque['coordenacao__nome']}"
+            if estoque["quantidade"] != esperado:
+                divergentes.append((estoque, esperado))
+                self.stdout.write(
+                    f"{nome}: estoque {estoque['quantidade']}, entradas - saidas {esperado}"
+                )
+            elif em_lotes != esperado:
+                divergentes.append((estoque, esperado))
+                self.stdout.write(f"{nome}: estoque {esperado}, lotes {em_lotes}")
+
+        # Movimentacoes de pares que nao tem mais linha de estoque.
+        orfaos = 0
+        for chave in entradas.keys() | saidas.keys():
+            orfaos += 1
+            self.stdout.write(
+                f"reagente {chave[0]} / coordenacao {chave[1]}: movimentacoes sem estoque "
+                f"(entradas - saidas {entradas.get(chave, 0) - saidas.get(chave, 0)})"
+            )
+
+        if corrigir and divergentes:
+            # Saldo negativo (mais saidas que entradas) nao cabe no estoque:
+            # uma entrada de ajuste leva entradas - saidas a zero.
+            EntradaReagente.objects.bulk_create(
+                [
+                    EntradaReagente(
+                        reagente_id=estoque["reagente_id"],
+                        coordenacao_id=estoque["coordenacao_id"],
+                        quantidade=-esperado,
+                        observacao="Ajuste: reconciliar (saidas maiores que entradas)",
+                    )
+                    for estoque, esperado in divergentes
+                    if esperado < 0
+                ]
+            )
+            ReagenteCoordenacao.objects.bulk_update(
+                [ReagenteCoordenacao(pk=estoque["pk"], quantidade=max(esperado, 0)) for estoque, esperado in divergentes],
+                ["quantidade"],
+            )
+            for estoque, esperado in divergentes:
+                ajustar_lotes(estoque["reagente_id"], estoque["coordenacao_id"], max(esperado, 0))
+            recalcular_totais(Reagente.objects.filter(pk__gte=faixa[0], pk__lte=faixa[1]))
+            transaction.on_commit(incrementar_versao)
+        return len(estoques), len(divergentes), len(divergentes) if corrigir else 0, orfaos
+
+    def handle(self, *args, **options):
+        corrigir = options["corrigir"]
+        totais = [0, 0, 0, 0]
+        ultimo = 0
+        while True:
+            ids = list(
+                Reagente.objects.filter(pk__gt=ultimo).order_by("pk").values_list("pk", flat=True)[
+                    : options["lote"]
+                ]
+            )
+            if not ids:
+                break
+            ultimo = ids[-1]
+            with transaction.atomic():
+                for i, valor in enumerate(self._bloco((ids[0], ids[-1]), corrigir)):
+                    totais[i] += valor
+
+        pares, divergentes, corrigidos, orfaos = totais
+        self.stdout.write(
+            f"{pares} pares conferidos, {divergentes} divergentes, {corrigidos} corrigidos, "
+            f"{orfaos} sem estoque."
+        )
+        if divergentes - corrigidos or orfaos:
+            self.stdout.write(self.style.ERROR("Estoque inconsistente."))
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS("Estoque consistente."))
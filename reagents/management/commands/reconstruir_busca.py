@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reagents.busca import indexar_estoque, indexar_saidas
+from reagents.models import DocumentoBusca
+
+
+class Command(BaseCommand):
+    help = "Regenera a tabela desnormalizada de busca (DocumentoBusca) de estoque e saidas."
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        with transaction.atomic():
+            DocumentoBusca.objects.all().delete()
+            estoque = indexar_estoque()
+            saidas = indexar_saidas()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{estoque} documentos de estoque e {saidas} de saida gerados "
+                f"em {time.monotonic() - inicio:.1f}s."
+            )
+        )
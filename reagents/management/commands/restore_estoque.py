@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from reagents.management.commands.backup_estoque import MODELOS_BACKUP, arquivo_modelo, memoria_pico_mb
+from reagents.versao import incrementar_versao
+
+ARQUIVO_PROGRESSO = "progresso.json"
+
+
+@contextmanager
+def _sem_auto_now(model):
+    """Preserva data_entrada/data_saida originais: bulk_create aplicaria auto_now_add."""
+    campos = [f for f in model._meta.concrete_fields if getattr(f, "auto_now_add", False) or getattr(f, "auto_now", False)]
+    originais = [(f, f.auto_now, f.auto_now_add) for f in campos]
+    for f in campos:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in originais:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Restaura um backup gerado por backup_estoque com bulk_create em lotes, na ordem das FKs. "
+        "O progresso e gravado a cada lote; use --retomar para continuar uma restauracao interrompida "
+        "(linhas cujo pk ja existe sao puladas)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("origem", help="Pasta gerada pelo backup_estoque.")
+        parser.add_argument("--lote", type=int, default=1000, help="Linhas por bulk_create/transacao.")
+        parser.add_argument("--retomar", action="store_true", help="Continua de onde o progresso parou.")
+
+    def _ler_progresso(self, caminho):
+        if os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        return {}
+
+    def _gravar_progresso(self, caminho, progresso):
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(progresso, arquivo)
+        os.replace(temporario, caminho)
+
+    def handle(self, *args, **options):
+        pasta = options["origem"]
+        tamanho_lote = options["lote"]
+        caminho_progresso = os.path.join(pasta, ARQUIVO_PROGRESSO)
+
+        if not os.path.isdir(pasta):
+            raise CommandError(f"Pasta nao encontrada: {pasta}")
+
+        if options["retomar"]:
+            progresso = self._ler_progresso(caminho_progresso)
+        else:
+            ocupados = [m._meta.label_lower for m in MODELOS_BACKUP if m.objects.exists()]
+            if ocupados:
+                raise CommandError(
+                    f"Tabelas com dados: {', '.join(ocupados)}. Restaure num banco vazio ou use --retomar."
+                )
+            progresso = {}
+
+        inicio_total = time.monotonic()
+        total = 0
+        for model in MODELOS_BACKUP:
+            rotulo = model._meta.label_lower
+            feitos = progresso.get(rotulo, 0)
+            campos = [(f.attname, f.to_python) for f in model._meta.concrete_fields]
+            inicio = time.monotonic()
+            linhas = 0
+
+            with gzip.open(arquivo_modelo(pasta, model), "rt", encoding="utf-8") as arquivo, _sem_auto_now(model):
+                registros = islice(arquivo, feitos, None)
+                while True:
+                    bloco = list(islice(registros, tamanho_lote))
+                    if not bloco:
+                        break
+                    objetos = []
+                    for linha in bloco:
+                        row = json.loads(linha)
+                        objetos.append(model(**{nome: converter(row.get(nome)) for nome, converter in campos}))
+                    # O progresso so e gravado depois do commit: se o processo cair
+                    # entre os dois, o lote ja gravado volta no --retomar.
+                    if options["retomar"]:
+                        existentes = set(
+                            model.objects.filter(pk__in=[obj.pk for obj in objetos]).values_list("pk", flat=True)
+                        )
+                        objetos = [obj for obj in objetos if obj.pk not in existentes]
+                    with transaction.atomic():
+                        model.objects.bulk_create(objetos)
+                    linhas += len(bloco)
+                    progresso[rotulo] = feitos + linhas
+                    self._gravar_progresso(caminho_progresso, progresso)
+
+            duracao = time.monotonic() - inicio
+            total += linhas
+            self.stdout.write(
+                f"{rotulo:<32} {linhas:>9} linhas  {duracao:6.2f}s  "
+                f"{linhas / duracao if duracao else 0:>10.0f} linhas/s"
+                + (f"  (retomado apos {feitos})" if feitos else "")
+            )
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELOS_BACKUP):
+                cursor.execute(sql)
+
+        call_command("reconstruir_busca", stdout=self.stdout)
+        call_command("recalcular_totais", stdout=self.stdout)
+        incrementar_versao()
+        if os.path.exists(caminho_progresso):
+            os.remove(caminho_progresso)
+
+        duracao = time.monotonic() - inicio_total
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Restauradas {total} linhas em {duracao:.2f}s "
+                f"({total / duracao if duracao else 0:.0f} linhas/s), memoria de pico {memoria_pico_mb():.1f} MB"
+            )
+        )
@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = "Copia o banco SQLite principal para o arquivo da replica (uso local/testes)."
+
+    def handle(self, *args, **options):
+        alias = settings.REPLICA_DATABASE
+        if alias not in settings.DATABASES:
+            raise CommandError(
+                f"Alias '{alias}' nao configurado. Defina DATABASE_REPLICA_NAME com o caminho do arquivo."
+            )
+
+        principal = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replica = settings.DATABASES[alias]
+        for config in (principal, replica):
+            if config["ENGINE"] != "django.db.backends.sqlite3":
+                raise CommandError("Sincronizacao local disponivel apenas para SQLite.")
+
+        origem = sqlite3.connect(str(principal["NAME"]))
+        destino = sqlite3.connect(str(replica["NAME"]))
+        try:
+            origem.backup(destino)
+        finally:
+            destino.close()
+            origem.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Replica atualizada: {replica['NAME']}"))
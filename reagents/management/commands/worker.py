@@ -0,0 +1,62 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from reagents.models import TarefaRelatorio
+from reagents.relatorios import executar_tarefa
+
+
+def _reservar_proxima():
+    """Marca a tarefa disponivel mais antiga como executando e a devolve.
+
+    Disponivel e pendente ou executando sem sinal de vida ha
+    RELATORIO_TIMEOUT segundos (worker que caiu no meio). O UPDATE
+    condicionado ao mesmo filtro garante que dois workers nao peguem a
+    mesma tarefa, em qualquer banco.
+    """
+    agora = timezone.now()
+    disponivel = Q(status=TarefaRelatorio.PENDENTE) | Q(
+        status=TarefaRelatorio.EXECUTANDO, atualizado_em__lt=agora - timedelta(seconds=settings.RELATORIO_TIMEOUT)
+    )
+    for pk in TarefaRelatorio.objects.filter(disponivel).order_by("criado_em").values_list("pk", flat=True)[:10]:
+        reservada = TarefaRelatorio.objects.filter(disponivel, pk=pk).update(
+            status=TarefaRelatorio.EXECUTANDO, iniciado_em=agora, atualizado_em=agora, progresso=0
+        )
+        if reservada:
+            return TarefaRelatorio.objects.get(pk=pk)
+    return None
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de relatorios (TarefaRelatorio) fora do ciclo das requisicoes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre consultas a fila vazia.")
+        parser.add_argument("--uma-vez", action="store_true", help="Esvazia a fila e termina.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            tarefa = _reservar_proxima()
+            if tarefa is None:
+                if options["uma_vez"]:
+                    return
+                time.sleep(options["intervalo"])
+                continue
+
+            inicio = time.monotonic()
+            try:
+                executar_tarefa(tarefa)
+            except Exception:
+                TarefaRelatorio.objects.filter(pk=tarefa.pk).update(
+                    status=TarefaRelatorio.ERRO, erro=traceback.format_exc(), concluido_em=timezone.now()
+                )
+                self.stdout.write(self.style.ERROR(f"Tarefa {tarefa.pk} falhou."))
+            else:
+                self.stdout.write(f"Tarefa {tarefa.pk} concluida em {time.monotonic() - inicio:.1f}s.")
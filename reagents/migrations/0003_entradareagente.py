@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def criar_saldos_iniciais(apps, schema_editor):
+    # Estoque anterior as entradas: registra o saldo atual somado as saidas ja
+    # feitas, para que entradas - saidas continue batendo com a quantidade.
+    EntradaReagente = apps.get_model('reagents', 'EntradaReagente')
+    ReagenteCoordenacao = apps.get_model('reagents', 'ReagenteCoordenacao')
+    SaidaReagente = apps.get_model('reagents', 'SaidaReagente')
+
+    saidas = {
+        (row['reagente_id'], row['coordenacao_id']): row['total']
+        for row in SaidaReagente.objects.values('reagente_id', 'coordenacao_id')
+        .annotate(total=models.Sum('quantidade'))
+    }
+    entradas = []
+    for rc in ReagenteCoordenacao.objects.all().iterator():
+        quantidade = rc.quantidade + saidas.get((rc.reagente_id, rc.coordenacao_id), 0)
+        if quantidade:
+            entradas.append(EntradaReagente(
+                reagente_id=rc.reagente_id,
+                coordenacao_id=rc.coordenacao_id,
+                quantidade=quantidade,
+                observacao='Saldo inicial',
+            ))
+    EntradaReagente.objects.bulk_create(entradas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0002_remove_reagente_coordenacao_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntradaReagente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('data_entrada', models.DateTimeField(auto_now_add=True)),
+                ('observacao', models.TextField(blank=True, null=True)),
+                ('coordenacao', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='reagents.coordenacao')),
+                ('reagente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='reagents.reagente')),
+            ],
+        ),
+        migrations.RunPython(criar_saldos_iniciais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def criar_lotes_iniciais(apps, schema_editor):
+    # Cada estoque existente vira um lote com a validade do reagente.
+    Lote = apps.get_model('reagents', 'Lote')
+    ReagenteCoordenacao = apps.get_model('reagents', 'ReagenteCoordenacao')
+
+    Lote.objects.bulk_create(
+        (
+            Lote(
+                reagente_id=rc.reagente_id,
+                coordenacao_id=rc.coordenacao_id,
+                validade=rc.reagente.validade,
+                quantidade=rc.quantidade,
+            )
+            for rc in ReagenteCoordenacao.objects.filter(quantidade__gt=0).select_related('reagente').iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0003_entradareagente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entradareagente',
+            name='validade',
+            field=models.DateField(blank=True, null=True, verbose_name='validade do lote'),
+        ),
+        migrations.CreateModel(
+            name='Lote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('validade', models.DateField(verbose_name='data de validade')),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('coordenacao', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='reagents.coordenacao')),
+                ('reagente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='reagents.reagente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('reagente', 'coordenacao', 'validade'), name='lote_reagente_coordenacao_validade_uniq')],
+            },
+        ),
+        migrations.RunPython(criar_lotes_iniciais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:13
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _texto(*partes):
+    normalizadas = []
+    for parte in partes:
+        parte = unicodedata.normalize('NFD', (parte or '').strip().lower())
+        normalizadas.append(''.join(ch for ch in parte if unicodedata.category(ch) != 'Mn'))
+    return '\n'.join(p for p in normalizadas if p)
+
+
+def criar_documentos(apps, schema_editor):
+    DocumentoBusca = apps.get_model('reagents', 'DocumentoBusca')
+    ReagenteCoordenacao = apps.get_model('reagents', 'ReagenteCoordenacao')
+    SaidaReagente = apps.get_model('reagents', 'SaidaReagente')
+
+    estoque = (
+        DocumentoBusca(
+            tipo='estoque',
+            objeto_id=rc.pk,
+            texto=_texto(rc.reagente.reagente_nome, rc.reagente.fispq, rc.reagente.controlador.nome, rc.coordenacao.nome),
+            coordenacao_id=rc.coordenacao_id,
+            validade=rc.reagente.validade,
+        )
+        for rc in ReagenteCoordenacao.objects.select_related('reagente__controlador', 'coordenacao').iterator()
+    )
+    DocumentoBusca.objects.bulk_create(estoque, batch_size=500)
+
+    saidas = (
+        DocumentoBusca(
+            tipo='saida',
+            objeto_id=s.pk,
+            texto=_texto(
+                s.reagente.reagente_nome, s.reagente.fispq, s.reagente.controlador.nome,
+                s.coordenacao.nome, s.requisitante,
+            ),
+            coordenacao_id=s.coordenacao_id,
+            validade=s.reagente.validade,
+            data_saida=s.data_saida,
+        )
+        for s in SaidaReagente.objects.select_related('reagente__controlador', 'coordenacao').iterator()
+    )
+    DocumentoBusca.objects.bulk_create(saidas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0004_lote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('estoque', 'Estoque'), ('saida', 'Saida')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('texto', models.TextField()),
+                ('coordenacao_id', models.IntegerField()),
+                ('validade', models.DateField(blank=True, null=True)),
+                ('data_saida', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tipo', 'coordenacao_id'], name='documentobusca_tipo_coord_idx'), models.Index(fields=['tipo', 'validade'], name='documentobusca_tipo_valid_idx'), models.Index(fields=['tipo', 'data_saida'], name='documentobusca_tipo_data_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documentobusca_tipo_objeto_uniq')],
+            },
+        ),
+        migrations.RunPython(criar_documentos, migrations.RunPython.noop),
+    ]
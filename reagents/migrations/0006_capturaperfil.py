@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0005_documentobusca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapturaPerfil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_nome', models.CharField(max_length=200)),
+                ('caminho', models.CharField(max_length=500)),
+                ('usuario', models.CharField(blank=True, max_length=150)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('duracao_ms', models.FloatField()),
+                ('top_funcoes', models.TextField()),
+                ('dados', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['view_nome', '-criado_em'], name='capturaperfil_view_data_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0006_capturaperfil'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lote',
+            index=models.Index(fields=['validade', 'coordenacao'], name='lote_validade_coord_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0007_lote_validade_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='saidareagente',
+            index=models.Index(fields=['coordenacao', 'data_saida'], name='saida_coord_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saidareagente',
+            index=models.Index(fields=['data_saida'], name='saida_data_idx'),
+        ),
+    ]
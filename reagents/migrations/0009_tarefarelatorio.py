@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0008_saida_data_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parametros', models.JSONField(default=dict)),
+                ('chave', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluida'), ('erro', 'Erro')], default='pendente', max_length=10)),
+                ('progresso', models.PositiveSmallIntegerField(default=0)),
+                ('arquivo', models.FileField(blank=True, upload_to='relatorios/')),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('solicitante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='tarefarelatorio_fila_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0009_tarefarelatorio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoConsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumo_diario', models.FloatField(default=0)),
+                ('dias_restantes', models.FloatField(blank=True, null=True)),
+                ('janela_dias', models.PositiveSmallIntegerField()),
+                ('calculado_em', models.DateTimeField()),
+                ('estoque', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='previsao', to='reagents.reagentecoordenacao')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dias_restantes'], name='previsao_dias_restantes_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:43
+
+import reagents.armazenamento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0010_previsaoconsumo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reagente',
+            name='nota_fiscal',
+            field=models.FileField(blank=True, null=True, storage=reagents.armazenamento.ArmazenamentoPorConteudo(), upload_to='notas_fiscais/'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:47
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    Reagente = apps.get_model('reagents', 'Reagente')
+    ReagenteCoordenacao = apps.get_model('reagents', 'ReagenteCoordenacao')
+    SaidaReagente = apps.get_model('reagents', 'SaidaReagente')
+
+    Reagente.objects.update(
+        quantidade_total=Coalesce(
+            Subquery(
+                ReagenteCoordenacao.objects.filter(reagente=OuterRef('pk'))
+                .values('reagente')
+                .annotate(total=Sum('quantidade'))
+                .values('total')
+            ),
+            Value(0),
+        ),
+        ultima_saida=Subquery(
+            SaidaReagente.objects.filter(reagente=OuterRef('pk'))
+            .values('reagente')
+            .annotate(ultima=Max('data_saida'))
+            .values('ultima')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0011_nota_fiscal_por_conteudo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reagente',
+            name='quantidade_total',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='reagente',
+            name='ultima_saida',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
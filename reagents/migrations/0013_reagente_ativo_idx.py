@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0012_reagente_totais'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reagente',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['quantidade_total', 'validade'], name='reagente_ativo_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0013_reagente_ativo_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saidareagente',
+            name='chave_idempotencia',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
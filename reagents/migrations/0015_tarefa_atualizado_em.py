@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:41
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_atualizado_em(apps, schema_editor):
+    TarefaRelatorio = apps.get_model('reagents', 'TarefaRelatorio')
+    TarefaRelatorio.objects.filter(iniciado_em__isnull=False).update(atualizado_em=F('iniciado_em'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reagents', '0014_saida_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarefarelatorio',
+            name='atualizado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_atualizado_em, migrations.RunPython.noop),
+    ]
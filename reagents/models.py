@@ -1,5 +1,7 @@
 from django.db import models
 
+from .armazenamento import notas_fiscais
+
 class Coordenacao(models.Model):
     id = models.AutoField(primary_key=True)
     nome =  models.CharField(max_length=200)
@@ -25,10 +27,26 @@ class Reagente(models.Model):
 
     validade = models.DateField('data de validade')
     data_entrada = models.DateTimeField(auto_now_add=True)
-    nota_fiscal = models.FileField(upload_to='notas_fiscais/', blank=True, null=True)
+    nota_fiscal = models.FileField(upload_to='notas_fiscais/', storage=notas_fiscais, blank=True, null=True)
 
     ativo = models.BooleanField(default=True)
 
+    # Desnormalizados: soma de ReagenteCoordenacao.quantidade e data da saida
+    # mais recente, mantidos por reagents.estoque na mesma transacao.
+    quantidade_total = models.PositiveIntegerField(default=0, db_index=True)
+    ultima_saida = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Listagens e formularios so mostram reagentes ativos; desativar_esgotados
+            # procura os ativos vencidos e sem estoque.
+            models.Index(
+                fields=['quantidade_total', 'validade'],
+                name='reagente_ativo_idx',
+                condition=models.Q(ativo=True),
+            ),
+        ]
+
     def __str__(self):
         return self.reagente_nome
     
@@ -53,5 +71,170 @@ class SaidaReagente(models.Model):
     data_saida = models.DateTimeField(auto_now_add=True)
     observacao = models.TextField(blank=True, null=True)
 
+    # Token do formulario de saida: um reenvio com a mesma chave devolve a
+    # saida ja gravada em vez de baixar o estoque de novo.
+    chave_idempotencia = models.UUIDField(unique=True, blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Filtros de periodo do historico, com e sem coordenacao.
+            models.Index(fields=['coordenacao', 'data_saida'], name='saida_coord_data_idx'),
+            models.Index(fields=['data_saida'], name='saida_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reagente} - {self.quantidade} ({self.coordenacao})"
+
+
+class EntradaReagente(models.Model):
+    reagente = models.ForeignKey(Reagente, on_delete=models.PROTECT)
+    coordenacao = models.ForeignKey(Coordenacao, on_delete=models.PROTECT)
+
+    quantidade = models.PositiveIntegerField()
+    validade = models.DateField('validade do lote', blank=True, null=True)
+
+    data_entrada = models.DateTimeField(auto_now_add=True)
+    observacao = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.reagente} + {self.quantidade} ({self.coordenacao})"
+
+
+class Lote(models.Model):
+    reagente = models.ForeignKey(Reagente, on_delete=models.CASCADE, related_name='lotes')
+    coordenacao = models.ForeignKey(Coordenacao, on_delete=models.PROTECT)
+
+    validade = models.DateField('data de validade')
+    quantidade = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # A constraint cria o indice (reagente, coordenacao, validade)
+            # usado na alocacao FEFO e na agregacao da home.
+            models.UniqueConstraint(
+                fields=['reagente', 'coordenacao', 'validade'],
+                name='lote_reagente_coordenacao_validade_uniq',
+            ),
+        ]
+        indexes = [
+            # Faixa de validade (alertas_validade, painel).
+            models.Index(fields=['validade', 'coordenacao'], name='lote_validade_coord_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reagente} - {self.coordenacao} ({self.validade:%Y-%m-%d}): {self.quantidade}"
+
+
+class DocumentoBusca(models.Model):
+    """Linha desnormalizada de busca: um texto ja normalizado por estoque ou saida."""
+
+    TIPO_ESTOQUE = 'estoque'
+    TIPO_SAIDA = 'saida'
+    TIPOS = (
+        (TIPO_ESTOQUE, 'Estoque'),
+        (TIPO_SAIDA, 'Saida'),
+    )
+
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    objeto_id = models.BigIntegerField()
+    texto = models.TextField()
+
+    coordenacao_id = models.IntegerField()
+    validade = models.DateField(blank=True, null=True)
+    data_saida = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documentobusca_tipo_objeto_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['tipo', 'coordenacao_id'], name='documentobusca_tipo_coord_idx'),
+            models.Index(fields=['tipo', 'validade'], name='documentobusca_tipo_valid_idx'),
+            models.Index(fields=['tipo', 'data_saida'], name='documentobusca_tipo_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo}:{self.objeto_id}"
+
+
+class CapturaPerfil(models.Model):
+    """Resultado de uma requisicao executada sob cProfile (ver app.perfilamento)."""
+
+    view_nome = models.CharField(max_length=200)
+    caminho = models.CharField(max_length=500)
+    usuario = models.CharField(max_length=150, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    duracao_ms = models.FloatField()
+
+    top_funcoes = models.TextField()
+    dados = models.BinaryField()
+
+    class Meta:
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['view_nome', '-criado_em'], name='capturaperfil_view_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.view_nome} @ {self.criado_em:%Y-%m-%d %H:%M:%S}"
+
+
+class TarefaRelatorio(models.Model):
+    """Relatorio pedido pela tela de relatorios e gerado pelo `manage.py worker`."""
+
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (EXECUTANDO, 'Executando'),
+        (CONCLUIDA, 'Concluida'),
+        (ERRO, 'Erro'),
+    ]
+
+    solicitante = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
+    parametros = models.JSONField(default=dict)
+    # Hash dos parametros + assinatura dos dados: pedidos iguais sobre os
+    # mesmos dados reaproveitam o arquivo ja gerado.
+    chave = models.CharField(max_length=64, db_index=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDENTE)
+    progresso = models.PositiveSmallIntegerField(default=0)
+    arquivo = models.FileField(upload_to='relatorios/', blank=True)
+    erro = models.TextField(blank=True)
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    # Sinal de vida do worker (reserva e cada aviso de progresso); tarefa
+    # executando sem sinal ha RELATORIO_TIMEOUT segundos volta para a fila.
+    atualizado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['status', 'criado_em'], name='tarefarelatorio_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"Relatorio {self.pk} ({self.status})"
+
+
+class PrevisaoConsumo(models.Model):
+    """Consumo medio diario de um estoque, calculado em lote por `manage.py prever_consumo`."""
+
+    estoque = models.OneToOneField(ReagenteCoordenacao, on_delete=models.CASCADE, related_name='previsao')
+    consumo_diario = models.FloatField(default=0)
+    # Dias ate zerar com o estoque do momento do calculo; vazio sem consumo.
+    dias_restantes = models.FloatField(null=True, blank=True)
+    janela_dias = models.PositiveSmallIntegerField()
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dias_restantes'], name='previsao_dias_restantes_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.reagente} - {self.quantidade} ({self.coordenacao})"
\ No newline at end of file
+        return f"{self.estoque}: {self.consumo_diario:.2f}/dia"
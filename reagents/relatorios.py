@@ -0,0 +1,143 @@
+import csv
+import hashlib
+import io
+import json
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import SaidaReagente, TarefaRelatorio
+from .versao import versao_cadastros, versao_catalogo, versao_dados
+
+LOTE_RELATORIO = 2000
+PASTA_RELATORIOS = "relatorios"
+
+
+def parametros_relatorio(cleaned_data):
+    """Parametros serializaveis (JSON) a partir do RelatorioForm."""
+    coordenacao = cleaned_data.get("coordenacao")
+    return {
+        "coordenacao": coordenacao.pk if coordenacao else None,
+        "data_de": cleaned_data["data_de"].isoformat() if cleaned_data.get("data_de") else None,
+        "data_ate": cleaned_data["data_ate"].isoformat() if cleaned_data.get("data_ate") else None,
+    }
+
+
+def _saidas(parametros):
+    saidas = SaidaReagente.objects.all()
+    if parametros.get("coordenacao"):
+        saidas = saidas.filter(coordenacao_id=parametros["coordenacao"])
+    if parametros.get("data_de"):
+        inicio = datetime.combine(date.fromisoformat(parametros["data_de"]), time.min)
+        saidas = saidas.filter(data_saida__gte=timezone.make_aware(inicio))
+    if parametros.get("data_ate"):
+        fim = datetime.combine(date.fromisoformat(parametros["data_ate"]) + timedelta(days=1), time.min)
+        saidas = saidas.filter(data_saida__lt=timezone.make_aware(fim))
+    return saidas
+
+
+def assinatura_dados(parametros):
+    """Resumo das saidas cobertas pelo relatorio mais as versoes das tabelas juntadas.
+
+    O CSV tambem traz nomes de reagente e coordenacao: renomear um deles
+    muda o arquivo sem mexer nos agregados das saidas. E uma saida editada no
+    lugar (o inline do admin) pode manter quantidade, pk e data: so a versao
+    dos dados denuncia a troca.
+    """
+    assinatura = _saidas(parametros).aggregate(
+        linhas=Count("pk"), ultimo=Max("pk"), total=Sum("quantidade"), mais_recente=Max("data_saida")
+    )
+    assinatura["catalogo"] = versao_catalogo()
+    assinatura["cadastros"] = versao_cadastros()
+    assinatura["dados"] = versao_dados()
+    return assinatura
+
+
+def chave_relatorio(parametros, assinatura):
+    conteudo = json.dumps({"parametros": parametros, "dados": assinatura}, sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def solicitar_relatorio(usuario, parametros):
+    """Enfileira um relatorio ou reaproveita um identico (concluido ou em andamento)."""
+    chave = chave_relatorio(parametros, assinatura_dados(parametros))
+    existente = (
+        TarefaRelatorio.objects.filter(chave=chave)
+        .exclude(status=TarefaRelatorio.ERRO)
+        .order_by("-criado_em")
+        .first()
+    )
+    if existente and existente.status == TarefaRelatorio.CONCLUIDA and not default_storage.exists(
+        existente.arquivo.name
+    ):
+        existente = None
+    if existente and existente.solicitante_id == usuario.pk:
+        return existente
+    if existente and existente.status == TarefaRelatorio.CONCLUIDA:
+        agora = timezone.now()
+        return TarefaRelatorio.objects.create(
+            solicitante=usuario,
+            parametros=parametros,
+            chave=chave,
+            status=TarefaRelatorio.CONCLUIDA,
+            progresso=100,
+            arquivo=existente.arquivo.name,
+            iniciado_em=agora,
+            concluido_em=agora,
+        )
+    return TarefaRelatorio.objects.create(solicitante=usuario, parametros=parametros, chave=chave)
+
+
+def _escrever_csv(tarefa, destino):
+    saidas = _saidas(tarefa.parametros)
+    total_linhas = saidas.count() or 1
+    escritor = csv.writer(destino)
+    escritor.writerow(["data_saida", "reagente", "coordenacao", "requisitante", "quantidade", "observacao"])
+
+    proximo_aviso = 0
+    for n, linha in enumerate(
+        saidas.order_by("data_saida", "pk")
+        .values_list(
+            "data_saida", "reagente__reagente_nome", "coordenacao__nome", "requisitante", "quantidade", "observacao"
+        )
+        .iterator(chunk_size=LOTE_RELATORIO),
+        start=1,
+    ):
+        data_saida, *resto = linha
+        escritor.writerow([timezone.localtime(data_saida).strftime("%Y-%m-%d %H:%M"), *resto])
+        progresso = n * 90 // total_linhas
+        if progresso >= proximo_aviso:
+            TarefaRelatorio.objects.filter(pk=tarefa.pk).update(progresso=progresso, atualizado_em=timezone.now())
+            proximo_aviso = progresso + 5
+
+    escritor.writerow([])
+    escritor.writerow(["coordenacao", "reagente", "saidas", "quantidade_total"])
+    for linha in (
+        saidas.values_list("coordenacao__nome", "reagente__reagente_nome")
+        .annotate(saidas=Count("pk"), total=Sum("quantidade"))
+        .order_by("coordenacao__nome", "reagente__reagente_nome")
+    ):
+        escritor.writerow(linha)
+
+
+def executar_tarefa(tarefa):
+    """Gera o CSV da tarefa (ja marcada como executando) e grava em MEDIA_ROOT/relatorios."""
+    nome = f"{PASTA_RELATORIOS}/{tarefa.chave}.csv"
+    if not default_storage.exists(nome):
+        with tempfile.TemporaryFile() as temporario:
+            # BOM no inicio para o Excel reconhecer UTF-8.
+            texto = io.TextIOWrapper(temporario, encoding="utf-8-sig", newline="")
+            _escrever_csv(tarefa, texto)
+            texto.flush()
+            texto.detach()
+            temporario.seek(0)
+            nome = default_storage.save(nome, File(temporario))
+    tarefa.arquivo.name = nome
+    tarefa.status = TarefaRelatorio.CONCLUIDA
+    tarefa.progresso = 100
+    tarefa.concluido_em = timezone.now()
+    tarefa.save(update_fields=["arquivo", "status", "progresso", "concluido_em"])
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from reagents.busca import indexar_estoque, indexar_saidas, remover_documento
+from reagents.estoque import ajustar_lotes, recalcular_totais
+from reagents.models import (
+    Controlador,
+    Coordenacao,
+    DocumentoBusca,
+    EntradaReagente,
+    Lote,
+    Reagente,
+    ReagenteCoordenacao,
+    SaidaReagente,
+)
+from reagents.versao import incrementar_versao, incrementar_versao_cadastros, incrementar_versao_catalogo
+
+MODELOS_VERSIONADOS = (
+    Coordenacao,
+    Controlador,
+    Reagente,
+    ReagenteCoordenacao,
+    Lote,
+    EntradaReagente,
+    SaidaReagente,
+)
+
+
+def invalidar_versao(sender, **kwargs):
+    transaction.on_commit(incrementar_versao)
+
+
+for modelo in MODELOS_VERSIONADOS:
+    post_save.connect(invalidar_versao, sender=modelo, dispatch_uid=f"versao_save_{modelo.__name__}")
+    post_delete.connect(invalidar_versao, sender=modelo, dispatch_uid=f"versao_delete_{modelo.__name__}")
+
+
+def invalidar_catalogo(sender, **kwargs):
+    transaction.on_commit(incrementar_versao_catalogo)
+
+
+post_save.connect(invalidar_catalogo, sender=Reagente, dispatch_uid="catalogo_save_Reagente")
+post_delete.connect(invalidar_catalogo, sender=Reagente, dispatch_uid="catalogo_delete_Reagente")
+
+
+# ======================
+# LOTES E TOTAL DO ESTOQUE GRAVADO DIRETO
+# ======================
+# registrar_* mantem lotes e Reagente.quantidade_total com bulk_create/update,
+# sem signals; estes cobrem o inline do admin e qualquer outro save/delete
+# de ReagenteCoordenacao.
+@receiver(post_save, sender=ReagenteCoordenacao)
+def ajustar_lotes_do_estoque(sender, instance, raw=False, **kwargs):
+    if not raw:
+        with transaction.atomic():
+            ajustar_lotes(instance.reagente_id, instance.coordenacao_id, instance.quantidade)
+            recalcular_totais(Reagente.objects.filter(pk=instance.reagente_id))
+
+
+@receiver(post_delete, sender=ReagenteCoordenacao)
+def remover_lotes_do_estoque(sender, instance, **kwargs):
+    Lote.objects.filter(reagente_id=instance.reagente_id, coordenacao_id=instance.coordenacao_id).delete()
+    recalcular_totais(Reagente.objects.filter(pk=instance.reagente_id))
+
+
+# ======================
+# CADASTROS EM MEMORIA (reagents.cadastros)
+# ======================
+def invalidar_cadastros(sender, **kwargs):
+    # Ja: o proprio processo enxerga a mudanca dentro da transacao.
+    # No commit: outro processo pode ter recarregado a tabela antes dele.
+    incrementar_versao_cadastros()
+    transaction.on_commit(incrementar_versao_cadastros)
+
+
+for modelo in (Coordenacao, Controlador):
+    post_save.connect(invalidar_cadastros, sender=modelo, dispatch_uid=f"cadastros_save_{modelo.__name__}")
+    post_delete.connect(invalidar_cadastros, sender=modelo, dispatch_uid=f"cadastros_delete_{modelo.__name__}")
+
+
+# ======================
+# DOCUMENTOS DE BUSCA
+# ======================
+@receiver(post_save, sender=ReagenteCoordenacao)
+def indexar_estoque_salvo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_estoque(pk=instance.pk)
+
+
+@receiver(post_delete, sender=ReagenteCoordenacao)
+def remover_estoque_excluido(sender, instance, **kwargs):
+    remover_documento(DocumentoBusca.TIPO_ESTOQUE, instance.pk)
+
+
+@receiver(post_save, sender=SaidaReagente)
+def indexar_saida_salva(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_saidas(pk=instance.pk)
+
+
+@receiver(post_delete, sender=SaidaReagente)
+def remover_saida_excluida(sender, instance, **kwargs):
+    remover_documento(DocumentoBusca.TIPO_SAIDA, instance.pk)
+
+
+@receiver(post_save, sender=Reagente)
+def reindexar_reagente(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        indexar_estoque(reagente_id=instance.pk)
+        indexar_saidas(reagente_id=instance.pk)
+
+
+@receiver(post_save, sender=Coordenacao)
+def reindexar_coordenacao(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        indexar_estoque(coordenacao_id=instance.pk)
+        indexar_saidas(coordenacao_id=instance.pk)
+
+
+@receiver(post_save, sender=Controlador)
+def reindexar_controlador(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        indexar_estoque(reagente__controlador_id=instance.pk)
+        indexar_saidas(reagente__controlador_id=instance.pk)
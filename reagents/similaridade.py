@@ -0,0 +1,100 @@
+import re
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+
+from .busca import normalizar_texto
+from .models import Reagente
+from .versao import versao_catalogo
+
+
+def _palavras(texto):
+    return re.sub(r"[^a-z0-9]+", " ", normalizar_texto(texto)).split()
+
+
+def trigramas(texto):
+    """Trigramas das palavras do texto ja normalizado, no estilo do pg_trgm."""
+    resultado = set()
+    for palavra in _palavras(texto):
+        palavra = f"  {palavra} "
+        resultado.update(palavra[i : i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+def chave_fispq(fispq):
+    return "".join(_palavras(fispq))
+
+
+class IndiceSimilaridade:
+    """Indice invertido trigrama -> reagentes, para achar nomes parecidos.
+
+    Os candidatos saem das listas dos trigramas da consulta; so eles tem a
+    similaridade (Jaccard dos trigramas) calculada, nunca o catalogo inteiro.
+    """
+
+    def __init__(self, reagentes):
+        self.nomes = {}
+        self.tamanhos = {}
+        self.postings = defaultdict(list)
+        self.por_fispq = defaultdict(list)
+        for pk, nome, fispq in reagentes:
+            grams = trigramas(nome)
+            self.nomes[pk] = nome
+            self.tamanhos[pk] = len(grams)
+            for gram in grams:
+                self.postings[gram].append(pk)
+            if chave_fispq(fispq):
+                self.por_fispq[chave_fispq(fispq)].append(pk)
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def _comuns(self, grams, frequencia_maxima=None):
+        comuns = Counter()
+        for gram in grams:
+            lista = self.postings.get(gram, ())
+            if frequencia_maxima is None or len(lista) <= frequencia_maxima:
+                comuns.update(lista)
+        return comuns
+
+    def similares(self, nome, fispq="", limite=None, excluir=None, frequencia_maxima=None):
+        """Lista de (similaridade, pk, nome) dos reagentes parecidos, do mais parecido ao menos.
+
+        FISPQ igual (ignorando pontuacao e caixa) conta como similaridade 1.
+        """
+        limite = settings.SIMILARIDADE_LIMITE if limite is None else limite
+        grams = trigramas(nome)
+        resultado = {}
+        for pk, comuns in self._comuns(grams, frequencia_maxima).items():
+            uniao = len(grams) + self.tamanhos[pk] - comuns
+            similaridade = comuns / uniao if uniao else 0.0
+            if similaridade >= limite:
+                resultado[pk] = similaridade
+        for pk in self.por_fispq.get(chave_fispq(fispq), ()) if fispq else ():
+            resultado[pk] = 1.0
+        resultado.pop(excluir, None)
+        return sorted(
+            ((round(similaridade, 3), pk, self.nomes[pk]) for pk, similaridade in resultado.items()),
+            key=lambda item: (-item[0], item[2]),
+        )
+
+
+_indice = (None, None)
+_lock = Lock()
+
+
+def indice_similaridade():
+    """Indice do catalogo atual, reconstruido (uma consulta) quando um Reagente e salvo ou excluido."""
+    global _indice
+    versao = versao_catalogo()
+    indice_versao, indice = _indice
+    if indice_versao != versao:
+        with _lock:
+            indice_versao, indice = _indice
+            if indice_versao != versao:
+                indice = IndiceSimilaridade(
+                    Reagente.objects.values_list("pk", "reagente_nome", "fispq").iterator(chunk_size=2000)
+                )
+                _indice = (versao, indice)
+    return indice
@@ -1,22 +1,61 @@
-from datetime import date
+import asyncio
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from accounts.models import Perfil
-from reagents.forms import ReagenteCoordenacaoFormSet, ReagenteForm
+from app.estaticos import ArquivosEstaticos, EstaticosASGI, EstaticosWSGI
+from app.replica import COOKIE_ESCRITA, ReplicaRouter, usar_replica
+from reagents import cadastros
+from reagents.busca import CacheBusca, cache_busca, indexar_saidas
+from reagents.checks import checar_cache_das_versoes
+from reagents.estoque import EstoqueInsuficiente, matriz_disponibilidade, recalcular_totais, registrar_entradas, registrar_saida
+from reagents.forms import ReagenteCoordenacaoFormSet, ReagenteForm, SaidaReagenteForm
 from reagents.models import (
     Controlador,
+    CapturaPerfil,
     Coordenacao,
+    DocumentoBusca,
+    EntradaReagente,
+    Lote,
+    PrevisaoConsumo,
     Reagente,
     ReagenteCoordenacao,
     SaidaReagente,
+    TarefaRelatorio,
 )
+from reagents.similaridade import indice_similaridade
+from reagents.versao import incrementar_versao_cadastros, versao_dados
+from reagents.views import _ids_em_cache
 
 
 class ReagentesViewTests(TestCase):
     def setUp(self):
+        cache_busca.limpar()
         self.coord_a = Coordenacao.objects.create(nome="Coord A")
         self.coord_b = Coordenacao.objects.create(nome="Coord B")
         self.controlador = Controlador.objects.create(nome="Controlador X")
@@ -59,11 +98,29 @@ class ReagentesViewTests(TestCase):
         response = self.client.get(reverse("saida_reagente"))
         self.assertEqual(response.status_code, 200)
 
+    def test_saida_envia_matriz_de_disponibilidade(self):
+        cache.clear()
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("saida_reagente"))
+        self.assertEqual(
+            response.context["disponibilidade"],
+            {str(self.reagente.id): {str(self.coord_a.id): 10}},
+        )
+        self.assertContains(response, '<script id="disponibilidade" type="application/json">')
+
+        with self.assertNumQueries(0):
+            matriz_disponibilidade()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_saida(self.reagente, self.coord_a, "Fulano", 4)
+        self.assertEqual(matriz_disponibilidade()[str(self.reagente.id)][str(self.coord_a.id)], 6)
+
     def test_saida_post_reduz_estoque_e_cria_saida(self):
         self.client.force_login(self.admin_user)
         response = self.client.post(
             reverse("saida_reagente"),
             data={
+                "chave_idempotencia": uuid.uuid4(),
                 "reagente": self.reagente.id,
                 "coordenacao": self.coord_a.id,
                 "quantidade": 3,
@@ -78,11 +135,51 @@ class ReagentesViewTests(TestCase):
         self.assertEqual(self.reagente_rc_a.quantidade, 7)
         self.assertEqual(SaidaReagente.objects.count(), 1)
 
+    def test_saida_reenviada_nao_baixa_estoque_duas_vezes(self):
+        self.client.force_login(self.admin_user)
+        dados = {
+            "reagente": self.reagente.id,
+            "coordenacao": self.coord_a.id,
+            "quantidade": 3,
+            "requisitante": "Fulano",
+            "observacao": "",
+            "chave_idempotencia": uuid.uuid4(),
+        }
+        self.client.post(reverse("saida_reagente"), data=dados)
+        with self.assertNumQueries(1):
+            saida = registrar_saida(
+                self.reagente, self.coord_a, "Fulano", 3, chave_idempotencia=dados["chave_idempotencia"]
+            )
+        self.assertTrue(saida.repetida)
+
+        response = self.client.post(reverse("saida_reagente"), data=dados, follow=True)
+        self.assertContains(response, "Esta saida ja tinha sido registrada")
+        self.reagente_rc_a.refresh_from_db()
+        self.assertEqual(self.reagente_rc_a.quantidade, 7)
+        self.assertEqual(SaidaReagente.objects.get().chave_idempotencia, dados["chave_idempotencia"])
+
+    def test_saida_sem_chave_e_rejeitada(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("saida_reagente"))
+        self.assertContains(response, 'name="chave_idempotencia"')
+
+        self.client.post(
+            reverse("saida_reagente"),
+            data={
+                "reagente": self.reagente.id,
+                "coordenacao": self.coord_a.id,
+                "quantidade": 1,
+                "requisitante": "Fulano",
+            },
+        )
+        self.assertEqual(SaidaReagente.objects.count(), 0)
+
     def test_saida_post_nao_deixa_estoque_negativo(self):
         self.client.force_login(self.admin_user)
         response = self.client.post(
             reverse("saida_reagente"),
             data={
+                "chave_idempotencia": uuid.uuid4(),
                 "reagente": self.reagente.id,
                 "coordenacao": self.coord_a.id,
                 "quantidade": 999,
@@ -102,6 +199,7 @@ class ReagentesViewTests(TestCase):
         response = self.client.post(
             reverse("saida_reagente"),
             data={
+                "chave_idempotencia": uuid.uuid4(),
                 "reagente": self.reagente.id,
                 "coordenacao": self.coord_a.id,
                 "quantidade": 1,
@@ -116,6 +214,186 @@ class ReagentesViewTests(TestCase):
         self.assertEqual(self.reagente_rc_a.quantidade, 10)
         self.assertEqual(SaidaReagente.objects.count(), 0)
 
+    def test_saida_consome_lotes_que_vencem_primeiro(self):
+        # Troca o lote criado junto com o estoque por lotes de validades diferentes.
+        Lote.objects.filter(reagente=self.reagente).delete()
+        lote_tardio = Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2031, 1, 1), quantidade=6
+        )
+        lote_cedo = Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2029, 1, 1), quantidade=4
+        )
+
+        self.client.force_login(self.admin_user)
+        self.client.post(
+            reverse("saida_reagente"),
+            data={
+                "chave_idempotencia": uuid.uuid4(),
+                "reagente": self.reagente.id,
+                "coordenacao": self.coord_a.id,
+                "quantidade": 7,
+                "requisitante": "Fulano",
+                "observacao": "",
+            },
+        )
+
+        lote_cedo.refresh_from_db()
+        lote_tardio.refresh_from_db()
+        self.reagente_rc_a.refresh_from_db()
+        self.assertEqual(lote_cedo.quantidade, 0)
+        self.assertEqual(lote_tardio.quantidade, 3)
+        self.assertEqual(self.reagente_rc_a.quantidade, 3)
+
+    def test_home_mostra_validade_do_lote_mais_proximo(self):
+        # Troca o lote criado junto com o estoque por lotes de validades diferentes.
+        Lote.objects.filter(reagente=self.reagente).delete()
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2031, 1, 1), quantidade=6
+        )
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2020, 1, 1), quantidade=4
+        )
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2019, 1, 1), quantidade=0
+        )
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("home"))
+
+        linha = list(response.context["linhas"])[0]
+        self.assertEqual(linha.proxima_validade, date(2020, 1, 1))
+        self.assertEqual(linha.num_lotes, 2)
+        self.assertEqual(linha.validade_status, "expired")
+
+    def test_escrita_marca_janela_de_leitura_propria(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("home"))
+        self.assertNotIn(COOKIE_ESCRITA, response.cookies)
+
+        response = self.client.post(
+            reverse("saida_reagente"),
+            data={
+                "chave_idempotencia": uuid.uuid4(),
+                "reagente": self.reagente.id,
+                "coordenacao": self.coord_a.id,
+                "quantidade": 1,
+                "requisitante": "Fulano",
+                "observacao": "",
+            },
+        )
+        self.assertIn(COOKIE_ESCRITA, response.cookies)
+
+    def test_busca_repetida_usa_cache_ate_nova_escrita(self):
+        self.client.force_login(self.admin_user)
+
+        response = self.client.get(reverse("home"), data={"search": "ACETONA"})
+        self.assertEqual(list(response.context["linhas"]), [self.reagente_rc_a])
+        self.client.get(reverse("home"), data={"search": "acetona "})
+        self.assertEqual(cache_busca.estatisticas()["acertos"], 1)
+        # A ordenacao nao muda os IDs encontrados: mesma entrada do cache.
+        self.client.get(reverse("home"), data={"search": "acetona", "ordenar": "validade"})
+        self.assertEqual(cache_busca.estatisticas()["acertos"], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ReagenteCoordenacao.objects.filter(pk=self.reagente_rc_b_zero.pk).update(quantidade=2)
+            self.reagente_rc_b_zero.refresh_from_db()
+            self.reagente_rc_b_zero.save()
+        response = self.client.get(reverse("home"), data={"search": "acetona"})
+        self.assertEqual(len(response.context["linhas"]), 2)
+        self.assertEqual(cache_busca.estatisticas()["falhas"], 2)
+
+    def test_busca_em_cache_calculada_no_principal_mesmo_na_replica(self):
+        documentos = DocumentoBusca.objects.filter(tipo=DocumentoBusca.TIPO_ESTOQUE, texto__contains="acetona")
+        # Qualquer leitura roteada para a replica falharia: o alias nao existe.
+        with mock.patch.object(ReplicaRouter, "db_for_read", return_value="replica_inexistente"):
+            ids = _ids_em_cache(("teste", versao_dados()), documentos)
+        self.assertIn(self.reagente_rc_a.pk, ids)
+
+    def test_documentos_de_busca_acompanham_renomeacao(self):
+        saida = SaidaReagente.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, requisitante="José", quantidade=1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reagente.reagente_nome = "Ácido Sulfúrico"
+            self.reagente.save()
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("historico_saida"), data={"search": "acido sulf"})
+        self.assertEqual(list(response.context["saidas"]), [saida])
+        response = self.client.get(reverse("historico_saida"), data={"search": "jose"})
+        self.assertEqual(list(response.context["saidas"]), [saida])
+        response = self.client.get(reverse("home"), data={"search": "acetona"})
+        self.assertEqual(list(response.context["linhas"]), [])
+
+    def test_reconstruir_busca_regenera_documentos(self):
+        DocumentoBusca.objects.all().delete()
+        call_command("reconstruir_busca", stdout=StringIO())
+        self.assertEqual(
+            DocumentoBusca.objects.filter(tipo=DocumentoBusca.TIPO_ESTOQUE).count(),
+            ReagenteCoordenacao.objects.count(),
+        )
+        documento = DocumentoBusca.objects.get(tipo=DocumentoBusca.TIPO_ESTOQUE, objeto_id=self.reagente_rc_a.pk)
+        self.assertEqual(documento.texto, "acetona\nf-001\ncontrolador x\ncoord a")
+
+    def test_painel_json_agrupa_por_coordenacao_no_escopo(self):
+        cache.clear()
+        # Troca o lote criado junto com o estoque por lotes de validades diferentes.
+        Lote.objects.filter(reagente=self.reagente).delete()
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2020, 1, 1), quantidade=4
+        )
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, validade=date(2031, 1, 1), quantidade=6
+        )
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_b, validade=date(2031, 1, 1), quantidade=1
+        )
+        SaidaReagente.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_a, requisitante="Fulano", quantidade=2
+        )
+
+        self.client.force_login(self.admin_user)
+        # sessao, usuario, perfil, as duas consultas agrupadas e os totais distintos
+        with self.assertNumQueries(6):
+            dados = self.client.get(reverse("painel_json")).json()
+        linha_a = next(l for l in dados["coordenacoes"] if l["coordenacao_id"] == self.coord_a.id)
+        self.assertEqual(linha_a["reagentes"], 1)
+        self.assertEqual(linha_a["vencidos"], 1)
+        self.assertEqual(linha_a["unidades"], 10)
+        self.assertEqual(linha_a["unidades_vencidas"], 4)
+        self.assertEqual(linha_a["saidas_30_dias"], 1)
+        self.assertEqual(dados["totais"]["unidades"], 11)
+        # Acetona esta nas duas coordenacoes: um reagente so no total.
+        self.assertEqual(dados["totais"]["reagentes"], 1)
+        self.assertEqual(dados["totais"]["vencidos"], 1)
+
+        self.client.force_login(self.coord_user)
+        dados = self.client.get(reverse("painel_json")).json()
+        self.assertEqual([l["coordenacao_id"] for l in dados["coordenacoes"]], [self.coord_a.id])
+
+        response = self.client.get(reverse("painel"))
+        self.assertContains(response, "Coord A")
+
+    def test_painel_ignora_estoque_de_reagente_inativo(self):
+        cache.clear()
+        inativo = Reagente.objects.create(
+            reagente_nome="Benzeno",
+            fispq="F-009",
+            controlador=self.controlador,
+            armario="A9",
+            validade=date(2020, 1, 1),
+            ativo=False,
+        )
+        Lote.objects.create(reagente=inativo, coordenacao=self.coord_a, validade=date(2020, 1, 1), quantidade=7)
+
+        self.client.force_login(self.admin_user)
+        dados = self.client.get(reverse("painel_json")).json()
+        linha_a = next(l for l in dados["coordenacoes"] if l["coordenacao_id"] == self.coord_a.id)
+        self.assertEqual(linha_a["reagentes"], 1)
+        self.assertEqual(linha_a["unidades_vencidas"], 0)
+        self.assertEqual(dados["totais"]["reagentes"], 1)
+        self.assertEqual(dados["totais"]["vencidos"], 0)
+
     def test_home_filtra_quantidade_zero(self):
         self.client.force_login(self.admin_user)
         response = self.client.get(reverse("home"))
@@ -142,22 +420,26 @@ class ReagentesViewTests(TestCase):
             validade=date(2031, 1, 1),
         )
         reagente_com_acento = Reagente.objects.create(
-            reagente_nome="Alcool 46",
+            reagente_nome="\u00c1lcool 46",
             fispq="F-003",
             controlador=self.controlador,
             armario="A3",
             validade=date(2031, 1, 1),
         )
-        ReagenteCoordenacao.objects.create(
-            reagente=reagente_sem_acento,
-            coordenacao=self.coord_a,
-            quantidade=5,
-        )
-        ReagenteCoordenacao.objects.create(
-            reagente=reagente_com_acento,
-            coordenacao=self.coord_a,
-            quantidade=5,
+        # Sem dobrar acentos, "Benzeno" cairia entre "Alcool" e "\u00c1lcool".
+        benzeno = Reagente.objects.create(
+            reagente_nome="Benzeno",
+            fispq="F-004",
+            controlador=self.controlador,
+            armario="A4",
+            validade=date(2031, 1, 1),
         )
+        for reagente in (reagente_sem_acento, reagente_com_acento, benzeno):
+            ReagenteCoordenacao.objects.create(
+                reagente=reagente,
+                coordenacao=self.coord_a,
+                quantidade=5,
+            )
 
         self.client.force_login(self.admin_user)
         response = self.client.get(reverse("home"), data={"ordenar": "nome"})
@@ -165,9 +447,165 @@ class ReagentesViewTests(TestCase):
 
         nomes = [item.reagente.reagente_nome for item in response.context["linhas"]]
         idx_sem = nomes.index("Alcool 70")
-        idx_com = nomes.index("Alcool 46")
+        idx_com = nomes.index("\u00c1lcool 46")
         self.assertEqual(abs(idx_sem - idx_com), 1)
 
+        for reagente in (benzeno, reagente_com_acento, reagente_sem_acento):
+            registrar_saida(reagente, self.coord_a, "Fulano", 1)
+        response = self.client.get(reverse("historico_saida"), data={"ordenar": "nome"})
+        nomes = [saida.reagente.reagente_nome for saida in response.context["saidas"]]
+        self.assertEqual(nomes, ["\u00c1lcool 46", "Alcool 70", "Benzeno"])
+
+    def _saidas_datadas(self):
+        saidas = {}
+        for requisitante, dias in (("Recente", 2), ("Mes passado", 40), ("Antiga", 200)):
+            saida = SaidaReagente.objects.create(
+                reagente=self.reagente,
+                coordenacao=self.coord_a,
+                requisitante=requisitante,
+                quantidade=1,
+            )
+            SaidaReagente.objects.filter(pk=saida.pk).update(data_saida=timezone.now() - timedelta(days=dias))
+            saidas[requisitante] = saida
+        indexar_saidas()
+        return saidas
+
+    def test_historico_filtra_por_periodo_e_datas(self):
+        self._saidas_datadas()
+        self.client.force_login(self.admin_user)
+
+        def requisitantes(**params):
+            response = self.client.get(reverse("historico_saida"), data=params)
+            return [saida.requisitante for saida in response.context["saidas"]]
+
+        self.assertEqual(requisitantes(periodo="7"), ["Recente"])
+        self.assertEqual(requisitantes(periodo="90"), ["Recente", "Mes passado"])
+        hoje = timezone.localdate()
+        self.assertEqual(
+            requisitantes(
+                data_de=(hoje - timedelta(days=60)).isoformat(),
+                data_ate=(hoje - timedelta(days=30)).isoformat(),
+            ),
+            ["Mes passado"],
+        )
+        self.assertEqual(requisitantes(data_de="invalida"), ["Recente", "Mes passado", "Antiga"])
+        self.assertEqual(requisitantes(data_ate="9999-12-31"), ["Recente", "Mes passado", "Antiga"])
+        self.assertEqual(requisitantes(data_de="0001-01-01"), ["Recente", "Mes passado", "Antiga"])
+
+    def test_historico_periodo_restringe_a_busca(self):
+        self._saidas_datadas()
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("historico_saida"), data={"search": "acetona", "periodo": "30"})
+        self.assertEqual([saida.requisitante for saida in response.context["saidas"]], ["Recente"])
+
+    def test_historico_periodo_usa_indice_com_coordenacao(self):
+        plano = (
+            SaidaReagente.objects.filter(coordenacao_id=self.coord_a.id, data_saida__gte=timezone.now())
+            .order_by("-data_saida")
+            .explain()
+        )
+        self.assertIn("saida_coord_data_idx", plano)
+        plano = SaidaReagente.objects.filter(data_saida__gte=timezone.now()).explain()
+        self.assertIn("saida_data_idx", plano)
+
+
+class ReposicaoEstoqueTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        self.controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=self.controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        self.rc_a = ReagenteCoordenacao.objects.create(
+            reagente=self.reagente,
+            coordenacao=self.coord_a,
+            quantidade=10,
+        )
+
+        self.admin_user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=self.admin_user, tipo="admin", coordenacao=None)
+
+        self.coord_user = User.objects.create_user(username="coord_user", password="123456789")
+        Perfil.objects.create(user=self.coord_user, tipo="coord", coordenacao=self.coord_a)
+
+    def test_coord_nao_pode_acessar_reposicao(self):
+        self.client.force_login(self.coord_user)
+        response = self.client.get(reverse("reposicao_estoque"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_reposicao_incrementa_existente_e_cria_nova(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.post(
+            reverse("reposicao_estoque"),
+            data={
+                "form-TOTAL_FORMS": "3",
+                "form-INITIAL_FORMS": "0",
+                "form-0-reagente": self.reagente.id,
+                "form-0-coordenacao": self.coord_a.id,
+                "form-0-quantidade": "5",
+                "form-1-reagente": self.reagente.id,
+                "form-1-coordenacao": self.coord_b.id,
+                "form-1-quantidade": "4",
+                "form-2-reagente": self.reagente.id,
+                "form-2-coordenacao": self.coord_a.id,
+                "form-2-quantidade": "1",
+                "observacao": "Compra 42",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse("home"))
+
+        self.rc_a.refresh_from_db()
+        self.assertEqual(self.rc_a.quantidade, 16)
+        rc_b = ReagenteCoordenacao.objects.get(reagente=self.reagente, coordenacao=self.coord_b)
+        self.assertEqual(rc_b.quantidade, 4)
+        self.assertEqual(EntradaReagente.objects.filter(observacao="Compra 42").count(), 3)
+
+    def test_reposicao_json(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.post(
+            reverse("reposicao_estoque"),
+            data={"linhas": [{"reagente": self.reagente.id, "coordenacao": self.coord_a.id, "quantidade": 2}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["atualizados"], 1)
+        self.rc_a.refresh_from_db()
+        self.assertEqual(self.rc_a.quantidade, 12)
+
+        response = self.client.post(
+            reverse("reposicao_estoque"),
+            data={"linhas": [{"reagente": self.reagente.id, "coordenacao": self.coord_a.id, "quantidade": 0}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.rc_a.refresh_from_db()
+        self.assertEqual(self.rc_a.quantidade, 12)
+
+
+    def test_par_novo_gravado_por_outra_transacao_e_somado(self):
+        bulk_create = QuerySet.bulk_create
+
+        def concorrente(queryset, objs, *args, **kwargs):
+            if queryset.model is ReagenteCoordenacao:
+                # Outra transacao grava o mesmo par entre a leitura e o INSERT.
+                ReagenteCoordenacao.objects.create(reagente=self.reagente, coordenacao=self.coord_b, quantidade=3)
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "bulk_create", autospec=True, side_effect=concorrente):
+            resultado = registrar_entradas([(self.reagente.pk, self.coord_b.pk, 5)])
+
+        self.assertEqual(resultado["linhas"], 1)
+        rc_b = ReagenteCoordenacao.objects.get(reagente=self.reagente, coordenacao=self.coord_b)
+        self.assertEqual(rc_b.quantidade, 8)
+        self.assertEqual(Lote.objects.get(reagente=self.reagente, coordenacao=self.coord_b).quantidade, 8)
+        self.reagente.refresh_from_db()
+        self.assertEqual(self.reagente.quantidade_total, 18)
 
 class ReagentesFormValidationTests(TestCase):
     def setUp(self):
@@ -245,3 +683,1270 @@ class ReagentesFormValidationTests(TestCase):
             instance=parent,
         )
         self.assertFalse(formset.is_valid())
+
+
+class CargaSqliteCommandTests(TestCase):
+    def test_comando_compara_perfis(self):
+        saida = StringIO()
+        call_command("carga_sqlite", processos=2, duracao=0.2, stdout=saida)
+        linhas = saida.getvalue().splitlines()
+        self.assertEqual([linha.split()[0] for linha in linhas[1:]], ["padrao", "otimizado"])
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_leituras_vao_para_replica_apenas_no_contexto(self):
+        router = ReplicaRouter()
+        with mock.patch.dict(settings.DATABASES, {"replica": {"ENGINE": "django.db.backends.sqlite3"}}):
+            self.assertEqual(router.db_for_read(Reagente), "default")
+            with usar_replica():
+                self.assertEqual(router.db_for_read(Reagente), "replica")
+                self.assertEqual(router.db_for_read(Session), "default")
+                self.assertEqual(router.db_for_write(Reagente), "default")
+
+    def test_sem_replica_configurada_usa_principal(self):
+        with usar_replica():
+            self.assertEqual(ReplicaRouter().db_for_read(Reagente), "default")
+
+
+class CacheBuscaTests(SimpleTestCase):
+    def test_lru_descarta_menos_usado_e_conta_acertos(self):
+        cache = CacheBusca(tamanho=2)
+        cache.obter("a", lambda: [1])
+        cache.obter("b", lambda: [2])
+        self.assertEqual(cache.obter("a", lambda: [99]), [1])
+        cache.obter("c", lambda: [3])
+        self.assertEqual(cache.obter("b", lambda: [20]), [20])
+
+        estatisticas = cache.estatisticas()
+        self.assertEqual(estatisticas["acertos"], 1)
+        self.assertEqual(estatisticas["falhas"], 4)
+        self.assertEqual(estatisticas["itens"], 2)
+
+
+class VersaoDadosTests(TestCase):
+    def test_escrita_confirmada_incrementa_versao(self):
+        versao = versao_dados()
+        with self.captureOnCommitCallbacks(execute=True):
+            Coordenacao.objects.create(nome="Coord Nova")
+        self.assertGreater(versao_dados(), versao)
+
+
+class CadastrosEmCacheTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+
+    def test_lista_sem_consultas_ate_um_cadastro_mudar(self):
+        self.assertEqual(cadastros.coordenacoes.listar(), (self.coord_a,))
+        with self.assertNumQueries(0):
+            self.assertEqual(cadastros.coordenacoes.obter(self.coord_a.pk), self.coord_a)
+
+        coord_b = Coordenacao.objects.create(nome="Coord B")
+        self.assertEqual(cadastros.coordenacoes.listar(), (self.coord_a, coord_b))
+
+    def test_versao_compartilhada_invalida_outros_processos(self):
+        cadastros.coordenacoes.listar()
+        # Outro processo gravou: so a versao no cache compartilhado muda.
+        Coordenacao.objects.filter(pk=self.coord_a.pk).update(nome="Coord Renomeada")
+        incrementar_versao_cadastros()
+        self.assertEqual(cadastros.coordenacoes.obter(self.coord_a.pk).nome, "Coord Renomeada")
+
+    def test_ttl_limita_idade_da_lista(self):
+        cadastros.coordenacoes.listar()
+        Coordenacao.objects.filter(pk=self.coord_a.pk).update(nome="Coord Renomeada")
+        with self.settings(CADASTROS_CACHE_TTL=0):
+            self.assertEqual(cadastros.coordenacoes.obter(self.coord_a.pk).nome, "Coord Renomeada")
+
+    def test_campo_do_formulario_valida_pela_memoria(self):
+        reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=Controlador.objects.create(nome="Controlador X"),
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        cadastros.coordenacoes.listar()
+        dados = {
+            "reagente": reagente.pk,
+            "requisitante": "Fulano",
+            "quantidade": 1,
+            "chave_idempotencia": uuid.uuid4(),
+        }
+        with self.assertNumQueries(1):
+            form = SaidaReagenteForm({**dados, "coordenacao": self.coord_a.pk})
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["coordenacao"], self.coord_a)
+        self.assertIn(f'value="{self.coord_a.pk}"', str(form["coordenacao"]))
+
+        form = SaidaReagenteForm({**dados, "coordenacao": 999})
+        self.assertFalse(form.is_valid())
+        self.assertIn("coordenacao", form.errors)
+
+    def test_pk_fora_da_memoria_e_conferido_no_banco(self):
+        cadastros.coordenacoes.listar()
+        # Outro processo criou a coordenacao e a versao nova ainda nao chegou.
+        coord_b = Coordenacao.objects.bulk_create([Coordenacao(nome="Coord B")])[0]
+        with self.assertNumQueries(1):
+            self.assertEqual(cadastros.coordenacoes.obter(coord_b.pk), coord_b)
+        self.assertEqual(cadastros.coordenacoes.listar(), (self.coord_a, coord_b))
+
+    def test_check_recusa_cache_sem_incr_atomico(self):
+        for backend in ("filebased.FileBasedCache", "db.DatabaseCache"):
+            with self.subTest(backend=backend), self.settings(
+                CACHES={"default": {"BACKEND": f"django.core.cache.backends.{backend}", "LOCATION": "x"}}
+            ):
+                self.assertEqual([erro.id for erro in checar_cache_das_versoes(None)], ["reagents.E001"])
+
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with self.settings(CACHES=locmem, DEBUG=False):
+            self.assertEqual([aviso.id for aviso in checar_cache_das_versoes(None)], ["reagents.W001"])
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://"}}
+        with self.settings(CACHES=redis, DEBUG=False):
+            self.assertEqual(checar_cache_das_versoes(None), [])
+
+
+class EstresseSaidaCommandTests(TransactionTestCase):
+    def _contagens(self, saida):
+        return {nome: int(valor) for nome, valor in re.findall(r"(ok|insuficiente|lock|outros erros): (\d+)", saida)}
+
+    def test_saidas_concorrentes_preservam_invariante(self):
+        saida = StringIO()
+        call_command("estresse_saida", threads=4, saidas=5, estoque_inicial=20, manter=True, stdout=saida)
+        saida = saida.getvalue()
+        self.assertIn("threads: 4  requisicoes: 20", saida)
+        self.assertEqual(self._contagens(saida), {"ok": 20, "insuficiente": 0, "lock": 0, "outros erros": 0})
+        self.assertIn("taxa de erro: 0.00%", saida)
+        self.assertEqual(SaidaReagente.objects.count(), 20)
+        # Com estoque para todas, cada thread reenvia a ultima saida com a mesma chave.
+        self.assertIn("reenvios ignorados: 4", saida)
+        self.assertIn("Invariante OK", saida)
+
+    def test_estoque_curto_recusa_o_excedente(self):
+        saida = StringIO()
+        call_command("estresse_saida", threads=4, saidas=5, manter=True, stdout=saida)
+        saida = saida.getvalue()
+        # Padrao: estoque para metade das saidas pedidas.
+        self.assertEqual(self._contagens(saida), {"ok": 10, "insuficiente": 10, "lock": 0, "outros erros": 0})
+        self.assertIn("taxa de erro: 0.00%", saida)
+        self.assertEqual(SaidaReagente.objects.count(), 10)
+        self.assertEqual(ReagenteCoordenacao.objects.get().quantidade, 0)
+        self.assertIn("Invariante OK", saida)
+
+    def test_nao_deixa_dados_nem_usuario_staff(self):
+        call_command("estresse_saida", threads=2, saidas=2, stdout=StringIO())
+        for model in (Reagente, Coordenacao, Controlador, Lote, EntradaReagente, SaidaReagente, User, Perfil):
+            with self.subTest(model=model.__name__):
+                self.assertFalse(model.objects.exists())
+
+
+class PerfilamentoMiddlewareTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="staff", password="123456789", is_staff=True, is_superuser=True)
+        self.coord = Coordenacao.objects.create(nome="Coord A")
+        self.coord_user = User.objects.create_user(username="coord_user", password="123456789")
+        Perfil.objects.create(user=self.coord_user, tipo="coord", coordenacao=self.coord)
+
+    def test_staff_com_parametro_gera_captura(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse("home"))
+        self.assertFalse(CapturaPerfil.objects.exists())
+
+        self.client.get(reverse("home"), data={"_perfil": "1"})
+        captura = CapturaPerfil.objects.get()
+        self.assertEqual(captura.view_nome, "home")
+        self.assertIn("cumulative", captura.top_funcoes)
+
+        response = self.client.get(reverse("admin:reagents_capturaperfil_changelist"))
+        self.assertContains(response, "home")
+        response = self.client.get(reverse("admin:reagents_capturaperfil_download", args=[captura.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_nao_staff_nao_e_perfilado(self):
+        self.client.force_login(self.coord_user)
+        self.client.get(reverse("home"), data={"_perfil": "1"})
+        self.assertFalse(CapturaPerfil.objects.exists())
+
+
+class BackupRestoreCommandTests(TestCase):
+    def setUp(self):
+        coord = Coordenacao.objects.create(nome="Coordenação A")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        # O lote de 7 com a validade do reagente vem do signal do estoque.
+        ReagenteCoordenacao.objects.create(reagente=self.reagente, coordenacao=coord, quantidade=7)
+        EntradaReagente.objects.create(reagente=self.reagente, coordenacao=coord, quantidade=10)
+        saida = SaidaReagente.objects.create(
+            reagente=self.reagente, coordenacao=coord, requisitante="Fulano", quantidade=3
+        )
+        SaidaReagente.objects.filter(pk=saida.pk).update(data_saida=datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc))
+
+    def _apagar_tudo(self):
+        DocumentoBusca.objects.all().delete()
+        SaidaReagente.objects.all().delete()
+        EntradaReagente.objects.all().delete()
+        Reagente.objects.all().delete()
+        Controlador.objects.all().delete()
+        Coordenacao.objects.all().delete()
+
+    def test_backup_e_restore_preservam_dados(self):
+        antes = list(SaidaReagente.objects.values())
+        with tempfile.TemporaryDirectory() as pasta:
+            call_command("backup_estoque", pasta, stdout=StringIO())
+            self.assertTrue(os.path.exists(os.path.join(pasta, "reagents.saidareagente.jsonl.gz")))
+
+            with self.assertRaises(Exception):
+                call_command("restore_estoque", pasta, stdout=StringIO())
+
+            self._apagar_tudo()
+            call_command("restore_estoque", pasta, lote=2, stdout=StringIO())
+            self.assertFalse(os.path.exists(os.path.join(pasta, "progresso.json")))
+
+        self.assertEqual(list(SaidaReagente.objects.values()), antes)
+        self.assertEqual(ReagenteCoordenacao.objects.get().quantidade, 7)
+        self.assertEqual(Reagente.objects.get().reagente_nome, "Acetona")
+        self.assertEqual(DocumentoBusca.objects.count(), 2)
+
+    def test_restore_retoma_de_onde_parou(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            call_command("backup_estoque", pasta, stdout=StringIO())
+            # Simula uma restauracao interrompida antes das entradas e saidas.
+            DocumentoBusca.objects.all().delete()
+            SaidaReagente.objects.all().delete()
+            EntradaReagente.objects.all().delete()
+            with open(os.path.join(pasta, "progresso.json"), "w") as arquivo:
+                arquivo.write(
+                    '{"reagents.coordenacao": 1, "reagents.controlador": 1, "reagents.reagente": 1, '
+                    '"reagents.reagentecoordenacao": 1, "reagents.lote": 1}'
+                )
+
+            saida = StringIO()
+            call_command("restore_estoque", pasta, retomar=True, stdout=saida)
+
+        self.assertIn("retomado apos 1", saida.getvalue())
+        self.assertEqual(Reagente.objects.count(), 1)
+        self.assertEqual(EntradaReagente.objects.count(), 1)
+        self.assertEqual(SaidaReagente.objects.count(), 1)
+
+    def test_restore_retomado_pula_lote_gravado_sem_progresso(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            call_command("backup_estoque", pasta, stdout=StringIO())
+            # Caiu depois do commit das entradas e antes de gravar o progresso delas.
+            DocumentoBusca.objects.all().delete()
+            SaidaReagente.objects.all().delete()
+            with open(os.path.join(pasta, "progresso.json"), "w") as arquivo:
+                arquivo.write('{"reagents.coordenacao": 1, "reagents.controlador": 1}')
+
+            call_command("restore_estoque", pasta, retomar=True, stdout=StringIO())
+
+        self.assertEqual(Reagente.objects.count(), 1)
+        self.assertEqual(Lote.objects.get().quantidade, 7)
+        self.assertEqual(EntradaReagente.objects.count(), 1)
+        self.assertEqual(SaidaReagente.objects.count(), 1)
+
+
+class BackupSemLockDeEscritaTests(TransactionTestCase):
+    def test_backup_le_um_snapshot_sem_bloquear_escritas(self):
+        Coordenacao.objects.create(nome="Coord A")
+        gzip_open = gzip.open
+        arquivos = []
+        escritas = []
+
+        def escrever_outra_conexao():
+            try:
+                Controlador.objects.create(nome="Gravado durante o backup")
+                escritas.append("ok")
+            finally:
+                connection.close()
+
+        def abrir(caminho, *args, **kwargs):
+            arquivos.append(caminho)
+            if len(arquivos) == 2:
+                # Coordenacao ja foi lida: o snapshot existe; outra conexao grava.
+                thread = threading.Thread(target=escrever_outra_conexao)
+                thread.start()
+                thread.join(timeout=5)
+                self.assertFalse(thread.is_alive(), "escrita presa no lock do backup")
+            return gzip_open(caminho, *args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as pasta:
+            with mock.patch("reagents.management.commands.backup_estoque.gzip.open", side_effect=abrir):
+                call_command("backup_estoque", pasta, stdout=StringIO())
+            with open(os.path.join(pasta, "manifesto.json")) as arquivo:
+                manifesto = json.load(arquivo)
+
+        self.assertEqual(escritas, ["ok"])
+        self.assertEqual(manifesto["modelos"]["reagents.controlador"], 0)
+        self.assertTrue(Controlador.objects.exists())
+
+
+class AlertasValidadeCommandTests(TestCase):
+    def setUp(self):
+        self.hoje = date(2026, 3, 1)
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        for coordenacao, dias in ((self.coord_a, -5), (self.coord_a, 10), (self.coord_a, 60), (self.coord_b, 200)):
+            Lote.objects.create(
+                reagente=self.reagente,
+                coordenacao=coordenacao,
+                validade=self.hoje + timedelta(days=dias),
+                quantidade=3,
+            )
+        usuario = User.objects.create_user(username="coord_a", password="123", email="a@example.com")
+        Perfil.objects.create(user=usuario, tipo="coord", coordenacao=self.coord_a)
+
+    def test_envia_um_resumo_por_coordenacao_com_lotes_na_faixa(self):
+        with self.assertNumQueries(2):
+            call_command("alertas_validade", data=self.hoje, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        mensagem = mail.outbox[0]
+        self.assertEqual(mensagem.to, ["a@example.com"])
+        self.assertIn("Coord A", mensagem.subject)
+        self.assertIn("Vencidos (1):", mensagem.body)
+        self.assertIn("Vencem em ate 30 dias (1):", mensagem.body)
+        self.assertIn("Vencem em ate 90 dias (1):", mensagem.body)
+
+    def test_destinatarios_globais_recebem_todas_as_coordenacoes(self):
+        Lote.objects.create(
+            reagente=self.reagente, coordenacao=self.coord_b, validade=self.hoje, quantidade=1
+        )
+        with self.settings(ALERTAS_VALIDADE_DESTINATARIOS=["almox@example.com"]):
+            call_command("alertas_validade", data=self.hoje, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, ["almox@example.com"])
+
+    def test_simular_nao_envia(self):
+        out = StringIO()
+        call_command("alertas_validade", data=self.hoje, simular=True, stdout=out)
+        self.assertEqual(mail.outbox, [])
+        self.assertIn("Acetona", out.getvalue())
+
+
+class ReconciliarCommandTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagentes = [
+            Reagente.objects.create(
+                reagente_nome=f"Reagente {i}",
+                fispq="F-001",
+                controlador=controlador,
+                armario="A1",
+                validade=date(2030, 1, 1),
+            )
+            for i in range(3)
+        ]
+        registrar_entradas(
+            [
+                (reagente.pk, coordenacao.pk, 10)
+                for reagente in self.reagentes
+                for coordenacao in (self.coord_a, self.coord_b)
+            ]
+        )
+        registrar_saida(self.reagentes[0], self.coord_a, "Fulano", 3)
+
+    def test_estoque_consistente(self):
+        out = StringIO()
+        call_command("reconciliar", lote=2, stdout=out)
+        self.assertIn("6 pares conferidos, 0 divergentes", out.getvalue())
+
+    def test_detecta_e_corrige_divergencia(self):
+        rc = ReagenteCoordenacao.objects.get(reagente=self.reagentes[0], coordenacao=self.coord_a)
+        ReagenteCoordenacao.objects.filter(pk=rc.pk).update(quantidade=99)
+
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command("reconciliar", lote=2, stdout=out)
+        self.assertIn("Reagente 0 / Coord A: estoque 99, entradas - saidas 7", out.getvalue())
+
+        call_command("reconciliar", lote=2, corrigir=True, stdout=StringIO())
+        rc.refresh_from_db()
+        self.assertEqual(rc.quantidade, 7)
+
+    def test_lotes_divergentes_sao_inconsistencia_e_corrigidos(self):
+        Lote.objects.update(quantidade=1)
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command("reconciliar", lote=2, stdout=out)
+        self.assertIn("Reagente 1 / Coord A: estoque 10, lotes 1", out.getvalue())
+        self.assertIn("Estoque inconsistente.", out.getvalue())
+
+        call_command("reconciliar", lote=2, corrigir=True, stdout=StringIO())
+        out = StringIO()
+        call_command("reconciliar", lote=2, stdout=out)
+        self.assertIn("Estoque consistente.", out.getvalue())
+        lotes = Lote.objects.filter(reagente=self.reagentes[0], coordenacao=self.coord_a)
+        self.assertEqual(sum(lotes.values_list("quantidade", flat=True)), 7)
+
+    def test_saldo_negativo_e_corrigido_com_entrada_de_ajuste(self):
+        SaidaReagente.objects.create(
+            reagente=self.reagentes[1], coordenacao=self.coord_b, requisitante="Fulano", quantidade=15
+        )
+        call_command("reconciliar", lote=2, corrigir=True, stdout=StringIO())
+
+        rc = ReagenteCoordenacao.objects.get(reagente=self.reagentes[1], coordenacao=self.coord_b)
+        self.assertEqual(rc.quantidade, 0)
+        self.assertTrue(EntradaReagente.objects.filter(reagente=self.reagentes[1], quantidade=5).exists())
+        out = StringIO()
+        call_command("reconciliar", lote=2, stdout=out)
+        self.assertIn("Estoque consistente.", out.getvalue())
+
+    def test_consultas_por_bloco_nao_dependem_do_numero_de_pares(self):
+        # Por bloco: ids dos reagentes, savepoint, estoques, entradas, saidas, lotes e release;
+        # mais a busca vazia final.
+        with self.assertNumQueries(2 * 7 + 1):
+            call_command("reconciliar", lote=2, stdout=StringIO())
+
+
+class LotesEstoqueTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=Controlador.objects.create(nome="Controlador X"),
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 10, date(2029, 1, 1))])
+        self.rc = ReagenteCoordenacao.objects.get(reagente=self.reagente, coordenacao=self.coord_a)
+
+    def _lotes(self):
+        return list(Lote.objects.filter(reagente=self.reagente).order_by("validade").values_list("validade", "quantidade"))
+
+    def test_estoque_editado_direto_ajusta_lotes(self):
+        self.rc.quantidade = 15
+        self.rc.save()
+        self.assertEqual(self._lotes(), [(date(2029, 1, 1), 10), (date(2030, 1, 1), 5)])
+
+        saida = registrar_saida(self.reagente, self.coord_a, "Fulano", 12)
+        self.assertEqual(saida.lotes, [(date(2029, 1, 1), 10), (date(2030, 1, 1), 2)])
+
+        self.rc.refresh_from_db()
+        self.rc.quantidade = 1
+        self.rc.save()
+        self.assertEqual(self._lotes(), [(date(2029, 1, 1), 0), (date(2030, 1, 1), 1)])
+
+    def test_saida_sem_lote_suficiente_e_desfeita(self):
+        Lote.objects.update(quantidade=4)
+        with self.assertRaises(EstoqueInsuficiente):
+            registrar_saida(self.reagente, self.coord_a, "Fulano", 6)
+        self.rc.refresh_from_db()
+        self.assertEqual(self.rc.quantidade, 10)
+        self.assertEqual(self._lotes(), [(date(2029, 1, 1), 4)])
+        self.assertFalse(SaidaReagente.objects.exists())
+
+    def test_home_marca_estoque_sem_lote(self):
+        Lote.objects.all().delete()
+        user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=user, tipo="admin", coordenacao=None)
+        self.client.force_login(user)
+        response = self.client.get(reverse("home"))
+        self.assertEqual(list(response.context["linhas"])[0].validade_status, "sem_lote")
+        self.assertContains(response, "sem lote")
+
+
+class TotaisReagenteTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=Controlador.objects.create(nome="Controlador X"),
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+
+    def test_entradas_e_saidas_atualizam_totais(self):
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 10), (self.reagente.pk, self.coord_b.pk, 5)])
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 2)])
+        saida = registrar_saida(self.reagente, self.coord_a, "Fulano", 4)
+
+        self.reagente.refresh_from_db()
+        self.assertEqual(self.reagente.quantidade_total, 13)
+        self.assertEqual(self.reagente.ultima_saida, saida.data_saida)
+
+    def test_registro_e_estoque_gravado_direto_atualizam_total(self):
+        admin_user = User.objects.create_superuser(username="admin", password="123456789")
+        self.client.force_login(admin_user)
+        self.client.post(
+            reverse("registro_reagente"),
+            data={
+                "reagente_nome": "Metanol",
+                "fispq": "F-099",
+                "controlador": self.reagente.controlador_id,
+                "armario": "A1",
+                "validade": "2031-01-01",
+                "reagentecoordenacao_set-TOTAL_FORMS": "2",
+                "reagentecoordenacao_set-INITIAL_FORMS": "0",
+                "reagentecoordenacao_set-0-coordenacao": self.coord_a.id,
+                "reagentecoordenacao_set-0-quantidade": "3",
+                "reagentecoordenacao_set-1-coordenacao": self.coord_b.id,
+                "reagentecoordenacao_set-1-quantidade": "4",
+            },
+        )
+        metanol = Reagente.objects.get(reagente_nome="Metanol")
+        self.assertEqual(metanol.quantidade_total, 7)
+
+        # Mesmo caminho do inline do admin: save() direto no estoque.
+        rc = ReagenteCoordenacao.objects.get(reagente=metanol, coordenacao=self.coord_b)
+        rc.quantidade = 10
+        rc.save()
+        metanol.refresh_from_db()
+        self.assertEqual(metanol.quantidade_total, 13)
+
+        rc.delete()
+        metanol.refresh_from_db()
+        self.assertEqual(metanol.quantidade_total, 3)
+
+    def test_total_defasado_nao_barra_saida(self):
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 10)])
+        ReagenteCoordenacao.objects.update(quantidade=15)
+        Lote.objects.update(quantidade=15)
+
+        registrar_saida(self.reagente, self.coord_a, "Fulano", 12)
+        self.reagente.refresh_from_db()
+        self.assertEqual(self.reagente.quantidade_total, 3)
+
+    def test_comando_corrige_totais(self):
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 10)])
+        registrar_saida(self.reagente, self.coord_a, "Fulano", 1)
+        Reagente.objects.update(quantidade_total=0, ultima_saida=None)
+
+        call_command("recalcular_totais", lote=1, stdout=StringIO())
+        self.reagente.refresh_from_db()
+        self.assertEqual(self.reagente.quantidade_total, 9)
+        self.assertIsNotNone(self.reagente.ultima_saida)
+        with self.assertNumQueries(1):
+            recalcular_totais(Reagente.objects.all())
+
+
+class AtivacaoReagenteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagentes = [
+            Reagente.objects.create(
+                reagente_nome=f"Reagente {i}",
+                fispq="F-001",
+                controlador=controlador,
+                armario="A1",
+                validade=date(2020, 1, 1) if i < 2 else date(2030, 1, 1),
+            )
+            for i in range(3)
+        ]
+        registrar_entradas([(self.reagentes[0].pk, self.coord_a.pk, 5), (self.reagentes[0].pk, self.coord_b.pk, 3)])
+        self.admin_user = User.objects.create_superuser(username="admin", password="123456789")
+        self.client.force_login(self.admin_user)
+
+    def _acao(self, acao, reagentes):
+        return self.client.post(
+            reverse("admin:reagents_reagente_changelist"),
+            {"action": acao, "_selected_action": [r.pk for r in reagentes]},
+            follow=True,
+        )
+
+    def test_desativar_e_reativar_em_um_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._acao("desativar", self.reagentes)
+        self.assertFalse(Reagente.objects.filter(ativo=True).exists())
+
+        response = self.client.get(reverse("saida_reagente"))
+        self.assertNotContains(response, "Reagente 0")
+        self.assertEqual(matriz_disponibilidade(), {})
+
+        self._acao("reativar", self.reagentes[:1])
+        self.assertEqual(list(Reagente.objects.filter(ativo=True)), self.reagentes[:1])
+
+    def test_lotes_aparecem_so_leitura_no_admin(self):
+        response = self.client.get(reverse("admin:reagents_reagente_change", args=[self.reagentes[0].pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'name="lotes-TOTAL_FORMS" value="2"')
+        self.assertNotContains(response, 'name="lotes-0-quantidade"')
+        self.assertNotContains(response, 'name="lotes-0-DELETE"')
+        self.assertNotContains(response, 'name="lotes-__prefix__-validade"')
+
+    def test_zerar_estoque_registra_ajuste(self):
+        response = self._acao("zerar", self.reagentes)
+        self.assertContains(response, "Estoque zerado em 2 par(es)")
+
+        self.assertFalse(ReagenteCoordenacao.objects.filter(quantidade__gt=0).exists())
+        self.assertFalse(Lote.objects.filter(quantidade__gt=0).exists())
+        self.assertEqual(Reagente.objects.get(pk=self.reagentes[0].pk).quantidade_total, 0)
+        ajustes = SaidaReagente.objects.filter(requisitante="Ajuste (admin)")
+        self.assertEqual(sorted(ajustes.values_list("quantidade", flat=True)), [3, 5])
+
+        out = StringIO()
+        call_command("reconciliar", stdout=out)
+        self.assertIn("Estoque consistente.", out.getvalue())
+
+    def test_desativar_esgotados(self):
+        registrar_saida(self.reagentes[0], self.coord_a, "Fulano", 5)
+        registrar_saida(self.reagentes[0], self.coord_b, "Fulano", 3)
+        registrar_entradas([(self.reagentes[1].pk, self.coord_a.pk, 1)])
+
+        out = StringIO()
+        call_command("desativar_esgotados", data=date(2025, 1, 1), stdout=out)
+        self.assertIn("1 reagente(s) desativados.", out.getvalue())
+        self.assertEqual(
+            list(Reagente.objects.filter(ativo=False).values_list("pk", flat=True)), [self.reagentes[0].pk]
+        )
+        plano = Reagente.objects.filter(ativo=True, validade__lt=date(2025, 1, 1), quantidade_total=0).explain()
+        self.assertIn("reagente_ativo_idx", plano)
+
+
+class SimilaridadeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.controlador = Controlador.objects.create(nome="Controlador X")
+        self.coordenacao = Coordenacao.objects.create(nome="Coord A")
+        for nome, fispq in (("Acetona", "F-001"), ("Acido Sulfurico", "F-002"), ("Etanol", "F-003")):
+            Reagente.objects.create(
+                reagente_nome=nome,
+                fispq=fispq,
+                controlador=self.controlador,
+                armario="A1",
+                validade=date(2030, 1, 1),
+            )
+
+    def _form(self, nome, fispq, **extra):
+        return ReagenteForm(
+            data={
+                "reagente_nome": nome,
+                "fispq": fispq,
+                "controlador": self.controlador.id,
+                "armario": "A1",
+                "validade": "2030-01-01",
+                **extra,
+            }
+        )
+
+    def test_form_aponta_nome_parecido_e_pede_confirmacao(self):
+        for nome in ("acetona P.A.", "ACETONA ", "Acetôna"):
+            with self.subTest(nome=nome):
+                form = self._form(nome, "X-9")
+                self.assertFalse(form.is_valid())
+                self.assertEqual([n for _, _, n in form.duplicatas_provaveis], ["Acetona"])
+                self.assertIn("confirmar_duplicata", form.errors)
+                self.assertTrue(self._form(nome, "X-9", confirmar_duplicata="on").is_valid())
+
+        form = self._form("Metanol", "X-9")
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.duplicatas_provaveis, [])
+
+    def test_form_aponta_fispq_igual(self):
+        form = self._form("Outro Nome", "f 002")
+        self.assertFalse(form.is_valid())
+        self.assertEqual([n for _, _, n in form.duplicatas_provaveis], ["Acido Sulfurico"])
+
+    def test_indice_reaproveitado_ate_o_catalogo_mudar(self):
+        indice = indice_similaridade()
+        with self.assertNumQueries(0):
+            self.assertIs(indice_similaridade(), indice)
+        with self.captureOnCommitCallbacks(execute=True):
+            SaidaReagente.objects.create(
+                reagente=Reagente.objects.get(reagente_nome="Etanol"),
+                coordenacao=self.coordenacao,
+                requisitante="Fulano",
+                quantidade=1,
+            )
+        self.assertIs(indice_similaridade(), indice)
+        with self.captureOnCommitCallbacks(execute=True):
+            Reagente.objects.filter(reagente_nome="Etanol").first().save()
+        self.assertIsNot(indice_similaridade(), indice)
+
+    def test_registro_com_duplicata_exige_confirmacao(self):
+        user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=user, tipo="admin", coordenacao=None)
+        self.client.force_login(user)
+        data = {
+            "reagente_nome": "Acetona PA",
+            "fispq": "F-010",
+            "controlador": self.controlador.id,
+            "armario": "A2",
+            "validade": "2031-01-01",
+            "reagentecoordenacao_set-TOTAL_FORMS": "1",
+            "reagentecoordenacao_set-INITIAL_FORMS": "0",
+            "reagentecoordenacao_set-0-coordenacao": self.coordenacao.id,
+            "reagentecoordenacao_set-0-quantidade": "3",
+        }
+        response = self.client.post(reverse("registro_reagente"), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Possivel duplicata de reagente ja cadastrado: Acetona")
+        self.assertContains(response, 'type="checkbox" name="confirmar_duplicata"')
+        self.assertFalse(Reagente.objects.filter(reagente_nome="Acetona PA").exists())
+
+        response = self.client.post(reverse("registro_reagente"), data={**data, "confirmar_duplicata": "on"})
+        self.assertRedirects(response, reverse("home"))
+        self.assertTrue(Reagente.objects.filter(reagente_nome="Acetona PA").exists())
+
+    def test_agrupar_duplicatas(self):
+        Reagente.objects.create(
+            reagente_nome="acetona p.a.",
+            fispq="F-100",
+            controlador=self.controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        Reagente.objects.create(
+            reagente_nome="Etanol Absoluto",
+            fispq="F-003",
+            controlador=self.controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        cache.clear()
+        out = StringIO()
+        call_command("agrupar_duplicatas", stdout=out)
+        saida = out.getvalue()
+        self.assertIn("2 grupo(s) de possiveis duplicatas em 5 reagentes.", saida)
+        self.assertIn("acetona p.a.", saida)
+        self.assertIn("Etanol Absoluto", saida)
+
+
+class RelatorioTarefaTests(TestCase):
+    def setUp(self):
+        # Dentro da transacao do TestCase o close_old_connections do worker
+        # fecharia a conexao do banco de teste (que e um arquivo).
+        fechar = mock.patch("reagents.management.commands.worker.close_old_connections")
+        fechar.start()
+        self.addCleanup(fechar.stop)
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 10)])
+        registrar_saida(self.reagente, self.coord_a, "Fulano", 2)
+
+        self.admin_user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=self.admin_user, tipo="admin", coordenacao=None)
+        self.outro_admin = User.objects.create_user(username="outro_admin", password="123456789")
+        Perfil.objects.create(user=self.outro_admin, tipo="admin", coordenacao=None)
+
+    def _pedir(self, usuario):
+        self.client.force_login(usuario)
+        response = self.client.post(reverse("gerar_relatorio"), {"coordenacao": self.coord_a.pk})
+        self.assertEqual(response.status_code, 302)
+        return TarefaRelatorio.objects.filter(solicitante=usuario).first()
+
+    def test_worker_gera_arquivo_e_download(self):
+        tarefa = self._pedir(self.admin_user)
+        self.assertEqual(tarefa.status, TarefaRelatorio.PENDENTE)
+
+        call_command("worker", uma_vez=True, stdout=StringIO())
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, TarefaRelatorio.CONCLUIDA)
+        self.assertEqual(tarefa.progresso, 100)
+
+        response = self.client.get(reverse("gerar_relatorio"))
+        self.assertContains(response, reverse("baixar_relatorio", args=[tarefa.pk]))
+        response = self.client.get(reverse("baixar_relatorio", args=[tarefa.pk]))
+        conteudo = b"".join(response.streaming_content).decode("utf-8-sig")
+        self.assertIn("Acetona,Coord A,Fulano,2", conteudo)
+        self.assertIn("Coord A,Acetona,1,2", conteudo)
+
+    def test_mesmo_pedido_reaproveita_arquivo_ate_os_dados_mudarem(self):
+        self._pedir(self.admin_user)
+        call_command("worker", uma_vez=True, stdout=StringIO())
+
+        reaproveitada = self._pedir(self.outro_admin)
+        self.assertEqual(reaproveitada.status, TarefaRelatorio.CONCLUIDA)
+        self.assertEqual(
+            reaproveitada.arquivo.name, TarefaRelatorio.objects.get(solicitante=self.admin_user).arquivo.name
+        )
+
+        registrar_saida(self.reagente, self.coord_a, "Beltrano", 1)
+        nova = self._pedir(self.admin_user)
+        self.assertEqual(nova.status, TarefaRelatorio.PENDENTE)
+
+    def test_renomear_reagente_invalida_relatorio_pronto(self):
+        self._pedir(self.admin_user)
+        call_command("worker", uma_vez=True, stdout=StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reagente.reagente_nome = "Acetona PA"
+            self.reagente.save()
+        nova = self._pedir(self.outro_admin)
+        self.assertEqual(nova.status, TarefaRelatorio.PENDENTE)
+
+    def test_saida_editada_no_lugar_invalida_relatorio_pronto(self):
+        self._pedir(self.admin_user)
+        call_command("worker", uma_vez=True, stdout=StringIO())
+
+        saida = SaidaReagente.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            saida.requisitante = "Ciclano"
+            saida.save()
+        nova = self._pedir(self.outro_admin)
+        self.assertEqual(nova.status, TarefaRelatorio.PENDENTE)
+
+    def test_worker_retoma_tarefa_executando_sem_sinal_de_vida(self):
+        tarefa = self._pedir(self.admin_user)
+        antigo = timezone.now() - timedelta(seconds=601)
+        TarefaRelatorio.objects.filter(pk=tarefa.pk).update(
+            status=TarefaRelatorio.EXECUTANDO, iniciado_em=antigo, atualizado_em=timezone.now()
+        )
+        call_command("worker", uma_vez=True, stdout=StringIO())
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, TarefaRelatorio.EXECUTANDO)
+
+        TarefaRelatorio.objects.filter(pk=tarefa.pk).update(atualizado_em=antigo)
+        call_command("worker", uma_vez=True, stdout=StringIO())
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, TarefaRelatorio.CONCLUIDA)
+
+    def test_coord_nao_pode_gerar_nem_baixar(self):
+        tarefa = self._pedir(self.admin_user)
+        coord_user = User.objects.create_user(username="coord_user", password="123456789")
+        Perfil.objects.create(user=coord_user, tipo="coord", coordenacao=self.coord_a)
+        self.client.force_login(coord_user)
+        self.assertEqual(self.client.get(reverse("gerar_relatorio")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("baixar_relatorio", args=[tarefa.pk])).status_code, 403)
+
+
+class NotaFiscalTests(TestCase):
+    PDF = b"%PDF-1.4 nota fiscal de teste " + bytes(range(256))
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = self.settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        self.controlador = Controlador.objects.create(nome="Controlador X")
+        self.admin_user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=self.admin_user, tipo="admin", coordenacao=None)
+
+    def _registrar(self, nome, fispq):
+        self.client.force_login(self.admin_user)
+        self.client.post(
+            reverse("registro_reagente"),
+            data={
+                "reagente_nome": nome,
+                "fispq": fispq,
+                "controlador": self.controlador.id,
+                "armario": "A1",
+                "validade": "2031-01-01",
+                "nota_fiscal": SimpleUploadedFile("NF 123.PDF", self.PDF, content_type="application/pdf"),
+                "reagentecoordenacao_set-TOTAL_FORMS": "1",
+                "reagentecoordenacao_set-INITIAL_FORMS": "0",
+                "reagentecoordenacao_set-0-coordenacao": self.coord_a.id,
+                "reagentecoordenacao_set-0-quantidade": "3",
+            },
+        )
+        return Reagente.objects.get(reagente_nome=nome)
+
+    def test_mesma_nota_gravada_uma_vez(self):
+        primeiro = self._registrar("Acetona", "F-001")
+        segundo = self._registrar("Metanol", "F-002")
+
+        self.assertEqual(primeiro.nota_fiscal.name, segundo.nota_fiscal.name)
+        self.assertTrue(primeiro.nota_fiscal.name.endswith(".pdf"))
+        pasta = os.path.dirname(primeiro.nota_fiscal.path)
+        self.assertEqual(os.listdir(pasta), [os.path.basename(primeiro.nota_fiscal.name)])
+
+    def test_download_completo_e_por_intervalo(self):
+        reagente = self._registrar("Acetona", "F-001")
+        url = reverse("nota_fiscal", args=[reagente.pk])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), self.PDF)
+
+        response = self.client.get(url, HTTP_RANGE="bytes=5-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 5-9/{len(self.PDF)}")
+        self.assertEqual(b"".join(response.streaming_content), self.PDF[5:10])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=-4")
+        self.assertEqual(b"".join(response.streaming_content), self.PDF[-4:])
+
+        response = self.client.get(url, HTTP_RANGE=f"bytes={len(self.PDF)}-")
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(url, HTTP_RANGE="bytes=-0")
+        self.assertEqual(response.status_code, 416)
+
+    def test_nota_revalidada_pelo_etag(self):
+        reagente = self._registrar("Acetona", "F-001")
+        url = reverse("nota_fiscal", args=[reagente.pk])
+        sha256 = hashlib.sha256(self.PDF).hexdigest()
+
+        response = self.client.get(url)
+        self.assertEqual(response["ETag"], f'"{sha256}"')
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{sha256}"')
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"outro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_liga_para_a_view_da_nota(self):
+        reagente = self._registrar("Acetona", "F-001")
+        self.client.force_login(User.objects.create_superuser(username="super", password="123456789"))
+        response = self.client.get(reverse("admin:reagents_reagente_change", args=[reagente.pk]))
+        self.assertContains(response, f'href="{reverse("nota_fiscal", args=[reagente.pk])}"')
+        self.assertNotContains(response, f'href="/media/{reagente.nota_fiscal.name}"')
+
+    def test_servidor_web_envia_o_arquivo(self):
+        reagente = self._registrar("Acetona", "F-001")
+        with self.settings(NOTA_FISCAL_ENVIO="x-accel-redirect"):
+            response = self.client.get(reverse("nota_fiscal", args=[reagente.pk]))
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], "/protegido/" + reagente.nota_fiscal.name)
+
+    def test_coord_so_ve_nota_da_propria_coordenacao(self):
+        reagente = self._registrar("Acetona", "F-001")
+        url = reverse("nota_fiscal", args=[reagente.pk])
+        coord_a = User.objects.create_user(username="coord_a", password="123456789")
+        Perfil.objects.create(user=coord_a, tipo="coord", coordenacao=self.coord_a)
+        coord_b = User.objects.create_user(username="coord_b", password="123456789")
+        Perfil.objects.create(user=coord_b, tipo="coord", coordenacao=self.coord_b)
+
+        self.client.force_login(coord_a)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.force_login(coord_b)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class PrevisaoConsumoCommandTests(TestCase):
+    def setUp(self):
+        self.coord_a = Coordenacao.objects.create(nome="Coord A")
+        self.coord_b = Coordenacao.objects.create(nome="Coord B")
+        controlador = Controlador.objects.create(nome="Controlador X")
+        self.reagente = Reagente.objects.create(
+            reagente_nome="Acetona",
+            fispq="F-001",
+            controlador=controlador,
+            armario="A1",
+            validade=date(2030, 1, 1),
+        )
+        registrar_entradas([(self.reagente.pk, self.coord_a.pk, 40), (self.reagente.pk, self.coord_b.pk, 40)])
+        self.admin_user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=self.admin_user, tipo="admin", coordenacao=None)
+
+    def _saida(self, coordenacao, quantidade, dias_atras):
+        saida = registrar_saida(self.reagente, coordenacao, "Fulano", quantidade)
+        SaidaReagente.objects.filter(pk=saida.pk).update(data_saida=timezone.now() - timedelta(days=dias_atras))
+
+    def test_media_ponderada_e_dias_restantes(self):
+        self._saida(self.coord_a, 10, 0)
+        self._saida(self.coord_b, 10, 9)
+        self._saida(self.coord_b, 10, 30)
+
+        call_command("prever_consumo", janela=10, stdout=StringIO())
+
+        recente = PrevisaoConsumo.objects.get(estoque__coordenacao=self.coord_a)
+        antigo = PrevisaoConsumo.objects.get(estoque__coordenacao=self.coord_b)
+        self.assertAlmostEqual(recente.consumo_diario, 10 * 10 / 55)
+        self.assertAlmostEqual(antigo.consumo_diario, 10 * 1 / 55)
+        self.assertAlmostEqual(recente.dias_restantes, 30 / (100 / 55))
+
+        # Rodar de novo atualiza as linhas existentes.
+        call_command("prever_consumo", janela=10, stdout=StringIO())
+        self.assertEqual(PrevisaoConsumo.objects.count(), 2)
+
+    def test_home_ordena_pelo_que_acaba_primeiro(self):
+        self._saida(self.coord_b, 10, 0)
+        self._saida(self.coord_a, 1, 0)
+        call_command("prever_consumo", stdout=StringIO())
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("home"), {"ordenar": "ruptura"})
+        linhas = list(response.context["linhas"])
+        self.assertEqual([linha.coordenacao for linha in linhas], [self.coord_b, self.coord_a])
+        self.assertLess(linhas[0].dias_para_ruptura, linhas[1].dias_para_ruptura)
+        self.assertContains(response, "dias</td>")
+
+
+class EstaticosTests(SimpleTestCase):
+    def setUp(self):
+        self.raiz = tempfile.TemporaryDirectory()
+        self.addCleanup(self.raiz.cleanup)
+        with self.settings(STATIC_ROOT=self.raiz.name):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            self.arquivos = ArquivosEstaticos.de_settings()
+        with open(os.path.join(self.raiz.name, "staticfiles.json"), encoding="utf-8") as manifesto:
+            self.css = json.load(manifesto)["paths"]["css/style.css"]
+
+    def _wsgi(self, caminho, **cabecalhos):
+        resposta = {}
+
+        def start_response(status, headers):
+            resposta["status"] = status
+            resposta["headers"] = dict(headers)
+
+        app = EstaticosWSGI(lambda environ, start: ["django"], self.arquivos)
+        corpo = app({"REQUEST_METHOD": "GET", "PATH_INFO": caminho, **cabecalhos}, start_response)
+        return resposta, b"".join(corpo) if resposta else corpo
+
+    def test_collectstatic_gera_hash_e_gzip(self):
+        self.assertNotEqual(self.css, "css/style.css")
+        self.assertTrue(os.path.exists(os.path.join(self.raiz.name, self.css + ".gz")))
+
+    def test_serve_variante_gzip_com_cache_imutavel(self):
+        resposta, corpo = self._wsgi(f"/static/{self.css}", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resposta["status"], "200 OK")
+        self.assertEqual(resposta["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(resposta["headers"]["Content-Type"], "text/css")
+        self.assertIn("immutable", resposta["headers"]["Cache-Control"])
+        self.assertIn(b"--primary-green", gzip.decompress(corpo))
+
+        resposta, corpo = self._wsgi(
+            f"/static/{self.css}",
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=resposta["headers"]["ETag"],
+        )
+        self.assertEqual(resposta["status"], "304 Not Modified")
+        self.assertEqual(corpo, b"")
+
+    def test_nome_sem_hash_revalida_e_demais_caminhos_vao_para_o_django(self):
+        resposta, _ = self._wsgi("/static/css/style.css")
+        self.assertEqual(resposta["headers"]["Cache-Control"], "public, max-age=0, must-revalidate")
+        self.assertNotIn("Content-Encoding", resposta["headers"])
+
+        for caminho in ("/home/", "/static/../staticfiles.json", "/static/nao-existe.css"):
+            with self.subTest(caminho=caminho):
+                self.assertEqual(self._wsgi(caminho)[1], ["django"])
+
+    def test_asgi(self):
+        enviados = []
+
+        async def send(mensagem):
+            enviados.append(mensagem)
+
+        async def django(scope, receive, send):
+            enviados.append("django")
+
+        app = EstaticosASGI(django, self.arquivos)
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": f"/static/{self.css}",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        asyncio.run(app(scope, None, send))
+        cabecalhos = dict(enviados[0]["headers"])
+        self.assertEqual(enviados[0]["status"], 200)
+        self.assertEqual(cabecalhos[b"content-encoding"], b"gzip")
+        self.assertIn(b"--primary-green", gzip.decompress(b"".join(m["body"] for m in enviados[1:])))
+
+
+def consultas_repetidas(capturadas):
+    """Retorna {sql: vezes} das consultas que se repetem numa mesma requisicao."""
+    contagem = Counter(consulta["sql"] for consulta in capturadas)
+    return {sql: vezes for sql, vezes in contagem.items() if vezes > 1}
+
+
+class OrcamentoConsultasTests(TestCase):
+    """Cada view tem um numero fixo de consultas, que nao cresce com o volume de dados."""
+
+    def setUp(self):
+        self.sequencia = itertools.count()
+        self.controlador = Controlador.objects.create(nome="Controlador X")
+        self.coordenacoes = [Coordenacao.objects.create(nome=f"Coord {letra}") for letra in "ABC"]
+        self._popular(2)
+
+        self.admin_user = User.objects.create_user(username="admin_user", password="123456789")
+        Perfil.objects.create(user=self.admin_user, tipo="admin", coordenacao=None)
+        self.coord_user = User.objects.create_user(username="coord_user", password="123456789")
+        Perfil.objects.create(user=self.coord_user, tipo="coord", coordenacao=self.coordenacoes[0])
+        self.superuser = User.objects.create_superuser(username="root", password="123456789")
+
+    def _popular(self, quantidade):
+        reagentes = [
+            Reagente.objects.create(
+                reagente_nome=f"Acetona {next(self.sequencia)}",
+                fispq="F-001",
+                controlador=self.controlador,
+                armario="A1",
+                validade=date(2030, 1, 1),
+            )
+            for _ in range(quantidade)
+        ]
+        registrar_entradas(
+            [(reagente.pk, coordenacao.pk, 50) for reagente in reagentes for coordenacao in self.coordenacoes]
+        )
+        for reagente in reagentes:
+            for coordenacao in self.coordenacoes:
+                registrar_saida(reagente, coordenacao, "Fulano", 1)
+
+    def _medir(self, requisicao):
+        cache.clear()
+        cache_busca.limpar()
+        # Coordenacoes e controladores ja carregados, como num processo aquecido.
+        cadastros.coordenacoes.listar()
+        cadastros.controladores.listar()
+        with CaptureQueriesContext(connection) as contexto:
+            response = requisicao()
+        self.assertLess(response.status_code, 400)
+        return contexto.captured_queries
+
+    def assertOrcamento(self, orcamento, requisicao):
+        """Mede a requisicao com poucos e com muitos registros; as duas devem caber no orcamento."""
+        for volume in ("pequeno", "grande"):
+            if volume == "grande":
+                self._popular(15)
+            capturadas = self._medir(requisicao)
+            listagem = "\n".join(consulta["sql"] for consulta in capturadas)
+            self.assertEqual(
+                len(capturadas),
+                orcamento,
+                f"{len(capturadas)} consultas (orcamento {orcamento}) com volume {volume}:\n{listagem}",
+            )
+            repetidas = consultas_repetidas(capturadas)
+            self.assertFalse(repetidas, f"Consultas repetidas com volume {volume}: {repetidas}")
+
+    def test_home_admin(self):
+        self.client.force_login(self.admin_user)
+        self.assertOrcamento(4, lambda: self.client.get(reverse("home")))
+
+    def test_home_coord_com_busca(self):
+        self.client.force_login(self.coord_user)
+        self.assertOrcamento(
+            5, lambda: self.client.get(reverse("home"), {"search": "acetona", "ordenar": "nome"})
+        )
+
+    def test_historico_admin(self):
+        self.client.force_login(self.admin_user)
+        self.assertOrcamento(4, lambda: self.client.get(reverse("historico_saida")))
+
+    def test_historico_coord_com_busca(self):
+        self.client.force_login(self.coord_user)
+        self.assertOrcamento(
+            5, lambda: self.client.get(reverse("historico_saida"), {"search": "fulano", "ordenar": "validade"})
+        )
+
+    def test_saida_get(self):
+        self.client.force_login(self.admin_user)
+        reagente = Reagente.objects.first()
+        self.assertOrcamento(
+            5,
+            lambda: self.client.get(
+                reverse("saida_reagente"), {"reagente": reagente.pk, "coord": self.coordenacoes[0].pk}
+            ),
+        )
+
+    def test_saida_post(self):
+        self.client.force_login(self.admin_user)
+        reagente = Reagente.objects.first()
+        self.assertOrcamento(
+            15,
+            lambda: self.client.post(
+                reverse("saida_reagente"),
+                data={
+                    "chave_idempotencia": uuid.uuid4(),
+                    "reagente": reagente.pk,
+                    "coordenacao": self.coordenacoes[0].pk,
+                    "quantidade": 1,
+                    "requisitante": "Fulano",
+                    "observacao": "",
+                },
+            ),
+        )
+
+    def test_registro_get(self):
+        self.client.force_login(self.admin_user)
+        self.assertOrcamento(3, lambda: self.client.get(reverse("registro_reagente")))
+
+    def test_registro_post(self):
+        self.client.force_login(self.admin_user)
+
+        def registrar():
+            return self.client.post(
+                reverse("registro_reagente"),
+                data={
+                    "reagente_nome": f"Etanol {next(self.sequencia)}",
+                    "fispq": "F-002",
+                    "confirmar_duplicata": "on",
+                    "controlador": self.controlador.pk,
+                    "armario": "A2",
+                    "validade": "2031-01-01",
+                    "reagentecoordenacao_set-TOTAL_FORMS": "2",
+                    "reagentecoordenacao_set-INITIAL_FORMS": "0",
+                    "reagentecoordenacao_set-0-coordenacao": self.coordenacoes[0].pk,
+                    "reagentecoordenacao_set-0-quantidade": "3",
+                    "reagentecoordenacao_set-1-coordenacao": self.coordenacoes[1].pk,
+                    "reagentecoordenacao_set-1-quantidade": "4",
+                },
+            )
+
+        self.assertOrcamento(16, registrar)
+
+    def test_register_get(self):
+        self.client.force_login(self.admin_user)
+        self.assertOrcamento(3, lambda: self.client.get(reverse("register")))
+
+    def test_register_post(self):
+        self.client.force_login(self.admin_user)
+
+        def cadastrar():
+            return self.client.post(
+                reverse("register"),
+                data={
+                    "username": f"novo{next(self.sequencia)}",
+                    "password1": "SenhaForte!2024",
+                    "password2": "SenhaForte!2024",
+                    "tipo": "coord",
+                    "coordenacao": self.coordenacoes[1].pk,
+                },
+            )
+
+        self.assertOrcamento(9, cadastrar)
+
+    def test_login(self):
+        self.assertOrcamento(0, lambda: self.client.get(reverse("login")))
+        self.assertOrcamento(
+            9,
+            lambda: self.client_class().post(
+                reverse("login"), {"username": "coord_user", "password": "123456789"}
+            ),
+        )
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.superuser)
+        for model, orcamento in (
+            ("coordenacao", 4),
+            ("controlador", 4),
+            ("reagente", 5),
+            ("capturaperfil", 7),
+        ):
+            with self.subTest(model=model):
+                self.assertOrcamento(
+                    orcamento, lambda: self.client.get(reverse(f"admin:reagents_{model}_changelist"))
+                )
@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+CHAVE_VERSAO = "reagents:versao_dados"
+CHAVE_VERSAO_CADASTROS = "reagents:versao_cadastros"
+CHAVE_VERSAO_CATALOGO = "reagents:versao_catalogo"
+
+
+def _versao(chave):
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time_ns(), timeout=None)
+        versao = cache.get(chave, 1)
+    return versao
+
+
+def _incrementar(chave):
+    try:
+        return cache.incr(chave)
+    except ValueError:
+        versao = time.time_ns()
+        cache.set(chave, versao, timeout=None)
+        return versao
+
+
+def versao_dados():
+    """Versao atual dos dados de estoque; muda a cada escrita confirmada.
+
+    O valor inicial vem do relogio: se o cache for limpo ou reiniciado, a nova
+    sequencia nao reaproveita versoes que caches locais de processo (LRU de
+    busca, indice de similaridade) ainda guardam.
+    """
+    return _versao(CHAVE_VERSAO)
+
+
+def incrementar_versao():
+    return _incrementar(CHAVE_VERSAO)
+
+
+def versao_cadastros():
+    """Versao das tabelas de apoio (Coordenacao, Controlador), separada da dos dados de estoque."""
+    return _versao(CHAVE_VERSAO_CADASTROS)
+
+
+def incrementar_versao_cadastros():
+    return _incrementar(CHAVE_VERSAO_CADASTROS)
+
+
+def versao_catalogo():
+    """Versao do catalogo de reagentes (nomes, FISPQ); so muda quando um Reagente e salvo ou excluido."""
+    return _versao(CHAVE_VERSAO_CATALOGO)
+
+
+def incrementar_versao_catalogo():
+    return _incrementar(CHAVE_VERSAO_CATALOGO)
@@ -1,116 +1,211 @@
-import unicodedata
-from datetime import timedelta
-
+import json
+import mimetypes
+import os
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.db import connection, transaction
-from django.db.models import CharField, F, Func, Q, Value
-from django.db.models.functions import Lower, Replace
-from django.shortcuts import redirect, render
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.core.cache import cache
+from django.db.models import (
+    Case,
+    CharField,
+    Count,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 
 from accounts.permissions import get_perfil
+from app.replica import leitura_replica
+
+from . import cadastros
+from .busca import cache_busca, ids_correspondentes, normalizar_texto
+from .estoque import (
+    EstoqueInsuficiente,
+    matriz_disponibilidade,
+    registrar_entradas,
+    registrar_estoque_inicial,
+    registrar_saida,
+)
+from .forms import (
+    RelatorioForm,
+    ReagenteCoordenacaoFormSet,
+    ReagenteForm,
+    ReposicaoFormSet,
+    SaidaReagenteForm,
+)
+from .models import (
+    DocumentoBusca,
+    Lote,
+    Reagente,
+    ReagenteCoordenacao,
+    SaidaReagente,
+    TarefaRelatorio,
+)
+from .relatorios import parametros_relatorio, solicitar_relatorio
+from .versao import versao_dados
+
+
+def _annotate_ruptura(queryset):
+    """Dias ate zerar: estoque atual sobre o consumo diario da ultima previsao (prever_consumo)."""
+    return queryset.annotate(
+        dias_para_ruptura=Case(
+            When(
+                previsao__consumo_diario__gt=0,
+                then=ExpressionWrapper(
+                    F("quantidade") / F("previsao__consumo_diario"), output_field=FloatField()
+                ),
+            ),
+            default=None,
+            output_field=FloatField(),
+        )
+    )
 
-from .forms import ReagenteCoordenacaoFormSet, ReagenteForm, SaidaReagenteForm
-from .models import Coordenacao, Reagente, ReagenteCoordenacao, SaidaReagente
 
+def _order_by_nome_sem_acentos(queryset, tipo):
+    """Ordena pelo texto do DocumentoBusca, que comeca pelo nome do reagente ja
+    normalizado (minusculo, sem acento). Dobrar o nome no proprio SQL pedia um
+    REPLACE aninhado por letra acentuada e estourava a pilha do parser do SQLite.
+    """
+    texto = DocumentoBusca.objects.filter(tipo=tipo, objeto_id=OuterRef("pk")).values("texto")[:1]
+    return queryset.annotate(_sort_nome=Subquery(texto)).order_by(
+        F("_sort_nome").asc(nulls_last=True), "reagente__reagente_nome"
+    )
 
-class Unaccent(Func):
-    function = "UNACCENT"
-    output_field = CharField()
 
+def _documentos_no_escopo(documentos, coord_id, perfil):
+    if coord_id:
+        documentos = documentos.filter(coordenacao_id=coord_id)
+    if perfil.tipo == "coord":
+        documentos = documentos.filter(coordenacao_id=perfil.coordenacao_id)
+    return documentos
 
-_ACCENT_REPLACEMENTS = [
-    ("\u00c1", "a"), ("\u00c0", "a"), ("\u00c2", "a"), ("\u00c3", "a"), ("\u00c4", "a"),
-    ("\u00c9", "e"), ("\u00c8", "e"), ("\u00ca", "e"), ("\u00cb", "e"),
-    ("\u00cd", "i"), ("\u00cc", "i"), ("\u00ce", "i"), ("\u00cf", "i"),
-    ("\u00d3", "o"), ("\u00d2", "o"), ("\u00d4", "o"), ("\u00d5", "o"), ("\u00d6", "o"),
-    ("\u00da", "u"), ("\u00d9", "u"), ("\u00db", "u"), ("\u00dc", "u"),
-    ("\u00c7", "c"), ("\u00d1", "n"),
-    ("\u00e1", "a"), ("\u00e0", "a"), ("\u00e2", "a"), ("\u00e3", "a"), ("\u00e4", "a"),
-    ("\u00e9", "e"), ("\u00e8", "e"), ("\u00ea", "e"), ("\u00eb", "e"),
-    ("\u00ed", "i"), ("\u00ec", "i"), ("\u00ee", "i"), ("\u00ef", "i"),
-    ("\u00f3", "o"), ("\u00f2", "o"), ("\u00f4", "o"), ("\u00f5", "o"), ("\u00f6", "o"),
-    ("\u00fa", "u"), ("\u00f9", "u"), ("\u00fb", "u"), ("\u00fc", "u"),
-    ("\u00e7", "c"), ("\u00f1", "n"),
-]
 
+def _ids_em_cache(chave, documentos):
+    """objeto_id dos documentos, pelo cache_busca.
 
-def _normalize_text(value):
-    value = (value or "").strip().lower()
-    normalized = unicodedata.normalize("NFD", value)
-    return "".join(ch for ch in normalized if unicodedata.category(ch) != "Mn")
+    A chave leva a versao ja confirmada no principal; uma replica atrasada
+    guardaria ali IDs de antes da escrita. Por isso o calculo vai sempre ao
+    principal, mesmo dentro de @leitura_replica.
+    """
+    return cache_busca.obter(
+        chave, lambda: list(documentos.using(DEFAULT_DB_ALIAS).values_list("objeto_id", flat=True))
+    )
 
 
-def _accent_fold_expr(field_name):
-    expr = F(field_name)
-    if connection.vendor == "postgresql":
-        expr = Unaccent(expr)
-    else:
-        for src, dst in _ACCENT_REPLACEMENTS:
-            expr = Replace(expr, Value(src), Value(dst))
-    return Lower(expr)
+PERIODOS_HISTORICO = (7, 30, 90)
 
 
-def _order_by_nome_sem_acentos(queryset, field_name):
-    folded = _accent_fold_expr(field_name)
-    return queryset.annotate(_sort_nome=folded).order_by("_sort_nome", field_name)
+def _intervalo_historico(params):
+    """Intervalo [inicio, fim) de data_saida pedido em `periodo` ou `data_de`/`data_ate`."""
+    def inicio_do_dia(dia):
+        return timezone.make_aware(datetime.combine(dia, time.min))
+
+    # Presets comecam a meia-noite, para a chave do cache de busca valer o dia todo.
+    periodo = params.get("periodo", "")
+    if periodo.isdigit() and int(periodo) in PERIODOS_HISTORICO:
+        return inicio_do_dia(timezone.localdate() - timedelta(days=int(periodo))), None
+
+    limites = []
+    for nome, deslocamento in (("data_de", 0), ("data_ate", 1)):
+        try:
+            limites.append(inicio_do_dia(date.fromisoformat(params.get(nome, "")) + timedelta(days=deslocamento)))
+        except (ValueError, OverflowError):
+            # Data invalida ou alem de date.max (data_ate=9999-12-31): sem limite.
+            limites.append(None)
+    return tuple(limites)
+
+
+def _annotate_lotes(queryset):
+    """Agrega os lotes de cada ReagenteCoordenacao no proprio SQL da listagem."""
+    lotes = Lote.objects.filter(
+        reagente=OuterRef("reagente"),
+        coordenacao=OuterRef("coordenacao"),
+        quantidade__gt=0,
+    ).values("reagente", "coordenacao")
+
+    today = timezone.localdate()
+    warning_limit = today + timedelta(days=365)
+    return queryset.annotate(
+        # Sem lote fica sem validade (e marcado): nao esconde estoque sem lote
+        # atras da validade cadastrada no reagente.
+        proxima_validade=Subquery(lotes.annotate(m=Min("validade")).values("m")),
+        num_lotes=Coalesce(Subquery(lotes.annotate(n=Count("pk")).values("n")), Value(0)),
+        validade_status=Case(
+            When(proxima_validade__isnull=True, then=Value("sem_lote")),
+            When(proxima_validade__lt=today, then=Value("expired")),
+            When(proxima_validade__lte=warning_limit, then=Value("warning")),
+            default=Value("ok"),
+            output_field=CharField(),
+        ),
+    )
 
 
 @login_required(login_url="login")
+@leitura_replica
 def home(request):
     search = request.GET.get("search", "")
     ordenar = request.GET.get("ordenar", "")
 
     qs = ReagenteCoordenacao.objects.select_related(
-        "reagente", "coordenacao", "reagente__controlador"
-    ).filter(quantidade__gt=0)
-
-    if search:
-        normalized_search = _normalize_text(search)
-        qs = qs.annotate(
-            reagente_nome_fold=_accent_fold_expr("reagente__reagente_nome"),
-            fispq_fold=_accent_fold_expr("reagente__fispq"),
-            controlador_fold=_accent_fold_expr("reagente__controlador__nome"),
-            coordenacao_fold=_accent_fold_expr("coordenacao__nome"),
-        ).filter(
-            Q(reagente_nome_fold__contains=normalized_search)
-            | Q(fispq_fold__contains=normalized_search)
-            | Q(controlador_fold__contains=normalized_search)
-            | Q(coordenacao_fold__contains=normalized_search)
-        )
+        "reagente", "coordenacao", "reagente__controlador", "previsao"
+    ).filter(quantidade__gt=0, reagente__ativo=True)
 
     coord_id = request.GET.get("coord")
     if coord_id:
         qs = qs.filter(coordenacao_id=coord_id)
 
-    if ordenar == "validade":
-        qs = qs.order_by("reagente__validade")
-    elif ordenar == "nome":
-        qs = _order_by_nome_sem_acentos(qs, "reagente__reagente_nome")
-
     perfil = get_perfil(request.user)
 
     if perfil.tipo == "coord":
-        qs = qs.filter(coordenacao=perfil.coordenacao)
-        coordenacoes = Coordenacao.objects.filter(id=perfil.coordenacao_id)
+        qs = qs.filter(coordenacao_id=perfil.coordenacao_id)
+        coordenacoes = cadastros.coordenacoes.filtrar(perfil.coordenacao_id)
     else:
-        coordenacoes = Coordenacao.objects.all()
+        coordenacoes = cadastros.coordenacoes.listar()
 
-    today = timezone.localdate()
-    warning_limit = today + timedelta(days=365)
-    linhas = list(qs)
-    for linha in linhas:
-        validade = linha.reagente.validade
-        if validade < today:
-            linha.validade_status = "expired"
-        elif validade <= warning_limit:
-            linha.validade_status = "warning"
-        else:
-            linha.validade_status = "ok"
+    if search:
+        normalized_search = normalizar_texto(search)
+        # Sem `ordenar`: os IDs sao os mesmos em qualquer ordenacao.
+        chave = ("home", normalized_search, coord_id, perfil.coordenacao_id, versao_dados())
+        ids = _ids_em_cache(
+            chave,
+            _documentos_no_escopo(
+                ids_correspondentes(DocumentoBusca.TIPO_ESTOQUE, normalized_search), coord_id, perfil
+            ),
+        )
+        qs = qs.filter(pk__in=ids)
+
+    qs = _annotate_lotes(qs)
+
+    qs = _annotate_ruptura(qs)
 
-    context = {"linhas": linhas, "coordenacoes": coordenacoes}
+    if ordenar == "validade":
+        qs = qs.order_by(F("proxima_validade").asc(nulls_last=True))
+    elif ordenar == "nome":
+        qs = _order_by_nome_sem_acentos(qs, DocumentoBusca.TIPO_ESTOQUE)
+    elif ordenar == "ruptura":
+        qs = qs.order_by(F("dias_para_ruptura").asc(nulls_last=True), "reagente__reagente_nome")
+
+    context = {"linhas": qs, "coordenacoes": coordenacoes}
     return render(request, "home.html", context)
 
 
@@ -135,32 +230,28 @@ def saida_reagente(request):
         observacao = form.cleaned_data["observacao"]
 
         try:
-            with transaction.atomic():
-                rc = ReagenteCoordenacao.objects.select_for_update().get(
-                    reagente=reagente,
-                    coordenacao=coordenacao,
-                )
-
-                if rc.quantidade < quantidade:
-                    messages.error(request, "Quantidade insuficiente em estoque!")
-                    return redirect("saida_reagente")
-
-                SaidaReagente.objects.create(
-                    reagente=reagente,
-                    coordenacao=coordenacao,
-                    requisitante=requisitante,
-                    quantidade=quantidade,
-                    observacao=observacao,
-                )
-
-                rc.quantidade -= quantidade
-                rc.save()
-
-                messages.success(request, "Saida registrada com sucesso!")
+            saida = registrar_saida(
+                reagente,
+                coordenacao,
+                requisitante,
+                quantidade,
+                observacao,
+                chave_idempotencia=form.cleaned_data["chave_idempotencia"],
+            )
+            if saida.repetida:
+                messages.info(request, "Esta saida ja tinha sido registrada; o envio repetido foi ignorado.")
                 return redirect("home")
+            lotes = ", ".join(f"{validade:%d/%m/%Y} ({qtd})" for validade, qtd in saida.lotes)
+            if lotes:
+                messages.success(request, f"Saida registrada com sucesso! Lotes: {lotes}")
+            else:
+                messages.success(request, "Saida registrada com sucesso!")
+            return redirect("home")
 
         except ReagenteCoordenacao.DoesNotExist:
             messages.error(request, "Este reagente nao esta disponivel para esta coordenacao!")
+        except EstoqueInsuficiente as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f"Erro ao registrar saida: {str(e)}")
 
@@ -168,29 +259,23 @@ def saida_reagente(request):
 
     reagente_id = request.GET.get("reagente")
     coord_id = request.GET.get("coord")
+    disponibilidade = matriz_disponibilidade()
     qtd_disponivel = None
 
     if reagente_id and coord_id:
-        try:
-            rc = ReagenteCoordenacao.objects.get(
-                reagente_id=reagente_id,
-                coordenacao_id=coord_id,
-            )
-            qtd_disponivel = rc.quantidade
-        except ReagenteCoordenacao.DoesNotExist:
-            qtd_disponivel = 0
+        qtd_disponivel = disponibilidade.get(reagente_id, {}).get(coord_id, 0)
 
-    reagentes = Reagente.objects.all()
-    coordenacoes = Coordenacao.objects.all()
-    saidas = SaidaReagente.objects.select_related("reagente", "coordenacao")
+    reagentes = Reagente.objects.filter(ativo=True)
+    coordenacoes = cadastros.coordenacoes.listar()
 
     context = {
         "reagentes": reagentes,
         "coordenacoes": coordenacoes,
-        "saidas": saidas,
         "reagente_sel": reagente_id,
         "coord_sel": coord_id,
         "qtd_disponivel": qtd_disponivel,
+        "disponibilidade": disponibilidade,
+        "chave_idempotencia": uuid.uuid4(),
     }
 
     return render(request, "saida.html", context)
@@ -206,9 +291,10 @@ def registro_reagente(request):
         formset = ReagenteCoordenacaoFormSet(request.POST)
 
         if form_reagente.is_valid() and formset.is_valid():
-            reagente = form_reagente.save()
-            formset.instance = reagente
-            formset.save()
+            with transaction.atomic():
+                reagente = form_reagente.save()
+                formset.instance = reagente
+                registrar_estoque_inicial(reagente, formset.save(commit=False))
             messages.success(request, "Reagente registrado com sucesso!")
             return redirect("home")
         messages.error(request, "Erro ao registrar reagente. Verifique os campos.")
@@ -219,7 +305,60 @@ def registro_reagente(request):
     return render(request, "registro.html", {"form": form_reagente, "formset": formset})
 
 
+def _reposicao_formset_json(request):
+    try:
+        payload = json.loads(request.body or b"{}")
+        linhas = payload.get("linhas") or []
+        data = {
+            "form-TOTAL_FORMS": str(len(linhas)),
+            "form-INITIAL_FORMS": "0",
+        }
+        for i, linha in enumerate(linhas):
+            data[f"form-{i}-reagente"] = linha.get("reagente")
+            data[f"form-{i}-coordenacao"] = linha.get("coordenacao")
+            data[f"form-{i}-quantidade"] = linha.get("quantidade")
+            data[f"form-{i}-validade"] = linha.get("validade") or ""
+    except (ValueError, AttributeError):
+        return None, ""
+    return ReposicaoFormSet(data), str(payload.get("observacao") or "").strip()
+
+
+@login_required(login_url="login")
+def reposicao_estoque(request):
+    perfil = get_perfil(request.user)
+    if perfil.tipo != "admin":
+        raise PermissionDenied("Sem permissao.")
+
+    if request.method == "POST" and request.content_type == "application/json":
+        formset, observacao = _reposicao_formset_json(request)
+        if formset is None:
+            return JsonResponse({"erro": "JSON invalido."}, status=400)
+        if not formset.is_valid():
+            return JsonResponse(
+                {"erro": "Linhas invalidas.", "erros": formset.errors, "gerais": formset.non_form_errors()},
+                status=400,
+            )
+        resultado = registrar_entradas(formset.linhas(), observacao=observacao)
+        return JsonResponse(resultado, status=201)
+
+    if request.method == "POST":
+        formset = ReposicaoFormSet(request.POST)
+        observacao = (request.POST.get("observacao") or "").strip()
+        if formset.is_valid():
+            resultado = registrar_entradas(formset.linhas(), observacao=observacao)
+            messages.success(
+                request, f"Reposicao registrada com sucesso! ({resultado['linhas']} linhas)"
+            )
+            return redirect("home")
+        messages.error(request, "Erro ao registrar reposicao. Verifique os campos.")
+    else:
+        formset = ReposicaoFormSet()
+
+    return render(request, "reposicao.html", {"formset": formset})
+
+
 @login_required(login_url="login")
+@leitura_replica
 def historico_saida(request):
     search = request.GET.get("search", "")
     ordenar = request.GET.get("ordenar", "")
@@ -228,48 +367,283 @@ def historico_saida(request):
         "reagente", "coordenacao", "reagente__controlador"
     )
 
-    if search:
-        normalized_search = _normalize_text(search)
-        saidas = saidas.annotate(
-            reagente_nome_fold=_accent_fold_expr("reagente__reagente_nome"),
-            fispq_fold=_accent_fold_expr("reagente__fispq"),
-            controlador_fold=_accent_fold_expr("reagente__controlador__nome"),
-            coordenacao_fold=_accent_fold_expr("coordenacao__nome"),
-            requisitante_fold=_accent_fold_expr("requisitante"),
-        ).filter(
-            Q(reagente_nome_fold__contains=normalized_search)
-            | Q(fispq_fold__contains=normalized_search)
-            | Q(controlador_fold__contains=normalized_search)
-            | Q(coordenacao_fold__contains=normalized_search)
-            | Q(requisitante_fold__contains=normalized_search)
-        )
-
     coord_id = request.GET.get("coord")
     if coord_id:
         saidas = saidas.filter(coordenacao_id=coord_id)
 
+    perfil = get_perfil(request.user)
+
+    if perfil.tipo == "coord":
+        saidas = saidas.filter(coordenacao_id=perfil.coordenacao_id)
+        coordenacoes = cadastros.coordenacoes.filtrar(perfil.coordenacao_id)
+    else:
+        coordenacoes = cadastros.coordenacoes.listar()
+
+    # O mesmo intervalo vale para as saidas e para os documentos de busca,
+    # entao a busca textual nunca varre fora da janela.
+    inicio, fim = _intervalo_historico(request.GET)
+    filtros_data = {}
+    if inicio:
+        filtros_data["data_saida__gte"] = inicio
+    if fim:
+        filtros_data["data_saida__lt"] = fim
+    saidas = saidas.filter(**filtros_data)
+
+    if search:
+        normalized_search = normalizar_texto(search)
+        chave = ("historico", normalized_search, coord_id, perfil.coordenacao_id, inicio, fim, versao_dados())
+        ids = _ids_em_cache(
+            chave,
+            _documentos_no_escopo(
+                ids_correspondentes(DocumentoBusca.TIPO_SAIDA, normalized_search, **filtros_data), coord_id, perfil
+            ),
+        )
+        saidas = saidas.filter(pk__in=ids)
+
     if ordenar == "validade":
         saidas = saidas.order_by("reagente__validade")
     elif ordenar == "nome":
-        saidas = _order_by_nome_sem_acentos(saidas, "reagente__reagente_nome")
+        saidas = _order_by_nome_sem_acentos(saidas, DocumentoBusca.TIPO_SAIDA)
     else:
         saidas = saidas.order_by("-data_saida")
 
+    query_datas = urlencode(
+        {nome: request.GET[nome] for nome in ("periodo", "data_de", "data_ate") if request.GET.get(nome)}
+    )
+    context = {
+        "saidas": saidas,
+        "coordenacoes": coordenacoes,
+        "periodos": PERIODOS_HISTORICO,
+        "query_datas": query_datas,
+    }
+    return render(request, "historico.html", context)
+
+
+@login_required(login_url="login")
+def gerar_relatorio(request):
     perfil = get_perfil(request.user)
+    if perfil.tipo != "admin":
+        raise PermissionDenied("Sem permissao.")
 
-    if perfil.tipo == "coord":
-        saidas = saidas.filter(coordenacao=perfil.coordenacao)
-        coordenacoes = Coordenacao.objects.filter(id=perfil.coordenacao_id)
+    if request.method == "POST":
+        form = RelatorioForm(request.POST)
+        if form.is_valid():
+            tarefa = solicitar_relatorio(request.user, parametros_relatorio(form.cleaned_data))
+            if tarefa.status == TarefaRelatorio.CONCLUIDA:
+                messages.success(request, "Relatorio pronto (mesmos dados de um pedido anterior).")
+            else:
+                messages.success(request, "Relatorio enviado para a fila.")
+            return redirect("gerar_relatorio")
+        for erros in form.errors.values():
+            for erro in erros:
+                messages.error(request, erro)
     else:
-        coordenacoes = Coordenacao.objects.all()
+        form = RelatorioForm()
+
+    tarefas = list(TarefaRelatorio.objects.filter(solicitante=request.user)[:20])
+    coordenacoes = cadastros.coordenacoes.nomes()
+    for tarefa in tarefas:
+        tarefa.coordenacao_nome = coordenacoes.get(tarefa.parametros.get("coordenacao"), "Todas")
+    em_andamento = any(t.status in (TarefaRelatorio.PENDENTE, TarefaRelatorio.EXECUTANDO) for t in tarefas)
+    return render(
+        request, "relatorio.html", {"form": form, "tarefas": tarefas, "em_andamento": em_andamento}
+    )
 
-    context = {"saidas": saidas, "coordenacoes": coordenacoes}
-    return render(request, "historico.html", context)
+
+@login_required(login_url="login")
+def baixar_relatorio(request, pk):
+    perfil = get_perfil(request.user)
+    if perfil.tipo != "admin":
+        raise PermissionDenied("Sem permissao.")
+    tarefa = get_object_or_404(TarefaRelatorio, pk=pk, status=TarefaRelatorio.CONCLUIDA)
+    try:
+        arquivo = tarefa.arquivo.open("rb")
+    except FileNotFoundError:
+        raise Http404("Arquivo do relatorio nao encontrado.")
+    return FileResponse(arquivo, as_attachment=True, filename=f"relatorio-{tarefa.pk}.csv")
+
+
+RANGE_BYTES = re.compile(r"^bytes=(\d*)-(\d*)$")
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+NOTA_FISCAL_CACHE = "private, no-cache"
+
+
+def _cabecalhos_cache_nota(resposta, etag):
+    resposta["Cache-Control"] = NOTA_FISCAL_CACHE
+    if etag:
+        resposta["ETag"] = etag
+
+
+def _intervalo_bytes(cabecalho, tamanho):
+    """(inicio, fim) inclusivos de um Range de intervalo unico, None se ausente ou nao suportado."""
+    encontrado = RANGE_BYTES.match(cabecalho.strip())
+    if not encontrado or tamanho == 0:
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio:
+        if not fim:
+            return None
+        if int(fim) == 0:
+            return False
+        return max(tamanho - int(fim), 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio > fim:
+        return False
+    return inicio, fim
+
+
+def _ler_trecho(arquivo, inicio, fim, bloco=64 * 1024):
+    with arquivo:
+        arquivo.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            dados = arquivo.read(min(bloco, restante))
+            if not dados:
+                break
+            restante -= len(dados)
+            yield dados
 
 
 @login_required(login_url="login")
-def gerar_relatorio(request):
+def nota_fiscal(request, pk):
+    """Entrega a nota fiscal so para quem pode ver o reagente.
+
+    Com NOTA_FISCAL_ENVIO configurado o Django responde apenas com o
+    cabecalho e o nginx/Apache envia o arquivo; sem ele, o arquivo e lido em
+    blocos com suporte a Range.
+    """
+    perfil = get_perfil(request.user)
+    reagentes = Reagente.objects.exclude(nota_fiscal="")
+    if perfil.tipo != "admin":
+        reagentes = reagentes.filter(
+            Exists(ReagenteCoordenacao.objects.filter(reagente=OuterRef("pk"), coordenacao_id=perfil.coordenacao_id))
+        )
+    reagente = get_object_or_404(reagentes.only("pk", "nota_fiscal"), pk=pk)
+    if not reagente.nota_fiscal.storage.exists(reagente.nota_fiscal.name):
+        raise Http404("Nota fiscal nao encontrada.")
+
+    nome = reagente.nota_fiscal.name
+    # O nome gravado e o SHA-256 do conteudo (ArmazenamentoPorConteudo). A URL
+    # e a do reagente e a nota pode ser trocada: o navegador sempre revalida.
+    sha256 = os.path.splitext(os.path.basename(nome))[0]
+    etag = f'"{sha256}"' if SHA256_HEX.match(sha256) else None
+    nao_modificado = get_conditional_response(request, etag=etag)
+    if nao_modificado is not None:
+        nao_modificado["Cache-Control"] = NOTA_FISCAL_CACHE
+        return nao_modificado
+
+    tipo = mimetypes.guess_type(nome)[0] or "application/octet-stream"
+    disposicao = "inline; filename*=UTF-8''%s" % quote(os.path.basename(nome))
+    envio = settings.NOTA_FISCAL_ENVIO
+    if envio:
+        resposta = HttpResponse(content_type=tipo)
+        if envio == "x-accel-redirect":
+            resposta["X-Accel-Redirect"] = settings.NOTA_FISCAL_PREFIXO_INTERNO + quote(nome)
+        else:
+            resposta["X-Sendfile"] = reagente.nota_fiscal.path
+        resposta["Content-Disposition"] = disposicao
+        _cabecalhos_cache_nota(resposta, etag)
+        return resposta
+
+    arquivo = reagente.nota_fiscal.open("rb")
+    tamanho = reagente.nota_fiscal.size
+    intervalo = _intervalo_bytes(request.headers.get("Range", ""), tamanho)
+    if intervalo is False:
+        arquivo.close()
+        resposta = HttpResponse(status=416)
+        resposta["Content-Range"] = f"bytes */{tamanho}"
+        return resposta
+    if intervalo is None:
+        resposta = FileResponse(arquivo, content_type=tipo)
+    else:
+        inicio, fim = intervalo
+        resposta = StreamingHttpResponse(_ler_trecho(arquivo, inicio, fim), status=206, content_type=tipo)
+        resposta["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+        resposta["Content-Length"] = str(fim - inicio + 1)
+    resposta["Accept-Ranges"] = "bytes"
+    resposta["Content-Disposition"] = disposicao
+    _cabecalhos_cache_nota(resposta, etag)
+    return resposta
+
+
+def _dados_painel(perfil):
+    """Contagens do painel por coordenacao em duas consultas agrupadas, mais uma para os totais distintos."""
+    today = timezone.localdate()
+    limite = today + timedelta(days=settings.PAINEL_DIAS_VENCIMENTO)
+    inicio_saidas = timezone.now() - timedelta(days=30)
+
+    # Estoque so de reagentes ativos, como home/saida/matriz; as saidas ja
+    # aconteceram e contam mesmo que o reagente tenha sido desativado depois.
+    lotes = Lote.objects.filter(quantidade__gt=0, reagente__ativo=True)
+    saidas = SaidaReagente.objects.filter(data_saida__gte=inicio_saidas)
+    if perfil.tipo == "coord":
+        lotes = lotes.filter(coordenacao_id=perfil.coordenacao_id)
+        saidas = saidas.filter(coordenacao_id=perfil.coordenacao_id)
+
+    distintos = {
+        "reagentes": Count("reagente", distinct=True),
+        "vencidos": Count("reagente", distinct=True, filter=Q(validade__lt=today)),
+        "proximos_vencimento": Count(
+            "reagente", distinct=True, filter=Q(validade__gte=today, validade__lte=limite)
+        ),
+    }
+    estoque = lotes.values("coordenacao_id", "coordenacao__nome").annotate(
+        **distintos,
+        unidades=Sum("quantidade"),
+        unidades_vencidas=Sum("quantidade", filter=Q(validade__lt=today), default=0),
+    )
+    retiradas = saidas.values("coordenacao_id", "coordenacao__nome").annotate(
+        saidas_30_dias=Count("pk"), unidades_30_dias=Sum("quantidade")
+    )
+
+    campos = ("reagentes", "vencidos", "proximos_vencimento", "unidades", "unidades_vencidas",
+              "saidas_30_dias", "unidades_30_dias")
+    linhas = {}
+    for row in list(estoque) + list(retiradas):
+        linha = linhas.setdefault(
+            row["coordenacao_id"],
+            {
+                "coordenacao_id": row["coordenacao_id"],
+                "coordenacao": row["coordenacao__nome"],
+                **dict.fromkeys(campos, 0),
+            },
+        )
+        linha.update((campo, row[campo]) for campo in campos if campo in row)
+
+    coordenacoes = sorted(linhas.values(), key=lambda linha: normalizar_texto(linha["coordenacao"]))
+    totais = {campo: sum(linha[campo] for linha in coordenacoes) for campo in campos}
+    # O mesmo reagente em duas coordenacoes conta uma vez no total.
+    totais.update(lotes.aggregate(**distintos))
+    return {
+        "gerado_em": timezone.now().isoformat(),
+        "dias_vencimento": settings.PAINEL_DIAS_VENCIMENTO,
+        "coordenacoes": coordenacoes,
+        "totais": totais,
+    }
+
+
+def _painel_em_cache(perfil):
+    chave = f"painel:{perfil.tipo}:{perfil.coordenacao_id}:{versao_dados()}"
+    return cache.get_or_set(chave, lambda: _dados_painel(perfil), settings.PAINEL_CACHE_TTL)
+
+
+@login_required(login_url="login")
+@leitura_replica
+def painel(request):
+    dados = _painel_em_cache(get_perfil(request.user))
+    return render(request, "painel.html", {"painel": dados})
+
+
+@login_required(login_url="login")
+@leitura_replica
+def painel_json(request):
+    return JsonResponse(_painel_em_cache(get_perfil(request.user)))
+
+
+@login_required(login_url="login")
+def estatisticas_busca(request):
     perfil = get_perfil(request.user)
     if perfil.tipo != "admin":
         raise PermissionDenied("Sem permissao.")
-    return render(request, "relatorio.html")
+    return JsonResponse(cache_busca.estatisticas())